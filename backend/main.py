@@ -4,36 +4,62 @@ FastAPI Backend for RAG Chatbot
 Handles file uploads, document processing, and chat API
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager, nullcontext
 import uvicorn
 import os
-import shutil
 import asyncio
+import contextvars
+import threading
 from pathlib import Path
 import json
 from typing import List, Optional
 import sys
 import time
 import pickle
+import secrets
 
 
 # Add the rag_chatbot module to the path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from rag_chatbot.ingestion import load_documents
+from rag_chatbot.ingestion import load_documents, load_document, load_pdf, document_paths
 from rag_chatbot.preprocessing import preprocess_documents
-from rag_chatbot.embeddings import create_embeddings
-from rag_chatbot.retrieval import retrieve
-from rag_chatbot.chatbot import generate_answer
+from rag_chatbot.embeddings import create_embeddings, get_model
+from rag_chatbot.retrieval import (
+    retrieve, load_index, index_size, embed_query, index_generation,
+    delete_file_chunks, update_files, indexed_files, merge_segments, compact_index, live_records
+)
+from rag_chatbot.chatbot import generate_answer_with_provider
+from rag_chatbot import metrics
+from rag_chatbot import tracing
+from rag_chatbot import extractive
+from rag_chatbot import semantic_cache
+from rag_chatbot import shared_index
+from rag_chatbot import segments
+from rag_chatbot import llm_scheduler
+from rag_chatbot import query_log
+from rag_chatbot import relevance
+from rag_chatbot.batch import answer_many, BATCH_CONCURRENCY, BATCH_MAX_QUESTIONS
 from s3_storage import s3_storage
+from ws_hub import ConnectionHub
+from upload_stream import receive_pdf_uploads
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the port immediately and warm up models/index in the background"""
+    loop = asyncio.get_running_loop()
+    loop.run_in_executor(None, _warm_up)
+    yield
 
 app = FastAPI(
     title="RAG Chatbot API",
     description="AI-powered document querying system",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 origins = ["https://edu-rag-retrieval-augmented-educati.vercel.app"]
@@ -82,9 +108,66 @@ def _needs_reindex() -> bool:
         emb_mtime = EMBEDDINGS_FILE.stat().st_mtime
     except Exception:
         return True
+    # Later indexing runs are recorded as segments
+    emb_mtime = max(emb_mtime, segments.manifest_mtime(str(EMBEDDINGS_FILE)))
     return _latest_pdf_mtime() > emb_mtime
 
-def _reindex_documents() -> None:
+# Lock order, everywhere: _maintenance_lock -> writer lock -> _reindex_lock
+# (-> the locks inside retrieval). Never call _after_index_change while
+# holding the writer lock or _reindex_lock.
+
+# Serialises rebuilds triggered from warm-up, /chat, /upload and deletes
+_reindex_lock = threading.Lock()
+
+def _writer_lock():
+    """Cross-worker writer lock in shared-index mode (always taken before
+    ``_reindex_lock``, after ``_maintenance_lock``); a no-op for a single worker"""
+    if shared_index.RAG_SHARED_INDEX:
+        return shared_index.writer_lock(str(EMBEDDINGS_DIR))
+    return nullcontext()
+
+def _reindex_documents(trigger: str = "auto", profile: Optional[bool] = None) -> None:
+    """Bring embeddings in line with data/; ``profile`` forces the indexing profiler"""
+    with _writer_lock(), _reindex_lock:
+        if trigger in ("startup", "chat") and not _needs_reindex():
+            # Another worker rebuilt while we waited; just map its result
+            load_index(str(EMBEDDINGS_FILE))
+            return
+        start = time.perf_counter()
+        try:
+            with tracing.profile("reindex", enable=profile, trigger=trigger):
+                if not _update_embeddings():
+                    _rebuild_embeddings()
+        finally:
+            metrics.registry.observe(
+                "rag_reindex_duration_seconds", time.perf_counter() - start,
+                help_text="Duration of document reindexing runs"
+            )
+
+def _update_embeddings() -> bool:
+    """Index only what changed in data/ since the last run, as one segment.
+
+    Files that are new or modified since the index was written are
+    re-chunked (unchanged chunks are not re-embedded) and files that
+    disappeared are deleted. Returns False when there is no index to update.
+    """
+    if not EMBEDDINGS_FILE.exists():
+        return False
+    indexed = indexed_files()
+    if indexed is None:
+        return False
+    since = max(EMBEDDINGS_FILE.stat().st_mtime, segments.manifest_mtime(str(EMBEDDINGS_FILE)))
+    paths = document_paths()
+    replacements = {}
+    for path in paths:
+        name = os.path.basename(path)
+        if name not in indexed or os.path.getmtime(path) > since:
+            doc = load_document(path)
+            replacements[name] = [chunk["chunk"] for chunk in preprocess_documents([doc])]
+    deletions = sorted(indexed - {os.path.basename(path) for path in paths})
+    return update_files(replacements, deletions, str(EMBEDDINGS_FILE)) is not None
+
+def _rebuild_embeddings() -> None:
     docs = load_documents()
     if not docs:
         # If no docs, remove embeddings file if present
@@ -93,66 +176,194 @@ def _reindex_documents() -> None:
                 EMBEDDINGS_FILE.unlink()
             except Exception:
                 pass
+        load_index(str(EMBEDDINGS_FILE))
         return
     chunks = preprocess_documents(docs)
     create_embeddings(chunks)
+    # Swap the freshly written embeddings into the live FAISS index
+    load_index(str(EMBEDDINGS_FILE))
+
+def _index_uploads(filenames: List[str], profile: Optional[bool] = None) -> None:
+    """Index uploaded files as one new segment: only their changed chunks
+    are embedded.
+
+    Falls back to a full rebuild when there is no snapshot yet.
+    """
+    if not EMBEDDINGS_FILE.exists():
+        _reindex_documents("upload", profile)
+        return
+    with _writer_lock(), _reindex_lock:
+        with tracing.profile("index_uploads", enable=profile, files=len(filenames)):
+            replacements = {}
+            for filename in filenames:
+                doc = load_pdf(str(DATA_DIR / filename))
+                replacements[filename] = [chunk["chunk"] for chunk in preprocess_documents([doc])]
+            if update_files(replacements, path=str(EMBEDDINGS_FILE)) is None:
+                _rebuild_embeddings()
+
+# One background maintenance run at a time (merge/compaction + S3 backup);
+# taken before the writer lock, which compaction and merging acquire
+_maintenance_lock = threading.Lock()
+
+def _after_index_change(uploaded: List[str] = (), deleted: List[str] = ()) -> None:
+    """Background follow-up to a segment write: fold segments into the
+    snapshot once they pass INDEX_COMPACT_RATIO, otherwise merge small ones
+    past INDEX_MAX_SEGMENTS, then mirror files and the live snapshot to S3"""
+    with _maintenance_lock:
+        try:
+            if not compact_index(str(EMBEDDINGS_FILE)):
+                merge_segments(str(EMBEDDINGS_FILE))
+            if s3_storage.s3_client is None:
+                return
+            for filename in uploaded:
+                s3_storage.upload_file(str(DATA_DIR / filename), f"data/course_notes/{filename}")
+            for filename in deleted:
+                s3_storage.delete_file(f"data/course_notes/{filename}")
+            s3_storage.save_embeddings(live_records(str(EMBEDDINGS_FILE)))
+        except Exception as e:
+            print(f"Index maintenance failed: {e}")
+
+# ------- Startup warm-up and readiness -------
+# Stages are reached in order; the app is ready to serve /chat once the
+# index is loaded. "in_sync" additionally means S3 sync and reindex finished.
+STARTUP_STAGES = ["starting", "model_loaded", "index_loaded", "in_sync"]
+READY_STAGE = "index_loaded"
+
+class StartupState:
+    def __init__(self):
+        self.started_at = time.time()
+        self.stage = "starting"
+        self.phase_timings = {}
+        self.error = None
+        self._lock = threading.Lock()
+
+    def advance(self, stage: str):
+        with self._lock:
+            if STARTUP_STAGES.index(stage) > STARTUP_STAGES.index(self.stage):
+                self.stage = stage
+
+    def record_phase(self, name: str, seconds: float):
+        with self._lock:
+            self.phase_timings[name] = round(seconds, 3)
+        print(f"Startup phase '{name}' took {seconds:.2f}s")
+
+    def reached(self, stage: str) -> bool:
+        return STARTUP_STAGES.index(self.stage) >= STARTUP_STAGES.index(stage)
+
+    @property
+    def ready(self) -> bool:
+        return self.reached(READY_STAGE)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "stage": self.stage,
+                "ready": self.ready,
+                "in_sync": self.reached("in_sync"),
+                "uptime_seconds": round(time.time() - self.started_at, 3),
+                "phase_timings": dict(self.phase_timings),
+                "error": self.error
+            }
 
-# Initialize S3 storage and sync on startup
-def _initialize_storage():
-    """Initialize storage and sync from S3 if available"""
+startup_state = StartupState()
+
+def _timed_phase(name: str, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        startup_state.record_phase(name, time.perf_counter() - start)
+
+def _sync_storage():
+    """Sync from S3 if available and rebuild embeddings when they are stale"""
+    # With several workers only one syncs at a time; the others then find
+    # the data current and just map the published index
+    with _writer_lock():
+        reindexed = _sync_storage_locked()
+    # Maintenance takes _maintenance_lock and then the writer lock itself,
+    # so it must run after the writer lock is released
+    if reindexed and EMBEDDINGS_FILE.exists():
+        # Fold in or merge the new segment, then save the live snapshot to S3
+        _timed_phase("s3_save_embeddings", _after_index_change)
+
+def _sync_storage_locked() -> bool:
+    """S3 sync and reindex under the writer lock; True when it reindexed"""
     try:
         # Sync S3 to local on startup
-        s3_storage.sync_s3_to_local("data", "data")
+        _timed_phase("s3_sync", s3_storage.sync_s3_to_local, "data", "data")
         
         # Load embeddings from S3 if available
-        embeddings_data = s3_storage.load_embeddings()
+        embeddings_data = _timed_phase("s3_load_embeddings", s3_storage.load_embeddings)
         if embeddings_data:
             # Save to local for immediate use
             with open(EMBEDDINGS_FILE, 'wb') as f:
                 pickle.dump(embeddings_data, f)
+            load_index(str(EMBEDDINGS_FILE))
             print("Loaded embeddings from S3")
         
         # Run auto-detect after sync
         if _needs_reindex():
-            _reindex_documents()
-            # Save new embeddings to S3
-            if EMBEDDINGS_FILE.exists():
-                with open(EMBEDDINGS_FILE, 'rb') as f:
-                    embeddings_data = pickle.load(f)
-                s3_storage.save_embeddings(embeddings_data)
-                print("Saved embeddings to S3")
+            _timed_phase("reindex", _reindex_documents, "startup")
+            return True
     except Exception as e:
         print(f"Storage initialization failed: {e}")
         # Fallback to local-only mode
         try:
             if _needs_reindex():
-                _reindex_documents()
+                _timed_phase("reindex", _reindex_documents, "startup")
         except Exception:
             pass
+    return False
 
-# Run initialization on startup
-_initialize_storage()
-
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+def _warm_up():
+    """Background warm-up: model, then local index, then S3 sync/reindex"""
+    try:
+        _timed_phase("model_load", get_model)
+        _timed_phase("extractive_warm_up", extractive.warm_up)
+        startup_state.advance("model_loaded")
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+        # Serve from whatever is on local disk first; S3 sync may replace it.
+        # Without a local index we stay unready until the sync/reindex below.
+        _timed_phase("index_load", load_index, str(EMBEDDINGS_FILE))
+        if EMBEDDINGS_FILE.exists():
+            startup_state.advance("index_loaded")
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+        _sync_storage()
+        startup_state.advance("in_sync")
+        if query_log.QUERY_LOG_WARM_TOP > 0 and EMBEDDINGS_FILE.exists():
+            _timed_phase("cache_warm_up", _warm_caches)
+        startup_state.record_phase("total", time.time() - startup_state.started_at)
+    except Exception as e:
+        startup_state.error = str(e)
+        print(f"Startup warm-up failed: {e}")
+
+def _warm_caches():
+    """Re-run the most frequent logged queries so their answers are cached
+    (and the model and index pages are hot) before real traffic arrives"""
+    queries = query_log.top_queries(query_log.QUERY_LOG_WARM_TOP)
+    warmed = 0
+    for query in queries:
+        try:
+            if semantic_cache.SEMANTIC_CACHE:
+                _answer_chat(query, llm_scheduler.PRIORITY_BACKGROUND)
+            else:
+                retrieve(query, top_k=3)
+            warmed += 1
+        except Exception as e:
+            print(f"Cache warm-up stopped at '{query[:60]}': {e}")
+            break
+    print(f"Warmed caches with {warmed} of {len(queries)} top logged queries")
+
+def _not_ready_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service is warming up, please retry shortly", **startup_state.to_dict()},
+        headers={"Retry-After": "5"}
+    )
 
-manager = ConnectionManager()
+# WebSocket connection manager
+# Per-connection send queues so one slow client never stalls the others
+manager = ConnectionHub()
 
 @app.get("/")
 async def root():
@@ -161,69 +372,75 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint with on-demand reindex if needed.
+    """Liveness check that answers immediately, plus warm-up progress.
 
     Returns fields in both snake_case and camelCase to match the frontend.
     """
-    try:
-        if _needs_reindex():
-            _reindex_documents()
-    except Exception:
-        # ignore in health response
-        pass
-    ready = EMBEDDINGS_FILE.exists()
+    ready = startup_state.ready and index_size() > 0
     # Provide both naming styles for compatibility
     return {
         "status": "healthy",
         "healthy": True,
         "embeddings_ready": ready,
         "embeddingsReady": ready,
+        "startup": startup_state.to_dict(),
         "message": "Backend is running successfully"
     }
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process is up and the event loop is responsive"""
+    return {"status": "alive", "uptime_seconds": round(time.time() - startup_state.started_at, 3)}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: 200 once the model and index are loaded, 503 before"""
+    if not startup_state.ready:
+        return _not_ready_response()
+    return {"status": "ready", "index_size": index_size(), **startup_state.to_dict()}
+
 @app.get("/")
 async def root():
     """Root endpoint"""
     return {"message": "RAG Chatbot API is running", "status": "ok"}
 
 @app.post("/upload")
-async def upload_files(files: List[UploadFile] = File(...)):
-    """Upload PDF files for processing"""
-    if not files:
+async def upload_files(request: Request):
+    """Upload PDF files for processing.
+
+    The multipart body is streamed to disk (see upload_stream); files whose
+    content is already in the corpus are skipped without reindexing.
+    """
+    saved, skipped = await receive_pdf_uploads(request, DATA_DIR)
+    uploaded_files = [item["filename"] for item in saved]
+    skipped_files = [{"file": item["filename"], "duplicate_of": item["duplicate_of"]} for item in skipped]
+    
+    if not saved and not skipped:
         raise HTTPException(status_code=400, detail="No files uploaded")
     
-    uploaded_files = []
-    processed_files = []
+    if not saved:
+        return {
+            "message": f"All {len(skipped)} files are already uploaded; nothing to process",
+            "uploaded_files": [],
+            "skipped_files": skipped_files,
+            "processed_files": [],
+            "embeddings_created": False
+        }
     
     try:
-        # Save uploaded files
-        for file in files:
-            if not file.filename.lower().endswith('.pdf'):
-                raise HTTPException(status_code=400, detail=f"Only PDF files are allowed. Got: {file.filename}")
-            
-            file_path = DATA_DIR / file.filename
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            uploaded_files.append(file.filename)
-        
         # Process documents and create embeddings
         await manager.broadcast(json.dumps({
             "type": "processing_start",
             "message": "Processing uploaded documents..."
         }))
         
-        # Load and process documents
-        docs = load_documents()
-        chunks = preprocess_documents(docs)
-        create_embeddings(chunks)
+        # Embed only the new files' changed chunks (X-Debug-Profile: 1 profiles this run)
+        profile = request.headers.get("x-debug-profile", "").lower() in ("1", "true", "yes")
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _index_uploads, uploaded_files, profile or None)
         
-        # Sync to S3 after processing
-        s3_storage.sync_local_to_s3("data", "data")
-        if EMBEDDINGS_FILE.exists():
-            with open(EMBEDDINGS_FILE, 'rb') as f:
-                embeddings_data = pickle.load(f)
-            s3_storage.save_embeddings(embeddings_data)
+        # Compaction and the S3 backup run in the background
+        loop.run_in_executor(None, _after_index_change, uploaded_files, [])
         
         processed_files = [f for f in uploaded_files]
         
@@ -236,65 +453,273 @@ async def upload_files(files: List[UploadFile] = File(...)):
         return {
             "message": f"Successfully uploaded and processed {len(processed_files)} files",
             "uploaded_files": uploaded_files,
+            "skipped_files": skipped_files,
             "processed_files": processed_files,
             "embeddings_created": True
         }
         
     except Exception as e:
-        # Clean up uploaded files on error
+        # Clean up uploaded files (and any chunks already indexed) on error
         for filename in uploaded_files:
             file_path = DATA_DIR / filename
             if file_path.exists():
-                file_path.unlink()
+                try:
+                    _delete_document(file_path)
+                except Exception as cleanup_error:
+                    print(f"Cleanup of {filename} failed: {cleanup_error}")
         
         raise HTTPException(status_code=500, detail=f"Error processing files: {str(e)}")
 
+# ------- Request metrics helpers -------
+def _wants_timings(payload: dict, request: Optional[Request] = None) -> bool:
+    """Clients opt in to a per-request stage breakdown via body flag or header"""
+    if payload.get("include_timings"):
+        return True
+    return request is not None and request.headers.get("x-include-timings", "").lower() in ("1", "true", "yes")
+
+def _wants_trace(payload: dict, request: Optional[Request] = None) -> bool:
+    """Clients opt in to a debug trace via body flag or X-Debug-Trace header"""
+    if payload.get("debug_trace"):
+        return True
+    return request is not None and request.headers.get("x-debug-trace", "").lower() in ("1", "true", "yes")
+
+def _with_timings(payload: dict, timings: dict, started: float, include: bool) -> dict:
+    if include:
+        payload["timings"] = {
+            **metrics.timings_ms(timings),
+            "total": round((time.perf_counter() - started) * 1000.0, 3)
+        }
+    return payload
+
+def _record_request(endpoint: str, status: str, started: float) -> None:
+    metrics.registry.observe(
+        "rag_request_duration_seconds", time.perf_counter() - started,
+        help_text="End-to-end query handling time", endpoint=endpoint
+    )
+    metrics.registry.inc(
+        "rag_requests_total", help_text="Queries handled by endpoint and outcome",
+        endpoint=endpoint, status=status
+    )
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: stage latencies, providers, fallbacks, index and memory"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# ------- Admin: trace and profile downloads -------
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def _require_admin(request: Request) -> None:
+    """Admin endpoints are disabled unless ADMIN_TOKEN is set and matches"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    # Constant-time, so response timing does not leak the token; bytes so a
+    # non-ASCII header is rejected instead of raising TypeError
+    supplied = request.headers.get("x-admin-token", "")
+    if not secrets.compare_digest(supplied.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/traces")
+async def admin_traces(request: Request, limit: int = 0, download: bool = False):
+    """Recent request traces from the ring buffer (newest last)"""
+    _require_admin(request)
+    traces = tracing.recent_traces(limit or None)
+    if download:
+        body = "".join(json.dumps(trace) + "\n" for trace in traces)
+        return PlainTextResponse(body, media_type="application/x-ndjson", headers={
+            "Content-Disposition": f"attachment; filename=traces-{int(time.time())}.jsonl"
+        })
+    return {"count": len(traces), "traces": traces}
+
+@app.delete("/admin/traces")
+async def admin_clear_traces(request: Request):
+    _require_admin(request)
+    tracing.clear_traces()
+    return {"message": "Trace buffer cleared"}
+
+@app.get("/admin/profiles")
+async def admin_profiles(request: Request, limit: int = 0):
+    """Recent indexing profiles (summaries; fetch one by id for the report)"""
+    _require_admin(request)
+    profiles = [
+        {k: v for k, v in record.items() if k != "report"}
+        for record in tracing.recent_profiles(limit or None)
+    ]
+    return {"count": len(profiles), "profiles": profiles}
+
+@app.get("/admin/profiles/{profile_id}")
+async def admin_profile(profile_id: int, request: Request):
+    _require_admin(request)
+    record = tracing.get_profile(profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(record["report"], headers={
+        "Content-Disposition": f"attachment; filename=profile-{profile_id}-{record['name']}.txt"
+    })
+
 @app.post("/chat")
-async def chat_endpoint(message: dict):
+async def chat_endpoint(message: dict, request: Request):
     """Chat endpoint for querying documents"""
     query = message.get("message", "").strip()
     
     if not query:
         raise HTTPException(status_code=400, detail="Message cannot be empty")
     
+    if not startup_state.ready:
+        return _not_ready_response()
+    
+    started = time.perf_counter()
+    timings = metrics.start_request()
+    query_log.start()
+    include_timings = _wants_timings(message, request)
+    status = "error"
+    trace_enabled = tracing.enabled(_wants_trace(message, request))
     try:
-        # Ensure embeddings are current
-        if _needs_reindex():
-            _reindex_documents()
-
-        # Check if embeddings exist
-        if not EMBEDDINGS_FILE.exists():
-            raise HTTPException(status_code=400, detail="No documents processed yet. Please upload files first.")
-        
-        # Retrieve relevant chunks
-        results = retrieve(query, top_k=3)
-        
-        if not results:
-            return {
-                "answer": "I couldn't find relevant information in the uploaded documents.",
-                "sources": [],
-                "status": "no_results"
-            }
-        
-        # Generate answer
-        answer = generate_answer(results, query)
-        
-        # Prepare sources
-        sources = []
-        for result in results:
-            sources.append({
-                "file": result["file"],
-                "chunk": result["chunk"][:200] + "..." if len(result["chunk"]) > 200 else result["chunk"]
-            })
-        
-        return {
-            "answer": answer,
-            "sources": sources,
-            "status": "success"
-        }
+        with tracing.trace("chat", enable=trace_enabled, query=query[:200]) as trace:
+            response = await _in_thread(_answer_chat, query)
+            status = response["status"]
+            if trace is not None:
+                trace.attrs["status"] = status
+                response["trace_id"] = trace.id
+        return _with_timings(response, timings, started, include_timings)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+    finally:
+        _record_request("chat", status, started)
+        query_log.write("chat", query, status, timings, time.perf_counter() - started)
+
+def _int_field(payload: dict, name: str, default: int) -> int:
+    """Integer request field; a 400 (not a 500) for anything else"""
+    value = payload.get(name, default)
+    if isinstance(value, bool):
+        raise HTTPException(status_code=400, detail=f"{name} must be an integer")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{name} must be an integer")
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(payload: dict):
+    """Answer a list of questions, streamed back as JSONL in completion order.
+
+    Body: {"questions": [...], "top_k": 3, "concurrency": 4}. Each line has
+    the question's ``index`` in the request.
+    """
+    questions = payload.get("questions")
+    if not isinstance(questions, list):
+        raise HTTPException(status_code=400, detail="questions must be a non-empty list")
+    questions = [str(q).strip() for q in questions if str(q).strip()]
+    if not questions:
+        raise HTTPException(status_code=400, detail="questions must be a non-empty list")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    top_k = max(1, min(_int_field(payload, "top_k", 3), 20))
+    concurrency = max(1, min(_int_field(payload, "concurrency", BATCH_CONCURRENCY), BATCH_CONCURRENCY))
+    
+    if not startup_state.ready:
+        return _not_ready_response()
+    
+    if not EMBEDDINGS_FILE.exists():
+        raise HTTPException(status_code=400, detail="No documents processed yet. Please upload files first.")
+    
+    def stream():
+        # Runs in Starlette's threadpool, so blocking work is fine here
+        started = time.perf_counter()
+        status = "error"
+        try:
+            if _needs_reindex():
+                _reindex_documents("chat")
+            for result in answer_many(questions, top_k=top_k, concurrency=concurrency):
+                yield json.dumps(result) + "\n"
+            status = "success"
+        finally:
+            _record_request("batch", status, started)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+async def _in_thread(func, *args):
+    """Run blocking work (retrieval, LLM admission and calls) off the event
+    loop, keeping the request's timings, trace and query log visible"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, context.run, func, *args)
+
+def _lookup_and_retrieve(query: str, endpoint: str):
+    """Embed one query, check the semantic cache, then retrieve and gate.
+
+    Blocking (the model, the index and a lazy load or shared refresh), so
+    async callers run it through ``_in_thread``. Returns ``(query_vector,
+    cached_response, results, relevance_outcome, generation)``; pass
+    ``generation`` to ``semantic_cache.store``.
+    """
+    # Read before retrieving, so an answer built from an index that changes
+    # meanwhile is not cached under the new one
+    generation = index_generation()
+    # Paraphrases of a recent question reuse its answer
+    query_vector = embed_query(query)
+    cached = semantic_cache.lookup(query_vector)
+    if cached is not None:
+        query_log.note(cached=True)
+        return query_vector, cached, [], None, generation
+    
+    # Retrieve relevant chunks
+    results = retrieve(query, top_k=3, query_vector=query_vector)
+    query_log.note(results=results)
+    
+    # Off-topic questions skip the LLM; marginal ones send only the chunks that clear the bar
+    results, relevance_outcome = relevance.gate(results, endpoint)
+    query_log.note(relevance=relevance_outcome)
+    return query_vector, None, results, relevance_outcome, generation
+
+def _answer_chat(query: str, priority: int = llm_scheduler.PRIORITY_INTERACTIVE) -> dict:
+    """Retrieve and answer one /chat query"""
+    # Ensure embeddings are current
+    if _needs_reindex():
+        _reindex_documents("chat")
+
+    # Check if embeddings exist
+    if not EMBEDDINGS_FILE.exists():
+        raise HTTPException(status_code=400, detail="No documents processed yet. Please upload files first.")
+    
+    query_vector, cached, results, relevance_outcome, generation = _lookup_and_retrieve(query, "chat")
+    if cached is not None:
+        return dict(cached, cached=True)
+    if relevance_outcome == "skipped":
+        return {"answer": relevance.NO_MATCH_ANSWER, "sources": [], "status": "no_match"}
+    
+    if not results:
+        return {
+            "answer": "I couldn't find relevant information in the uploaded documents.",
+            "sources": [],
+            "status": "no_results"
+        }
+    
+    # Generate answer
+    answer, provider = generate_answer_with_provider(results, query, priority=priority)
+    
+    response = {
+        "answer": answer,
+        "sources": _format_sources(results),
+        "status": "success"
+    }
+    # Shed or failed-over answers are degraded; let the next paraphrase retry the LLM
+    if provider != "fallback":
+        semantic_cache.store(query, query_vector, response, generation)
+    return response
+
+def _format_sources(results):
+    """Source list for a response, with chunks trimmed to 200 characters"""
+    sources = []
+    for result in results:
+        sources.append({
+            "file": result["file"],
+            "chunk": result["chunk"][:200] + "..." if len(result["chunk"]) > 200 else result["chunk"],
+            "score": round(result["score"], 3)
+        })
+    return sources
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -302,9 +727,15 @@ async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            # Receive message from client
-            data = await websocket.receive_text()
+            # Receive message from client. The hub may have closed the socket
+            # (slow consumer), after which receiving raises RuntimeError.
+            try:
+                data = await websocket.receive_text()
+            except RuntimeError:
+                break
             message_data = json.loads(data)
+            if message_data.get("type") == "pong":
+                continue
             
             query = message_data.get("message", "").strip()
             
@@ -321,62 +752,103 @@ async def websocket_endpoint(websocket: WebSocket):
                 "message": "Searching documents..."
             }), websocket)
             
-            try:
-                # Check if embeddings exist
-                if not Path("embeddings/vector_index.pkl").exists():
-                    await manager.send_personal_message(json.dumps({
-                        "type": "error",
-                        "message": "No documents processed yet. Please upload files first."
-                    }), websocket)
-                    continue
-                
-                # Retrieve relevant chunks
-                results = retrieve(query, top_k=3)
-                
-                if not results:
-                    await manager.send_personal_message(json.dumps({
-                        "type": "response",
-                        "answer": "I couldn't find relevant information in the uploaded documents.",
-                        "sources": []
-                    }), websocket)
-                    continue
-                
-                # Send sources
-                sources = []
-                for result in results:
-                    sources.append({
-                        "file": result["file"],
-                        "chunk": result["chunk"][:200] + "..." if len(result["chunk"]) > 200 else result["chunk"]
-                    })
-                
-                await manager.send_personal_message(json.dumps({
-                    "type": "sources",
-                    "sources": sources
-                }), websocket)
-                
-                # Generate and send answer
-                await manager.send_personal_message(json.dumps({
-                    "type": "generating",
-                    "message": "Generating answer..."
-                }), websocket)
-                
-                answer = generate_answer(results, query)
-                
+            if not startup_state.ready:
                 await manager.send_personal_message(json.dumps({
-                    "type": "response",
-                    "answer": answer,
-                    "sources": sources
+                    "type": "error",
+                    "message": "Service is warming up, please retry shortly"
                 }), websocket)
+                continue
+            
+            started = time.perf_counter()
+            timings = metrics.start_request()
+            query_log.start()
+            include_timings = _wants_timings(message_data)
+            trace_enabled = tracing.enabled(_wants_trace(message_data))
+            status = "error"
+            try:
+                with tracing.trace("ws", enable=trace_enabled, query=query[:200]) as trace:
+                    status, response = await _answer_ws(query, websocket)
+                    if trace is not None:
+                        trace.attrs["status"] = status
+                        response["trace_id"] = trace.id
+                if response["type"] == "response":
+                    response = _with_timings(response, timings, started, include_timings)
+                await manager.send_personal_message(json.dumps(response), websocket)
                 
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 await manager.send_personal_message(json.dumps({
                     "type": "error",
                     "message": f"Error processing query: {str(e)}"
                 }), websocket)
+            finally:
+                _record_request("ws", status, started)
+                query_log.write("ws", query, status, timings, time.perf_counter() - started)
                 
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
+async def _answer_ws(query: str, websocket: WebSocket):
+    """Retrieve and answer one /ws query, streaming progress frames.
+
+    Returns the outcome status and the final frame for the caller to send.
+    """
+    # Check if embeddings exist
+    if not Path("embeddings/vector_index.pkl").exists():
+        return "error", {
+            "type": "error",
+            "message": "No documents processed yet. Please upload files first."
+        }
+    
+    # Off the event loop, so other sockets and HTTP requests keep flowing
+    query_vector, cached, results, relevance_outcome, generation = await _in_thread(
+        _lookup_and_retrieve, query, "ws")
+    if cached is not None:
+        return "success", {
+            "type": "response",
+            "answer": cached["answer"],
+            "sources": cached["sources"],
+            "cached": True
+        }
+    
+    if relevance_outcome == "skipped":
+        return "no_match", {"type": "response", "answer": relevance.NO_MATCH_ANSWER, "sources": []}
+    
+    if not results:
+        return "no_results", {
+            "type": "response",
+            "answer": "I couldn't find relevant information in the uploaded documents.",
+            "sources": []
+        }
+    
+    # Send sources
+    sources = _format_sources(results)
+    
+    await manager.send_personal_message(json.dumps({
+        "type": "sources",
+        "sources": sources
+    }), websocket)
+    
+    # Generate and send answer
+    await manager.send_personal_message(json.dumps({
+        "type": "generating",
+        "message": "Generating answer..."
+    }), websocket)
+    
+    answer, provider = await _in_thread(generate_answer_with_provider, results, query)
+    if provider != "fallback":
+        semantic_cache.store(query, query_vector, {"answer": answer, "sources": sources, "status": "success"},
+                             generation)
+    
+    return "success", {
+        "type": "response",
+        "answer": answer,
+        "sources": sources
+    }
+
 @app.get("/files")
 async def list_files():
     """List uploaded files"""
@@ -391,6 +863,14 @@ async def list_files():
     
     return {"files": files}
 
+def _delete_document(file_path: Path) -> int:
+    """Remove a PDF and tombstone its chunks (no reindex)"""
+    with _writer_lock(), _reindex_lock:
+        file_path.unlink()
+        if not EMBEDDINGS_FILE.exists():
+            return 0
+        return delete_file_chunks(file_path.name, str(EMBEDDINGS_FILE))
+
 @app.delete("/files/{filename}")
 async def delete_file(filename: str):
     """Delete a specific file"""
@@ -399,19 +879,13 @@ async def delete_file(filename: str):
         raise HTTPException(status_code=404, detail="File not found")
     
     try:
-        file_path.unlink()
+        loop = asyncio.get_running_loop()
+        removed = await loop.run_in_executor(None, _delete_document, file_path)
         
-        # Recreate embeddings after file deletion
-        _reindex_documents()
-        
-        # Sync to S3 after deletion
-        s3_storage.sync_local_to_s3("data", "data")
-        if EMBEDDINGS_FILE.exists():
-            with open(EMBEDDINGS_FILE, 'rb') as f:
-                embeddings_data = pickle.load(f)
-            s3_storage.save_embeddings(embeddings_data)
+        # Compaction and the S3 backup run in the background
+        loop.run_in_executor(None, _after_index_change, [], [filename])
         
-        return {"message": f"File {filename} deleted successfully"}
+        return {"message": f"File {filename} deleted successfully", "chunks_removed": removed}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting file: {str(e)}")
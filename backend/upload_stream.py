@@ -0,0 +1,229 @@
+"""
+Streaming PDF uploads.
+
+The multipart body is parsed incrementally straight from the request
+stream: each file part is hashed and written to a temporary file with
+async I/O as its bytes arrive, so limits are enforced mid-stream and a
+client disconnect leaves nothing behind. Files whose content is already in
+the corpus are skipped before any reprocessing, and a file name repeated
+within one request is rejected rather than silently overwriting.
+"""
+
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import aiofiles
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import ClientDisconnect
+
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "20"))
+UPLOAD_MAX_FILE_BYTES = int(float(os.getenv("UPLOAD_MAX_FILE_MB", "50")) * 1024 * 1024)
+UPLOAD_MAX_TOTAL_BYTES = int(float(os.getenv("UPLOAD_MAX_TOTAL_MB", "200")) * 1024 * 1024)
+
+_HASH_BLOCK = 1024 * 1024
+
+# path -> (mtime_ns, size, sha256) so the corpus is hashed once, not per upload
+_hash_cache: Dict[str, Tuple[int, int, str]] = {}
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _corpus_hashes_sync(directory: Path) -> Dict[str, str]:
+    hashes = {}
+    seen = set()
+    for path in directory.glob("*.pdf"):
+        key = str(path)
+        seen.add(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        cached = _hash_cache.get(key)
+        if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+            cached = (stat.st_mtime_ns, stat.st_size, _hash_file(path))
+            _hash_cache[key] = cached
+        hashes[cached[2]] = path.name
+    for key in set(_hash_cache) - seen:
+        del _hash_cache[key]
+    return hashes
+
+
+async def corpus_hashes(directory: Path) -> Dict[str, str]:
+    """Map of content sha256 -> file name for PDFs already in ``directory``"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _corpus_hashes_sync, directory)
+
+
+def _remember(path: Path, digest: str) -> None:
+    stat = path.stat()
+    _hash_cache[str(path)] = (stat.st_mtime_ns, stat.st_size, digest)
+
+
+def safe_pdf_name(filename: str) -> str:
+    """Strip any client-supplied directories and require a .pdf name"""
+    name = Path(filename.replace("\\", "/")).name.strip()
+    if not name or not name.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail=f"Only PDF files are allowed. Got: {filename}")
+    return name
+
+
+class _Part:
+    __slots__ = ("disposition", "name", "temp_path", "file", "hasher", "size")
+
+    def __init__(self):
+        self.disposition = b""
+        self.name = None
+        self.temp_path = None
+        self.file = None
+        self.hasher = None
+        self.size = 0
+
+
+async def receive_pdf_uploads(request: Request, dest_dir: Path) -> Tuple[List[dict], List[dict]]:
+    """Stream every file part of a multipart request into ``dest_dir``.
+
+    Returns ``(saved, skipped)``: saved files are moved into place only once
+    the whole body has arrived; skipped files were byte-identical to a file
+    already in the corpus (or earlier in the same request).
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > UPLOAD_MAX_TOTAL_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {_mb(UPLOAD_MAX_TOTAL_BYTES)}")
+
+    events = []
+    header = {"field": b"", "value": b""}
+    state = {"part": None}
+
+    def on_part_begin():
+        state["part"] = _Part()
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        if header["field"].lower() == b"content-disposition":
+            state["part"].disposition = header["value"]
+        header["field"] = header["value"] = b""
+
+    def on_headers_finished():
+        events.append(("start", state["part"], None))
+
+    def on_part_data(data, start, end):
+        events.append(("data", state["part"], data[start:end]))
+
+    def on_part_end():
+        events.append(("end", state["part"], None))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    completed = []
+    names = set()
+    temp_paths = []
+    total = 0
+    try:
+        async for chunk in request.stream():
+            total += len(chunk)
+            if total > UPLOAD_MAX_TOTAL_BYTES:
+                raise HTTPException(status_code=413,
+                                    detail=f"Upload exceeds {_mb(UPLOAD_MAX_TOTAL_BYTES)}")
+            parser.write(chunk)
+            for kind, part, data in events:
+                if kind == "start":
+                    _, options = parse_options_header(part.disposition)
+                    if b"filename" not in options:
+                        continue  # plain form field; ignored
+                    if len(completed) + 1 > UPLOAD_MAX_FILES:
+                        raise HTTPException(status_code=400,
+                                            detail=f"Too many files. Maximum is {UPLOAD_MAX_FILES} per upload")
+                    part.name = safe_pdf_name(options[b"filename"].decode("utf-8", "replace"))
+                    if part.name in names:
+                        raise HTTPException(status_code=400,
+                                            detail=f"{part.name} appears more than once in this upload")
+                    names.add(part.name)
+                    part.temp_path = dest_dir / f".{part.name}.{uuid.uuid4().hex}.part"
+                    temp_paths.append(part.temp_path)
+                    part.file = await aiofiles.open(part.temp_path, "wb")
+                    part.hasher = hashlib.sha256()
+                elif part.file is None:
+                    continue
+                elif kind == "data":
+                    part.size += len(data)
+                    if part.size > UPLOAD_MAX_FILE_BYTES:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"{part.name} exceeds {_mb(UPLOAD_MAX_FILE_BYTES)}"
+                        )
+                    part.hasher.update(data)
+                    await part.file.write(data)
+                else:
+                    await part.file.close()
+                    part.file = None
+                    completed.append({"filename": part.name, "temp_path": part.temp_path,
+                                      "sha256": part.hasher.hexdigest(), "size": part.size})
+            events.clear()
+        parser.finalize()
+    except BaseException as e:
+        # Disconnects, limit violations and cancellations all land here
+        for kind, part, _ in events:
+            if part.file is not None:
+                await part.file.close()
+        if state["part"] is not None and state["part"].file is not None:
+            await state["part"].file.close()
+        for path in temp_paths:
+            _unlink(path)
+        if isinstance(e, ClientDisconnect):
+            print(f"Upload aborted by client; removed {len(temp_paths)} partial file(s)")
+            raise HTTPException(status_code=400, detail="Client disconnected during upload")
+        raise
+
+    existing = await corpus_hashes(dest_dir)
+    saved, skipped = [], []
+    for item in completed:
+        duplicate_of = existing.get(item["sha256"])
+        temp_path = item.pop("temp_path")
+        if duplicate_of is not None:
+            _unlink(temp_path)
+            skipped.append(dict(item, duplicate_of=duplicate_of))
+            continue
+        final_path = dest_dir / item["filename"]
+        os.replace(temp_path, final_path)
+        _remember(final_path, item["sha256"])
+        existing[item["sha256"]] = item["filename"]
+        saved.append(item)
+    return saved, skipped
+
+
+def _mb(size: int) -> str:
+    return f"{size / (1024 * 1024):g} MB"
+
+
+def _unlink(path: Path) -> None:
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,122 @@
+"""
+WebSocket connection hub with per-connection send queues.
+
+Every connection gets a bounded outbound queue drained by its own writer
+task, so a broadcast only enqueues and never waits on a slow socket.
+Clients that fall behind lose broadcast frames and are disconnected after
+too many drops; heartbeats keep idle connections alive through proxies and
+flush out dead ones.
+"""
+
+import asyncio
+import json
+import os
+from typing import Dict
+
+from fastapi import WebSocket
+
+from rag_chatbot import metrics
+
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "32"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+WS_MAX_DROPPED = int(os.getenv("WS_MAX_DROPPED", "8"))
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "30"))
+
+_HEARTBEAT = json.dumps({"type": "ping"})
+
+
+class _Connection:
+    # Slots keep per-socket overhead flat when thousands are idle
+    __slots__ = ("websocket", "queue", "writer", "dropped")
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+        self.writer = None
+        self.dropped = 0
+
+
+class ConnectionHub:
+    def __init__(self):
+        self.connections: Dict[WebSocket, _Connection] = {}
+        self._heartbeat_task = None
+
+    @property
+    def active_connections(self):
+        return list(self.connections)
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        connection = _Connection(websocket)
+        connection.writer = asyncio.create_task(self._writer(connection))
+        self.connections[websocket] = connection
+        self._set_gauge()
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    def disconnect(self, websocket: WebSocket):
+        """Forget a connection; safe to call more than once"""
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        if connection.writer is not None and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+        self._set_gauge()
+
+    async def send_personal_message(self, message: str, websocket: WebSocket):
+        """Queue a reply, waiting briefly for room; stuck clients are dropped"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        try:
+            await asyncio.wait_for(connection.queue.put(message), WS_SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self._drop(connection, "send_timeout")
+
+    async def broadcast(self, message: str):
+        """Enqueue to every connection without awaiting any socket"""
+        for connection in list(self.connections.values()):
+            try:
+                connection.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                connection.dropped += 1
+                metrics.registry.inc("rag_ws_dropped_messages_total",
+                                     help_text="Broadcast frames dropped for slow WebSocket clients")
+                if connection.dropped >= WS_MAX_DROPPED:
+                    await self._drop(connection, "slow_consumer")
+
+    async def _writer(self, connection: _Connection):
+        websocket = connection.websocket
+        try:
+            while True:
+                message = await connection.queue.get()
+                await asyncio.wait_for(websocket.send_text(message), WS_SEND_TIMEOUT)
+                connection.dropped = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Closed or stalled socket; the receive loop sees the disconnect
+            await self._drop(connection, "send_failed")
+
+    async def _drop(self, connection: _Connection, reason: str):
+        if self.connections.get(connection.websocket) is not connection:
+            return
+        metrics.registry.inc("rag_ws_disconnects_total", help_text="WebSocket clients dropped by the server",
+                             reason=reason)
+        self.disconnect(connection.websocket)
+        try:
+            await asyncio.wait_for(connection.websocket.close(code=1013), WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    async def _heartbeat(self):
+        while self.connections:
+            await asyncio.sleep(WS_HEARTBEAT_INTERVAL)
+            for connection in list(self.connections.values()):
+                # A full queue already has traffic pending; no ping needed
+                if not connection.queue.full():
+                    connection.queue.put_nowait(_HEARTBEAT)
+
+    def _set_gauge(self):
+        metrics.registry.set_gauge("rag_ws_connections", len(self.connections),
+                                   help_text="Open WebSocket connections")
@@ -0,0 +1,6 @@
+"""
+Benchmark suite for the RAG chatbot.
+
+Run ``python -m benchmarks.run_benchmarks`` from the repository root and
+compare the JSON output with ``python -m benchmarks.compare``.
+"""
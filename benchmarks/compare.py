@@ -0,0 +1,94 @@
+"""
+Compare benchmark results against a stored baseline.
+
+Exits non-zero when any benchmark's median is slower than the baseline by
+more than its threshold, so it can gate CI. No baseline is checked in,
+since timings only mean something on the machine that produced them. Create
+one on the reference machine with ``--update-baseline``; until then the
+comparison exits with status 2.
+
+Usage:
+    python -m benchmarks.compare benchmarks/baseline.json results.json
+    python -m benchmarks.compare baseline.json results.json --threshold 0.1 \\
+        --override "retrieve[100000]=0.3"
+    python -m benchmarks.compare baseline.json results.json --update-baseline
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+
+
+def compare(baseline: dict, current: dict, threshold: float, overrides: dict, metric: str = "median"):
+    """Return a list of rows (name, base, current, change, limit, status)"""
+    rows = []
+    base_results = baseline.get("results", {})
+    for name, stats in current.get("results", {}).items():
+        if metric not in stats or name not in base_results or metric not in base_results[name]:
+            rows.append((name, None, stats.get(metric), None, None, "new"))
+            continue
+        base = base_results[name][metric]
+        value = stats[metric]
+        limit = overrides.get(name, threshold)
+        change = (value - base) / base if base else 0.0
+        status = "REGRESSION" if change > limit else ("improved" if change < -limit else "ok")
+        rows.append((name, base, value, change, limit, status))
+    for name in base_results:
+        if name not in current.get("results", {}):
+            rows.append((name, base_results[name].get(metric), None, None, None, "missing"))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare benchmark JSON against a baseline")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown (0.2 = 20%%)")
+    parser.add_argument("--override", action="append", default=[], help="Per-benchmark threshold, name=value")
+    parser.add_argument("--metric", default="median", help="Statistic to compare (median, p95, mean)")
+    parser.add_argument("--update-baseline", action="store_true", help="Copy current results over the baseline")
+    args = parser.parse_args(argv)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        shutil.copyfile(args.current, args.baseline)
+        print(f"Baseline updated from {args.current}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline} yet. Record one on the reference machine with:\n"
+              f"    python -m benchmarks.compare {args.baseline} {args.current} --update-baseline")
+        return 2
+
+    overrides = {}
+    for item in args.override:
+        name, _, value = item.rpartition("=")
+        overrides[name] = float(value)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold, overrides, args.metric)
+    regressions = 0
+    print(f"{'benchmark':30s} {'baseline':>12s} {'current':>12s} {'change':>9s}  status")
+    for name, base, value, change, limit, status in rows:
+        base_s = f"{base:.3f}" if base is not None else "-"
+        value_s = f"{value:.3f}" if value is not None else "-"
+        change_s = f"{change * 100:+.1f}%" if change is not None else "-"
+        print(f"{name:30s} {base_s:>12s} {value_s:>12s} {change_s:>9s}  {status}")
+        if status == "REGRESSION":
+            regressions += 1
+
+    if regressions:
+        print(f"\n{regressions} benchmark(s) regressed beyond threshold")
+        return 1
+    print("\nNo regressions beyond threshold")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Input-token reduction of context assembly on a fixed eval set.
+
+Chunks the documents in ``context_eval_set.json`` the same way ingestion does
+(with a smaller chunk size so top-k returns overlapping neighbours), retrieves
+top-k chunks per question by TF-IDF, then compares the naive concatenated
+context with ``rag_chatbot.context.build_context``. Quality is checked by
+answer coverage: the fraction of each question's expected facts that are
+still present in the context handed to the model.
+
+Usage:
+    python -m benchmarks.context_eval
+    python -m benchmarks.context_eval --budget 300 --output context_eval.json
+    python -m benchmarks.context_eval --prune
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag_chatbot.context import build_context
+from rag_chatbot.preprocessing import split_text
+
+EVAL_SET = Path(__file__).resolve().parent / "context_eval_set.json"
+
+
+def load_eval_set(path=EVAL_SET):
+    with open(path) as f:
+        return json.load(f)
+
+
+def retrieve_tfidf(chunks, query, top_k):
+    """Deterministic, model-free stand-in for the FAISS retriever"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True)
+    matrix = vectorizer.fit_transform([c["chunk"] for c in chunks] + [query])
+    scores = (matrix[:-1] @ matrix[-1].T).toarray().ravel()
+    return [chunks[i] for i in np.argsort(-scores, kind="stable")[:top_k]]
+
+
+def coverage(context, expected):
+    lowered = context.lower()
+    return sum(fact.lower() in lowered for fact in expected) / len(expected)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure prompt token savings from context assembly")
+    parser.add_argument("--eval-set", default=str(EVAL_SET))
+    parser.add_argument("--model", default="llama-3.1-8b-instant", help="Model whose token budget applies")
+    parser.add_argument("--budget", type=int, default=0, help="Override the token budget")
+    parser.add_argument("--prune", action="store_true", help="Drop low-relevance sentences (CONTEXT_PRUNE)")
+    parser.add_argument("--output", default="", help="Optional JSON report path")
+    args = parser.parse_args(argv)
+
+    eval_set = load_eval_set(args.eval_set)
+    chunks = []
+    for doc in eval_set["documents"]:
+        for chunk in split_text(doc["text"], eval_set["chunk_size"], eval_set["overlap"]):
+            chunks.append({"file": doc["file"], "chunk": chunk})
+
+    rows = []
+    for question in eval_set["questions"]:
+        retrieved = retrieve_tfidf(chunks, question["query"], eval_set["top_k"])
+        raw_context = "\n\n".join(f"From {c['file']}:\n{c['chunk']}" for c in retrieved)
+        context, stats = build_context(retrieved, question["query"], args.model, args.budget or None,
+                                       prune=args.prune or None)
+        rows.append({
+            "query": question["query"],
+            "raw_tokens": stats["raw_tokens"],
+            "context_tokens": stats["context_tokens"],
+            "passages": stats["passages"],
+            "sentences_dropped": stats["sentences_dropped"],
+            "raw_coverage": coverage(raw_context, question["expected"]),
+            "context_coverage": coverage(context, question["expected"]),
+        })
+
+    print(f"{'query':50s} {'raw':>6s} {'sent':>6s} {'saved':>7s} {'cov raw':>8s} {'cov ctx':>8s}")
+    for row in rows:
+        saved = 1.0 - row["context_tokens"] / row["raw_tokens"]
+        print(f"{row['query'][:50]:50s} {row['raw_tokens']:6d} {row['context_tokens']:6d} {saved:7.1%} "
+              f"{row['raw_coverage']:8.2f} {row['context_coverage']:8.2f}")
+
+    raw_total = sum(r["raw_tokens"] for r in rows)
+    sent_total = sum(r["context_tokens"] for r in rows)
+    summary = {
+        "questions": len(rows),
+        "raw_tokens": raw_total,
+        "context_tokens": sent_total,
+        "token_reduction": round(1.0 - sent_total / raw_total, 4),
+        "raw_coverage": round(float(np.mean([r["raw_coverage"] for r in rows])), 4),
+        "context_coverage": round(float(np.mean([r["context_coverage"] for r in rows])), 4),
+    }
+    print(f"\nTotal input tokens {raw_total} -> {sent_total} ({summary['token_reduction']:.1%} fewer); "
+          f"answer coverage {summary['raw_coverage']:.2f} -> {summary['context_coverage']:.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "questions": rows}, f, indent=2)
+        print(f"Report written to {args.output}")
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Synthetic corpus generator for benchmarks.
+
+Writes deterministic PDF and TXT documents into the same
+``data/course_notes`` / ``data/past_papers`` layout that
+``rag_chatbot.ingestion.load_documents`` reads.
+"""
+
+import argparse
+import random
+from pathlib import Path
+
+VOCABULARY = (
+    "parkinson disease neurological movement disorder symptoms tremor rigidity "
+    "diagnosis detection handwriting spiral drawing pattern motor analysis "
+    "machine learning neural network algorithm classification feature dataset "
+    "accuracy precision recall model training validation sample patient clinical "
+    "dopamine brain neuron treatment therapy medication exercise research study "
+    "exam question answer lecture course chapter section definition example"
+).split()
+
+
+def make_words(rng: random.Random, count: int) -> str:
+    """Return ``count`` pseudo-random words with sentence punctuation"""
+    words = []
+    for i in range(count):
+        word = rng.choice(VOCABULARY)
+        if i % 12 == 0:
+            word = word.capitalize()
+        words.append(word)
+        if i % 12 == 11:
+            words[-1] += "."
+    return " ".join(words)
+
+
+def _escape_pdf_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, text: str, words_per_line: int = 12, lines_per_page: int = 45) -> None:
+    """Write a minimal multi-page PDF that PyPDF2 can extract text from"""
+    words = text.split()
+    lines = [" ".join(words[i:i + words_per_line]) for i in range(0, len(words), words_per_line)]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[""]]
+
+    objects = []
+    # 1: catalog, 2: pages, 3: font, then (page, content) pairs
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, page_lines in enumerate(pages):
+        content_id = page_ids[i] + 1
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        )
+        stream = ["BT", "/F1 10 Tf", "12 TL", "40 760 Td"]
+        for line in page_lines:
+            stream.append(f"({_escape_pdf_text(line)}) Tj T*")
+        stream.append("ET")
+        body = "\n".join(stream).encode("latin-1", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(body) + body + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref_at = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode()
+    path.write_bytes(bytes(out))
+
+
+def generate_corpus(root, num_pdf: int = 5, num_txt: int = 5, words_per_doc: int = 5000, seed: int = 42):
+    """Generate a synthetic corpus under ``root/data`` and return the file paths"""
+    rng = random.Random(seed)
+    root = Path(root)
+    notes = root / "data" / "course_notes"
+    papers = root / "data" / "past_papers"
+    notes.mkdir(parents=True, exist_ok=True)
+    papers.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    for i in range(num_pdf):
+        folder = notes if i % 2 == 0 else papers
+        path = folder / f"synthetic_{i:04d}.pdf"
+        write_pdf(path, make_words(rng, words_per_doc))
+        paths.append(path)
+    for i in range(num_txt):
+        folder = notes if i % 2 == 0 else papers
+        path = folder / f"synthetic_{i:04d}.txt"
+        path.write_text(make_words(rng, words_per_doc), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def words_for_chunks(num_chunks: int, chunk_size: int = 500, overlap: int = 50) -> int:
+    """Total words needed for ``split_text`` to produce ``num_chunks`` chunks"""
+    return max(1, (num_chunks - 1) * (chunk_size - overlap) + 1)
+
+
+def chunks_for_words(num_words: int, chunk_size: int = 500, overlap: int = 50) -> int:
+    """Chunks ``split_text`` produces from one document of ``num_words`` words"""
+    return (max(1, num_words) - 1) // (chunk_size - overlap) + 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic PDF/TXT corpus")
+    parser.add_argument("root", help="Directory to create data/ under")
+    parser.add_argument("--pdf", type=int, default=5, help="Number of PDF files")
+    parser.add_argument("--txt", type=int, default=5, help="Number of TXT files")
+    parser.add_argument("--words", type=int, default=5000, help="Words per document")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    created = generate_corpus(args.root, args.pdf, args.txt, args.words, args.seed)
+    print(f"Generated {len(created)} documents under {args.root}")
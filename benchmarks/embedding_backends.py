@@ -0,0 +1,135 @@
+"""
+Compare embedding backends: torch SentenceTransformer vs ONNX Runtime
+(float32 and int8).
+
+Each backend runs in its own subprocess so import cost and resident memory
+are measured in isolation. Reports load time, encode throughput, per-query
+latency, peak RSS, speedup and memory saved relative to torch, and vector
+parity (cosine similarity) against the torch output.
+
+Usage:
+    python -m rag_chatbot.onnx_embeddings export --quantize
+    python -m benchmarks.embedding_backends --texts 500 --output backends.json
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+_WORKER = r'''
+import json, sys, time
+sys.path.insert(0, {repo!r})
+start = time.perf_counter()
+backend = {backend!r}
+if backend == "torch":
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer({model!r}, device="cpu")
+else:
+    from rag_chatbot.onnx_embeddings import OnnxEncoder
+    model = OnnxEncoder({onnx_dir!r}, quantized=(backend == "onnx-int8"))
+load_s = time.perf_counter() - start
+
+import numpy as np
+from rag_chatbot.metrics import process_memory_bytes, _peak_memory_bytes
+texts = json.load(open({texts_path!r}))
+model.encode(texts[:8])
+
+start = time.perf_counter()
+vectors = np.asarray(model.encode(texts, batch_size=32), dtype="float32")
+batch_s = time.perf_counter() - start
+
+latencies = []
+for text in texts[:{queries}]:
+    t0 = time.perf_counter()
+    model.encode(text)
+    latencies.append(time.perf_counter() - t0)
+latencies.sort()
+
+np.save({vectors_path!r}, vectors)
+print(json.dumps({{
+    "load_s": load_s,
+    "batch_s": batch_s,
+    "texts_per_s": len(texts) / batch_s,
+    "query_p50_ms": latencies[len(latencies) // 2] * 1000.0,
+    "query_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000.0,
+    "rss_mb": process_memory_bytes() / 1e6,
+    "peak_rss_mb": _peak_memory_bytes() / 1e6,
+}}))
+'''
+
+
+def run_backend(backend, model, onnx_dir, texts_path, vectors_path, queries):
+    code = _WORKER.format(repo=str(REPO_ROOT), backend=backend, model=model, onnx_dir=onnx_dir,
+                          texts_path=texts_path, vectors_path=vectors_path, queries=queries)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{backend} benchmark failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    from benchmarks.corpus import make_words
+    import random
+
+    parser = argparse.ArgumentParser(description="Benchmark torch vs ONNX Runtime embeddings")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="SentenceTransformer name or path")
+    parser.add_argument("--onnx-dir", default="embeddings/onnx", help="Directory from onnx_embeddings export")
+    parser.add_argument("--backends", default="torch,onnx-fp32,onnx-int8")
+    parser.add_argument("--texts", type=int, default=500, help="Chunks to embed")
+    parser.add_argument("--words", type=int, default=200, help="Words per chunk")
+    parser.add_argument("--queries", type=int, default=100, help="Single-text encodes for latency")
+    parser.add_argument("--output", default="", help="Optional JSON report path")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    texts = [make_words(rng, args.words) for _ in range(args.texts)]
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        texts_path = str(Path(tmp) / "texts.json")
+        with open(texts_path, "w") as f:
+            json.dump(texts, f)
+        vectors = {}
+        for backend in backends:
+            vectors_path = str(Path(tmp) / f"{backend}.npy")
+            print(f"Benchmarking {backend}...")
+            report[backend] = run_backend(backend, args.model, args.onnx_dir, texts_path, vectors_path, args.queries)
+            vectors[backend] = np.load(vectors_path)
+
+    if "torch" in report:
+        base = report["torch"]
+        reference = vectors["torch"]
+        reference = reference / np.clip(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12, None)
+        for backend, stats in report.items():
+            stats["speedup_vs_torch"] = round(stats["texts_per_s"] / base["texts_per_s"], 2)
+            stats["rss_saved_mb"] = round(base["rss_mb"] - stats["rss_mb"], 1)
+            ours = vectors[backend] / np.clip(np.linalg.norm(vectors[backend], axis=1, keepdims=True), 1e-12, None)
+            cosine = (ours * reference).sum(axis=1)
+            stats["min_cosine_vs_torch"] = round(float(cosine.min()), 6)
+            stats["mean_cosine_vs_torch"] = round(float(cosine.mean()), 6)
+
+    print(f"\n{'backend':12s} {'load s':>8s} {'texts/s':>9s} {'q p50 ms':>9s} {'RSS MB':>8s} "
+          f"{'speedup':>8s} {'saved MB':>9s} {'min cos':>8s}")
+    for backend, stats in report.items():
+        print(f"{backend:12s} {stats['load_s']:8.2f} {stats['texts_per_s']:9.1f} {stats['query_p50_ms']:9.2f} "
+              f"{stats['rss_mb']:8.1f} {stats.get('speedup_vs_torch', 0):8.2f} "
+              f"{stats.get('rss_saved_mb', 0):9.1f} {stats.get('min_cosine_vs_torch', 0):8.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(REPO_ROOT))
+    main()
@@ -0,0 +1,123 @@
+"""
+Latency and recall of coarse-to-fine retrieval against flat search.
+
+Builds the document-level index the way retrieval does (normalised mean of
+each file's chunk vectors) over an existing ``vector_index.pkl`` or a
+synthetic library (courses -> documents -> chunks), then reports per-query
+latency and recall@k against exact flat search for each number of
+documents expanded (RETRIEVAL_DOCS).
+
+Usage:
+    python -m benchmarks.hierarchical_retrieval --documents 2000 --chunks-per-doc 50
+    python -m benchmarks.hierarchical_retrieval --index embeddings/vector_index.pkl --expand 1,2,4,8
+"""
+
+import argparse
+import json
+import pickle
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.vector_compression import recall_at_k
+from rag_chatbot import hierarchy
+
+
+def synthetic_library(documents, chunks_per_doc, dim, chunk_spread=2.0, courses=40, seed=42):
+    """Unit chunk vectors grouped by document, documents grouped by course.
+
+    ``chunk_spread`` is how far chunks stray from their document's centre
+    relative to how far documents of one course stray from each other;
+    larger values make the document-level vectors less decisive.
+    """
+    rng = np.random.default_rng(seed)
+    course_centres = rng.standard_normal((courses, dim)).astype("float32")
+    doc_centres = (course_centres[rng.integers(0, courses, documents)]
+                   + 0.5 * rng.standard_normal((documents, dim)).astype("float32"))
+    codes = np.repeat(np.arange(documents), chunks_per_doc)
+    vectors = doc_centres[codes] + chunk_spread * rng.standard_normal((len(codes), dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, codes
+
+
+def load_library(path):
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+    vectors = np.array([item["vector"] for item in data], dtype="float32")
+    _, codes = np.unique(np.array([item["file"] for item in data], dtype=object), return_inverse=True)
+    return vectors, codes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare coarse-to-fine retrieval with flat search")
+    parser.add_argument("--index", default="", help="vector_index.pkl to take vectors and files from")
+    parser.add_argument("--documents", type=int, default=2000, help="Synthetic document count")
+    parser.add_argument("--chunks-per-doc", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--chunk-spread", type=float, default=2.0, help="Synthetic within-document spread")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--expand", default="1,2,4,8,16,32", help="Documents expanded per query")
+    parser.add_argument("--output", default="")
+    args = parser.parse_args(argv)
+
+    if args.index:
+        vectors, codes = load_library(args.index)
+    else:
+        vectors, codes = synthetic_library(args.documents, args.chunks_per_doc, args.dim, args.chunk_spread)
+    count = int(codes.max()) + 1
+    rng = np.random.default_rng(7)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    start = time.perf_counter()
+    truth = np.array([flat.search(q[None, :], args.top_k)[1][0] for q in queries])
+    flat_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+
+    start = time.perf_counter()
+    documents = hierarchy.document_index(hierarchy.file_sums(vectors, codes, count), np.bincount(codes))
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(count + 1))
+    rows = [order[bounds[i]:bounds[i + 1]] for i in range(count)]
+    build_s = time.perf_counter() - start
+
+    report = {"vectors": len(vectors), "documents": count, "dim": int(vectors.shape[1]), "top_k": args.top_k,
+              "flat_ms": round(flat_ms, 4), "document_index_build_s": round(build_s, 3), "expand": {}}
+    print(f"{len(vectors)} chunks in {count} documents; flat search {flat_ms:.3f} ms/query")
+    for n in [int(v) for v in args.expand.split(",") if v.strip()]:
+        found = []
+        searched = 0
+        start = time.perf_counter()
+        for q in queries:
+            picked = hierarchy.top_documents(documents, q, n)[0]
+            candidates = np.concatenate([rows[i] for i in picked if i >= 0])
+            searched += len(candidates)
+            _, ids = hierarchy.nearest(q, vectors[candidates], candidates, args.top_k)
+            found.append(np.pad(ids, (0, args.top_k - len(ids)), constant_values=-1))
+        search_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+        stats = {
+            "search_ms": round(search_ms, 4),
+            "speedup": round(flat_ms / search_ms, 2) if search_ms else None,
+            "chunks_searched": round(searched / len(queries), 1),
+            "recall": round(recall_at_k(np.array(found), truth), 4),
+        }
+        report["expand"][n] = stats
+        print(f"docs={n:<4d} {stats['search_ms']:8.3f} ms/query  x{stats['speedup']:<6}  "
+              f"{stats['chunks_searched']:9.1f} chunks searched  recall@{args.top_k}={stats['recall']:.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Concurrent load generator for the FastAPI backend.
+
+Drives N concurrent HTTP ``/chat`` clients and M persistent ``/ws`` sessions
+against a running backend (or one it spawns itself against the mock LLM in
+``benchmarks.stub_llm``) and reports throughput, p50/p95/p99 latency,
+WebSocket time-to-first-frame and error rates per concurrency level.
+
+A 200 from ``/chat`` is not always a model answer: the backend may answer
+locally when a provider call was shed or failed. Each level therefore also
+reports, from ``/metrics``, how many LLM requests were shed or coalesced
+and how many answers came from the local fallback. The spawned backend runs
+with ``LLM_SCHEDULER=0`` so the free-tier rate limit does not dominate the
+numbers; against a running backend, multi-worker counts cover only the
+worker that served the scrape.
+
+Usage:
+    # Against an already running backend
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --chat 16 --ws 8 --duration 30
+
+    # Self-contained: mock LLM + synthetic corpus + uvicorn subprocess,
+    # ramping /chat concurrency to find the saturation point
+    python -m benchmarks.load_test --spawn --ramp 1,2,4,8,16,32,64 --ws 4 \\
+        --llm-latency 0.5 --llm-jitter 0.1 --llm-error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.run_benchmarks import QUERIES
+from benchmarks.stats import percentile
+from benchmarks.stub_llm import StubLLMServer
+
+
+class LevelStats:
+    """Samples collected while running one concurrency level"""
+
+    def __init__(self):
+        self.chat_latencies = []
+        self.chat_errors = 0
+        self.ws_first_frame = []
+        self.ws_latencies = []
+        self.ws_errors = 0
+
+    def report(self, elapsed: float, chat_clients: int, ws_sessions: int, llm: dict) -> dict:
+        def latency(samples):
+            ms = [s * 1000.0 for s in samples]
+            return {
+                "p50": round(percentile(ms, 50), 2),
+                "p95": round(percentile(ms, 95), 2),
+                "p99": round(percentile(ms, 99), 2),
+            }
+
+        chat_total = len(self.chat_latencies) + self.chat_errors
+        ws_total = len(self.ws_latencies) + self.ws_errors
+        return {
+            "chat_clients": chat_clients,
+            "ws_sessions": ws_sessions,
+            "duration_s": round(elapsed, 2),
+            "chat": {
+                "requests": chat_total,
+                "throughput_rps": round(len(self.chat_latencies) / elapsed, 2) if elapsed else 0.0,
+                "error_rate": round(self.chat_errors / chat_total, 4) if chat_total else 0.0,
+                "latency_ms": latency(self.chat_latencies),
+            },
+            "ws": {
+                "messages": ws_total,
+                "throughput_mps": round(len(self.ws_latencies) / elapsed, 2) if elapsed else 0.0,
+                "error_rate": round(self.ws_errors / ws_total, 4) if ws_total else 0.0,
+                "first_frame_ms": latency(self.ws_first_frame),
+                "latency_ms": latency(self.ws_latencies),
+            },
+            "llm": llm,
+        }
+
+
+async def chat_client(client, url: str, deadline: float, stats: LevelStats, offset: int):
+    i = offset
+    while time.perf_counter() < deadline:
+        query = QUERIES[i % len(QUERIES)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            response = await client.post(f"{url}/chat", json={"message": query})
+            if response.status_code == 200:
+                stats.chat_latencies.append(time.perf_counter() - start)
+            else:
+                stats.chat_errors += 1
+        except Exception:
+            stats.chat_errors += 1
+
+
+async def ws_session(ws_url: str, deadline: float, stats: LevelStats, offset: int, timeout: float):
+    import websockets
+
+    i = offset
+    try:
+        async with websockets.connect(f"{ws_url}/ws", max_size=None) as ws:
+            while time.perf_counter() < deadline:
+                query = QUERIES[i % len(QUERIES)]
+                i += 1
+                start = time.perf_counter()
+                await ws.send(json.dumps({"message": query}))
+                first = True
+                while True:
+                    frame = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+                    if first:
+                        stats.ws_first_frame.append(time.perf_counter() - start)
+                        first = False
+                    if frame.get("type") == "response":
+                        stats.ws_latencies.append(time.perf_counter() - start)
+                        break
+                    if frame.get("type") == "error":
+                        stats.ws_errors += 1
+                        break
+    except Exception:
+        stats.ws_errors += 1
+
+
+# Counters scraped from /metrics: (name, label that must appear, report key)
+LLM_COUNTERS = (
+    ("rag_llm_requests_total", 'result="shed"', "shed"),
+    ("rag_llm_requests_total", 'result="coalesced"', "coalesced"),
+    ("rag_answer_provider_total", 'provider="fallback"', "fallback_answers"),
+)
+
+
+async def llm_counts(client, url: str) -> dict:
+    """Current shed/coalesced/fallback totals from the backend's /metrics"""
+    counts = {key: 0.0 for _, _, key in LLM_COUNTERS}
+    try:
+        response = await client.get(f"{url}/metrics")
+    except Exception:
+        return counts
+    for line in response.text.splitlines():
+        for name, label, key in LLM_COUNTERS:
+            if line.startswith(name + "{") and label in line:
+                counts[key] += float(line.rsplit(" ", 1)[1])
+    return counts
+
+
+async def run_level(url: str, chat_clients: int, ws_sessions: int, duration: float, timeout: float) -> dict:
+    import httpx
+
+    stats = LevelStats()
+    ws_url = "ws" + url[len("http"):]
+    limits = httpx.Limits(max_connections=chat_clients + 10, max_keepalive_connections=chat_clients + 10)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        before = await llm_counts(client, url)
+        started = time.perf_counter()
+        deadline = started + duration
+        tasks = [chat_client(client, url, deadline, stats, i) for i in range(chat_clients)]
+        tasks += [ws_session(ws_url, deadline, stats, i, timeout) for i in range(ws_sessions)]
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        after = await llm_counts(client, url)
+    llm = {key: int(after[key] - before[key]) for key in after}
+    return stats.report(elapsed, chat_clients, ws_sessions, llm)
+
+
+def find_saturation(levels, gain: float = 0.1):
+    """First level whose /chat throughput gained less than ``gain`` over the previous one"""
+    for previous, current in zip(levels, levels[1:]):
+        before = previous["chat"]["throughput_rps"]
+        after = current["chat"]["throughput_rps"]
+        if before and (after - before) / before < gain:
+            return previous["chat_clients"]
+    return None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float) -> None:
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{url}/health/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Backend at {url} did not become ready within {timeout}s")
+
+
+@contextmanager
+def spawned_backend(args):
+    """Mock LLM in-process plus a uvicorn backend subprocess on a synthetic corpus"""
+    llm = StubLLMServer(latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate)
+    llm.start()
+    port = _free_port()
+    with tempfile.TemporaryDirectory(prefix="rag_load_") as workdir:
+        generate_corpus(workdir, args.docs, args.docs, 3000)
+        env = dict(os.environ)
+        env.update({
+            "GROQ_API_URL": llm.url,
+            "GROQ_API_KEY": "stub",
+            "HF_API_URL": llm.hf_url,
+            "HF_API_TOKEN": "stub",
+            # Measure the backend, not the free-tier rate limit
+            "LLM_SCHEDULER": "0",
+        })
+        # Never sync the synthetic corpus to a real bucket
+        for key in ("AWS_S3_BUCKET", "AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+            env.pop(key, None)
+        command = [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--app-dir", str(REPO_ROOT / "backend"),
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(args.workers), "--log-level", "warning",
+        ]
+        process = subprocess.Popen(command, cwd=workdir, env=env)
+        url = f"http://127.0.0.1:{port}"
+        try:
+            _wait_ready(url, args.ready_timeout)
+            yield url, llm
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            llm.stop()
+
+
+def _print_level(level: dict) -> None:
+    chat, ws, llm = level["chat"], level["ws"], level["llm"]
+    print(
+        f"  chat={level['chat_clients']:4d} ws={level['ws_sessions']:4d} | "
+        f"{chat['throughput_rps']:8.2f} req/s  p50={chat['latency_ms']['p50']:8.1f}  "
+        f"p95={chat['latency_ms']['p95']:8.1f}  p99={chat['latency_ms']['p99']:8.1f} ms  "
+        f"err={chat['error_rate'] * 100:5.1f}% | ws first-frame p95={ws['first_frame_ms']['p95']:8.1f} ms  "
+        f"p95={ws['latency_ms']['p95']:8.1f} ms  err={ws['error_rate'] * 100:5.1f}% | "
+        f"llm shed={llm['shed']} coalesced={llm['coalesced']} fallback={llm['fallback_answers']}"
+    )
+
+
+def run(args, url: str) -> list:
+    levels_spec = [int(n) for n in args.ramp.split(",")] if args.ramp else [args.chat]
+    levels = []
+    for chat_clients in levels_spec:
+        level = asyncio.run(run_level(url, chat_clients, args.ws, args.duration, args.timeout))
+        _print_level(level)
+        levels.append(level)
+    return levels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test /chat and /ws")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Backend base URL")
+    parser.add_argument("--spawn", action="store_true", help="Start mock LLM and backend automatically")
+    parser.add_argument("--chat", type=int, default=8, help="Concurrent /chat clients")
+    parser.add_argument("--ws", type=int, default=4, help="Persistent /ws sessions")
+    parser.add_argument("--ramp", default="", help="Comma-separated /chat concurrency levels, e.g. 1,4,16,64")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per level")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when spawning")
+    parser.add_argument("--docs", type=int, default=4, help="PDF and TXT documents each when spawning")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--output", default="", help="Optional JSON report path")
+    args = parser.parse_args(argv)
+
+    llm_counters = None
+    if args.spawn:
+        with spawned_backend(args) as (url, llm):
+            print(f"Backend ready at {url}, mock LLM at {llm.base_url}")
+            levels = run(args, url)
+            llm_counters = llm.counters
+    else:
+        levels = run(args, args.url)
+
+    saturation = find_saturation(levels) if len(levels) > 1 else None
+    if saturation is not None:
+        print(f"Throughput saturates at about {saturation} concurrent /chat clients")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"levels": levels, "saturation_chat_clients": saturation, "llm": llm_counters}, f, indent=2)
+        print(f"Report written to {args.output}")
+    return levels
+
+
+if __name__ == "__main__":
+    main()
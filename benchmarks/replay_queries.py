@@ -0,0 +1,121 @@
+"""
+Replay a query log against the current index.
+
+Re-runs every logged query (or the distinct ones) through ``retrieve`` and
+reports retrieval latency plus how far results drifted from what was served
+when the query was logged: overlap@k of chunk IDs, and queries whose top
+hit changed. Use it to check an index or retrieval change against real
+traffic before deploying.
+
+Usage:
+    QUERY_LOG=1 ...                                      # collect logs/queries.jsonl
+    python -m benchmarks.replay_queries --index embeddings/vector_index.pkl
+    python -m benchmarks.replay_queries --log logs/queries.jsonl --distinct --output replay.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.stats import summarize
+from rag_chatbot import query_log, retrieval
+
+
+def load_log(paths, distinct=False, limit=0):
+    """Logged entries that carry retrieval results (cache hits have none)"""
+    entries = []
+    seen = set()
+    for entry in query_log.read_entries(paths):
+        if not entry.get("results") or not entry.get("query"):
+            continue
+        key = query_log.normalise(entry["query"])
+        if distinct:
+            if key in seen:
+                continue
+            seen.add(key)
+        entries.append(entry)
+        if limit and len(entries) >= limit:
+            break
+    return entries
+
+
+def replay(entries):
+    rows = []
+    latencies = []
+    for entry in entries:
+        top_k = entry.get("top_k", 3)
+        start = time.perf_counter()
+        results = retrieval.retrieve(entry["query"], top_k=top_k)
+        latencies.append(time.perf_counter() - start)
+
+        before = [r["id"] for r in entry["results"]]
+        after = [r["id"] for r in results]
+        overlap = len(set(before) & set(after)) / len(before) if before else 1.0
+        rows.append({
+            "query": entry["query"],
+            "overlap": round(overlap, 4),
+            "top1_changed": bool(before and after and before[0] != after[0]) or (bool(before) != bool(after)),
+            "before": [f"{r['file']}#{r['id']}" for r in entry["results"]],
+            "after": [f"{r['file']}#{r['id']}" for r in results],
+            "logged_retrieve_ms": round(sum(v for k, v in entry.get("timings_ms", {}).items()
+                                            if k in ("embed_query", "faiss_search", "rescore")), 3),
+            "replay_retrieve_ms": round(latencies[-1] * 1000.0, 3),
+        })
+    return rows, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay logged queries against the current index")
+    parser.add_argument("--log", action="append", default=None,
+                        help="Log file(s) to replay (default: QUERY_LOG_PATH and its backups)")
+    parser.add_argument("--index", default=retrieval.INDEX_PATH, help="Embeddings pickle to load")
+    parser.add_argument("--distinct", action="store_true", help="Replay each distinct query once")
+    parser.add_argument("--limit", type=int, default=0, help="Replay at most this many entries")
+    parser.add_argument("--show", type=int, default=10, help="Changed queries to print")
+    parser.add_argument("--output", default="", help="Optional JSON report path")
+    args = parser.parse_args(argv)
+
+    entries = load_log(args.log, args.distinct, args.limit)
+    if not entries:
+        print("No replayable entries found (is QUERY_LOG enabled?)")
+        return None
+    if not retrieval.load_index(args.index):
+        print(f"No index at {args.index}")
+        return None
+
+    retrieval.retrieve(entries[0]["query"])  # load the model outside the timings
+    rows, latencies = replay(entries)
+
+    changed = [r for r in rows if r["overlap"] < 1.0]
+    summary = {
+        "queries": len(rows),
+        "mean_overlap": round(sum(r["overlap"] for r in rows) / len(rows), 4),
+        "changed": len(changed),
+        "top1_changed": sum(r["top1_changed"] for r in rows),
+        "replay_latency": summarize(latencies),
+        "logged_latency": summarize([r["logged_retrieve_ms"] / 1000.0 for r in rows if r["logged_retrieve_ms"]]),
+    }
+
+    print(f"Replayed {summary['queries']} queries: mean overlap@k {summary['mean_overlap']:.3f}, "
+          f"{summary['changed']} changed, {summary['top1_changed']} with a new top hit")
+    for label, stats in (("replay", summary["replay_latency"]), ("logged", summary["logged_latency"])):
+        if stats.get("n"):
+            print(f"  {label:7s} retrieve ms: median {stats['median']:.2f}  p95 {stats['p95']:.2f}  max {stats['max']:.2f}")
+    for row in sorted(changed, key=lambda r: r["overlap"])[:args.show]:
+        print(f"\n  [{row['overlap']:.2f}] {row['query'][:80]}")
+        print(f"    before: {', '.join(row['before'])}")
+        print(f"    after:  {', '.join(row['after'])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "queries": rows}, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Benchmark runner for ingestion, chunking, embedding, retrieval and /chat.
+
+Ingestion, embedding and retrieval run at each ``--sizes`` chunk count.
+Ingestion and embedding above ``--measure-max-chunks`` run on a sample of
+that many chunks and are scaled linearly; those results carry
+``measured_chunks`` and ``extrapolated``.
+
+Every stage runs inside a throwaway workspace (a temporary directory that
+becomes the working directory), because the pipeline reads ``data/`` and
+writes ``embeddings/`` relative to the current directory.
+
+Usage:
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --quick
+    python -m benchmarks.compare benchmarks/baseline.json results.json --update-baseline   # once
+    python -m benchmarks.compare benchmarks/baseline.json results.json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import pickle
+import platform
+import random
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.corpus import chunks_for_words, generate_corpus, make_words, words_for_chunks
+from benchmarks.stats import summarize, time_call
+from benchmarks.stub_llm import StubLLMServer
+
+QUERIES = [
+    "What is Parkinson's disease?",
+    "How is Parkinson's disease detected?",
+    "What are the symptoms of Parkinson's?",
+    "What machine learning methods are used?",
+    "How is the handwriting spiral analysed?",
+    "Which dataset was used for training?",
+    "What treatments are discussed in the lecture?",
+    "Define neural network classification accuracy.",
+]
+
+
+@contextmanager
+def workspace():
+    """Temporary working directory with the data/embeddings layout"""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="rag_bench_") as tmp:
+        os.chdir(tmp)
+        try:
+            yield Path(tmp)
+        finally:
+            os.chdir(previous)
+
+
+def _at_size(durations, chunks, size, sampled):
+    """Summary of a run over ``chunks`` chunks, scaled linearly to ``size``
+    chunks when the run was a smaller sample"""
+    if not sampled:
+        return dict(summarize(durations), chunks=chunks)
+    scale = size / chunks
+    return dict(summarize([d * scale for d in durations]), chunks=size,
+                measured_chunks=chunks, extrapolated=True)
+
+
+def bench_ingestion(args, results):
+    from rag_chatbot.ingestion import load_documents
+    from rag_chatbot.preprocessing import preprocess_documents
+
+    per_doc = chunks_for_words(args.words_per_doc)
+    runs = {}
+    for size in args.sizes:
+        sample = min(size, args.measure_max_chunks)
+        if sample not in runs:
+            with workspace() as root:
+                num_docs = -(-sample // per_doc)
+                generate_corpus(root, num_docs - num_docs // 2, num_docs // 2, args.words_per_doc, args.seed)
+                docs, load_durations = time_call(load_documents, repeat=args.repeat)
+                chunks, chunk_durations = time_call(preprocess_documents, docs, repeat=args.repeat)
+            runs[sample] = (len(docs), len(chunks), load_durations, chunk_durations)
+        num_docs, num_chunks, load_durations, chunk_durations = runs[sample]
+        sampled = sample < size
+        results[f"load_documents[{size}]"] = _at_size(load_durations, num_chunks, size, sampled)
+        results[f"preprocess_documents[{size}]"] = _at_size(chunk_durations, num_chunks, size, sampled)
+        if not sampled:
+            results[f"load_documents[{size}]"]["documents"] = num_docs
+
+
+def bench_embeddings(args, results):
+    from rag_chatbot.embeddings import get_model, create_embeddings
+    from rag_chatbot.preprocessing import preprocess_documents
+
+    _, durations = time_call(get_model)
+    results["model_load"] = summarize(durations)
+
+    runs = {}
+    for size in args.sizes:
+        sample = min(size, args.measure_max_chunks)
+        if sample not in runs:
+            rng = random.Random(args.seed)
+            text = make_words(rng, words_for_chunks(sample))
+            chunks = preprocess_documents([{"file": "synthetic.txt", "text": text}])
+            with workspace():
+                _, durations = time_call(create_embeddings, chunks, repeat=1)
+            runs[sample] = (len(chunks), durations)
+        num_chunks, durations = runs[sample]
+        stats = _at_size(durations, num_chunks, size, sample < size)
+        stats["chunks_per_second"] = round(num_chunks / durations[0], 2)
+        results[f"create_embeddings[{size}]"] = stats
+
+
+def _write_synthetic_index(path: Path, num_chunks: int, dim: int, seed: int) -> None:
+    """Write a vector_index.pkl with random unit vectors in create_embeddings' format"""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((num_chunks, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    words = random.Random(seed)
+    data = [
+        {"file": f"synthetic_{i // 100:04d}.pdf", "chunk": make_words(words, 40), "vector": vectors[i]}
+        for i in range(num_chunks)
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        pickle.dump(data, f)
+
+
+def bench_retrieval(args, results):
+    from rag_chatbot import retrieval
+    from rag_chatbot.embeddings import get_model
+
+    dim = get_model().get_sentence_embedding_dimension()
+    # Encode once up front so the first timed query doesn't pay warm-up cost
+    get_model().encode(QUERIES[0])
+    for size in args.sizes:
+        with workspace() as root:
+            path = root / "embeddings" / "vector_index.pkl"
+            _write_synthetic_index(path, size, dim, args.seed)
+            _, durations = time_call(retrieval.load_index, str(path))
+            results[f"load_index[{size}]"] = dict(summarize(durations), chunks=size)
+
+            samples = []
+            for i in range(args.queries):
+                _, durations = time_call(retrieval.retrieve, QUERIES[i % len(QUERIES)], 3)
+                samples.extend(durations)
+            results[f"retrieve[{size}]"] = dict(summarize(samples), chunks=size)
+    retrieval.load_index("does-not-exist.pkl")
+
+
+def _load_backend():
+    """Import backend/main.py as a module without clashing with the root main.py"""
+    backend_dir = REPO_ROOT / "backend"
+    if str(backend_dir) not in sys.path:
+        sys.path.insert(0, str(backend_dir))
+    spec = importlib.util.spec_from_file_location("backend_main", backend_dir / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _llm_counts():
+    """Requests shed or coalesced by the LLM scheduler and answers served
+    by the local fallback so far in this process"""
+    from rag_chatbot import metrics
+
+    get = metrics.registry.get
+    return {
+        "llm_shed": sum(get("rag_llm_requests_total", provider=p, result="shed") for p in ("groq", "hf")),
+        "llm_coalesced": get("rag_llm_requests_total", result="coalesced"),
+        "fallback_answers": get("rag_answer_provider_total", provider="fallback"),
+    }
+
+
+def bench_chat(args, results):
+    from fastapi.testclient import TestClient
+    from rag_chatbot import chatbot, llm_scheduler
+
+    # Measure the pipeline, not the free-tier rate limit: with the scheduler
+    # on, most requests would wait for a token or be shed to the fallback
+    scheduler_enabled = llm_scheduler.LLM_SCHEDULER
+    llm_scheduler.LLM_SCHEDULER = False
+    try:
+        with workspace() as root, StubLLMServer() as llm_url:
+            chatbot.GROQ_API_URL = llm_url
+            chatbot.GROQ_API_KEY = "stub"
+            generate_corpus(root, 2, 2, args.words_per_doc, args.seed)
+            backend = _load_backend()
+
+            with TestClient(backend.app) as client:
+                deadline = time.time() + args.ready_timeout
+                while client.get("/health/ready").status_code != 200:
+                    if time.time() > deadline:
+                        raise RuntimeError("Backend did not become ready in time")
+                    time.sleep(0.2)
+
+                before = _llm_counts()
+                samples = []
+                for i in range(args.chat_requests):
+                    start = time.perf_counter()
+                    response = client.post("/chat", json={"message": QUERIES[i % len(QUERIES)]})
+                    samples.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"/chat failed: {response.status_code} {response.text}")
+                after = _llm_counts()
+                results["chat_e2e"] = dict(summarize(samples), **{k: after[k] - before[k] for k in after})
+    finally:
+        llm_scheduler.LLM_SCHEDULER = scheduler_enabled
+
+
+# Non-timing fields printed next to a benchmark's latencies
+COUNT_FIELDS = ("chunks", "measured_chunks", "llm_shed", "llm_coalesced", "fallback_answers")
+
+STAGES = {
+    "ingestion": bench_ingestion,
+    "embedding": bench_embeddings,
+    "retrieval": bench_retrieval,
+    "chat": bench_chat,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run RAG chatbot benchmarks")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write JSON results")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated subset of stages")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="Chunk counts for ingestion, embedding and retrieval")
+    parser.add_argument("--measure-max-chunks", type=int, default=10000,
+                        help="Largest ingestion/embedding run; bigger sizes are extrapolated from it")
+    parser.add_argument("--words-per-doc", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=50, help="Queries per retrieval size")
+    parser.add_argument("--chat-requests", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--quick", action="store_true", help="Small sizes for a fast smoke run")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.sizes = "1000"
+        args.measure_max_chunks = 100
+        args.queries = 10
+        args.chat_requests = 5
+        args.repeat = 1
+    args.sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    results = {}
+    for name in [s.strip() for s in args.stages.split(",") if s.strip()]:
+        if name not in STAGES:
+            parser.error(f"Unknown stage: {name}")
+        print(f"Running {name} benchmarks...")
+        STAGES[name](args, results)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items()},
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for name, stats in results.items():
+        counts = "".join(f"  {key}={stats[key]:g}" for key in COUNT_FIELDS if key in stats)
+        print(f"  {name:28s} median={stats.get('median', 0):10.3f} ms  p95={stats.get('p95', 0):10.3f} ms{counts}")
+    print(f"Results written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
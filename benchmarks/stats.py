@@ -0,0 +1,45 @@
+"""
+Small helpers for summarising latency samples.
+"""
+
+import math
+import statistics
+import time
+
+
+def percentile(samples, pct: float) -> float:
+    """Nearest-rank percentile of ``samples`` (pct in 0-100)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples_seconds, unit: str = "ms") -> dict:
+    """Summarise a list of durations in seconds as milliseconds"""
+    scale = 1000.0 if unit == "ms" else 1.0
+    values = [s * scale for s in samples_seconds]
+    if not values:
+        return {"unit": unit, "n": 0}
+    return {
+        "unit": unit,
+        "n": len(values),
+        "mean": round(statistics.fmean(values), 4),
+        "median": round(statistics.median(values), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "min": round(min(values), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def time_call(func, *args, repeat: int = 1, **kwargs):
+    """Call ``func`` ``repeat`` times; return (last result, list of durations)"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        durations.append(time.perf_counter() - start)
+    return result, durations
@@ -0,0 +1,139 @@
+"""
+Local stand-in for the Groq and Hugging Face inference APIs.
+
+Serves an OpenAI-compatible ``/openai/v1/chat/completions`` endpoint (Groq)
+and a ``/models/<name>`` endpoint (Hugging Face) that return canned answers,
+so benchmarks and load tests never touch the network. Latency, jitter and
+error rate are configurable to mimic a slow or flaky provider.
+
+Point the backend at it with:
+    GROQ_API_URL=http://127.0.0.1:8088/openai/v1/chat/completions
+    HF_API_URL=http://127.0.0.1:8088/models/stub
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    answer = "This is a stub answer generated for benchmarking."
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        config = self.server.config
+        self.server.record("requests")
+
+        delay = max(0.0, random.gauss(config["latency"], config["jitter"]))
+        if delay:
+            time.sleep(delay)
+
+        if random.random() < config["error_rate"]:
+            self.server.record("errors")
+            self._send(config["error_status"], {"error": {"message": "stub provider error"}})
+            return
+
+        if self.path.startswith("/models/"):
+            payload = [{"generated_text": self.answer}]
+        else:
+            payload = {"choices": [{"message": {"role": "assistant", "content": self.answer}}]}
+        self._send(200, payload)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, StubLLMHandler)
+        self.config = config
+        self.counters = {"requests": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def record(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+
+class StubLLMServer:
+    """Run the stub in a background thread: ``with StubLLMServer() as url: ...``
+
+    ``latency`` and ``jitter`` are seconds (normal distribution, clipped at 0);
+    ``error_rate`` is the fraction of requests answered with ``error_status``.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 503):
+        config = {
+            "latency": latency,
+            "jitter": jitter,
+            "error_rate": error_rate,
+            "error_status": error_status,
+        }
+        self.httpd = _StubHTTPServer((host, port), config)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/openai/v1/chat/completions"
+
+    @property
+    def hf_url(self) -> str:
+        return f"{self.base_url}/models/stub"
+
+    @property
+    def counters(self) -> dict:
+        return dict(self.httpd.counters)
+
+    def start(self) -> str:
+        self.thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock Groq/HF LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency standard deviation in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server = StubLLMServer(args.host, args.port, args.latency, args.jitter, args.error_rate, args.error_status)
+    print(f"Stub LLM listening on {server.url} (HF: {server.hf_url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+        print(f"Served {server.counters}")
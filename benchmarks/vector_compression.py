@@ -0,0 +1,131 @@
+"""
+Memory vs recall for each vector compression setting.
+
+Builds every configured index over the same vectors (an existing
+``vector_index.pkl`` or synthetic clustered vectors), then reports index RAM,
+query latency and recall@k against exact float32 search, with and without
+exact re-scoring from memory-mapped full-precision vectors.
+
+Usage:
+    python -m benchmarks.vector_compression --vectors 100000
+    python -m benchmarks.vector_compression --index embeddings/vector_index.pkl \\
+        --settings none,fp16,sq8,pq,pca128+sq8,pca128+pq --rescore 4
+"""
+
+import argparse
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag_chatbot import compression
+
+
+def synthetic_vectors(num, dim, clusters=64, seed=42):
+    """Unit vectors drawn around random centres, closer to real embeddings than pure noise"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = centres[rng.integers(0, clusters, num)] + 0.6 * rng.standard_normal((num, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def parse_setting(setting):
+    """'pca128+pq' -> ('pq', 128); 'sq8' -> ('sq8', 0)"""
+    pca_dim = 0
+    mode = setting
+    if setting.startswith("pca"):
+        pca_part, _, mode = setting.partition("+")
+        pca_dim = int(pca_part[3:])
+        mode = mode or "none"
+    return mode, pca_dim
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare compressed vector settings")
+    parser.add_argument("--index", default="", help="vector_index.pkl to take vectors from")
+    parser.add_argument("--vectors", type=int, default=20000, help="Synthetic vector count")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--rescore", type=int, default=4, help="Candidates per result for re-scoring")
+    parser.add_argument("--settings", default="none,fp16,sq8,pq,pca192+sq8,pca128+pq")
+    parser.add_argument("--output", default="")
+    args = parser.parse_args(argv)
+
+    if args.index:
+        with open(args.index, "rb") as f:
+            vectors = np.array([item["vector"] for item in pickle.load(f)], dtype="float32")
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dim)
+    rng = np.random.default_rng(7)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.top_k)
+
+    report = {"vectors": len(vectors), "dim": int(vectors.shape[1]), "top_k": args.top_k, "settings": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        full_path = os.path.join(tmp, "full.f32.npy")
+        compression.write_full_precision(vectors, full_path)
+        full = compression.open_full_precision(full_path)
+
+        for setting in [s.strip() for s in args.settings.split(",") if s.strip()]:
+            mode, pca_dim = parse_setting(setting)
+            start = time.perf_counter()
+            index, description = compression.build_index(vectors, mode, pca_dim)
+            build_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            _, approx = index.search(queries, args.top_k)
+            search_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+
+            fetch_k = args.top_k * args.rescore
+            start = time.perf_counter()
+            _, candidates = index.search(queries, fetch_k)
+            rescored = np.array([
+                np.pad(compression.rescore(full, q, c, args.top_k)[0], (0, args.top_k), constant_values=-1)[:args.top_k]
+                for q, c in zip(queries, candidates)
+            ])
+            rescore_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+
+            stats = {
+                "factory": description,
+                "index_mb": round(compression.index_memory_bytes(index) / 1e6, 2),
+                "bytes_per_vector": round(compression.index_memory_bytes(index) / len(vectors), 1),
+                "build_s": round(build_s, 3),
+                "search_ms": round(search_ms, 4),
+                "recall": round(recall_at_k(approx, truth), 4),
+                "rescore_ms": round(rescore_ms, 4),
+                "recall_rescored": round(recall_at_k(rescored, truth), 4),
+            }
+            report["settings"][setting] = stats
+            print(f"{setting:12s} {description:14s} {stats['index_mb']:9.2f} MB  "
+                  f"recall@{args.top_k}={stats['recall']:.3f}  rescored={stats['recall_rescored']:.3f}  "
+                  f"search={stats['search_ms']:.3f} ms  +rescore={stats['rescore_ms']:.3f} ms")
+        del full
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
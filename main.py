@@ -4,8 +4,11 @@ RAG Chatbot - Main Entry Point
 A Retrieval-Augmented Generation chatbot for querying research documents
 """
 
+import argparse
+import json
 import os
 import sys
+import time
 from pathlib import Path
 
 # Add the rag_chatbot module to the path
@@ -134,5 +137,44 @@ def main():
             print(f"\n❌ Error: {e}")
             print("Please try again or type 'help' for assistance.")
 
+def run_batch(questions_path, output=None, concurrency=None, top_k=3):
+    """Answer every question in a file, streaming JSONL to ``output`` or stdout"""
+    from rag_chatbot.batch import read_questions, answer_many
+    
+    questions = read_questions(questions_path)
+    if not questions:
+        print(f"❌ No questions found in {questions_path}", file=sys.stderr)
+        return 1
+    
+    print(f"📝 Answering {len(questions)} questions from {questions_path}...", file=sys.stderr)
+    start = time.perf_counter()
+    out = open(output, "w", encoding="utf-8") if output else sys.stdout
+    counts = {}
+    try:
+        for done, result in enumerate(answer_many(questions, top_k=top_k, concurrency=concurrency), 1):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            print(f"  [{done}/{len(questions)}] {result['status']}: {result['question'][:60]}", file=sys.stderr)
+    finally:
+        if output:
+            out.close()
+    
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(f"✅ Done in {time.perf_counter() - start:.1f}s ({summary})", file=sys.stderr)
+    return 0 if "error" not in counts else 1
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RAG Chatbot - interactive or batch question answering")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="Answer questions from FILE (.txt one per line, .json list or .jsonl) and exit")
+    parser.add_argument("--output", help="JSONL output path for --batch (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=None, help="Concurrent LLM calls for --batch")
+    parser.add_argument("--top-k", type=int, default=3, help="Chunks retrieved per question")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.batch:
+        sys.exit(run_batch(args.batch, args.output, args.concurrency, args.top_k))
     main()
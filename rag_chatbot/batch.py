@@ -0,0 +1,110 @@
+"""
+Batch question answering (answer keys for a whole past paper).
+
+All questions are retrieved together with ``retrieve_many`` and the LLM
+calls then run on a bounded thread pool; results are yielded as they
+complete so callers can stream them out as JSONL.
+
+Environment:
+    BATCH_CONCURRENCY=4        LLM calls in flight at once
+    BATCH_MAX_QUESTIONS=200    questions accepted per batch request
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import metrics
+from . import relevance
+from .chatbot import generate_answer
+from .llm_scheduler import PRIORITY_BATCH
+from .retrieval import retrieve_many
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "200"))
+
+
+def read_questions(path):
+    """Questions from a text file (one per line), a JSON list, or JSONL
+    records with a ``question`` field"""
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    if path.endswith(".json"):
+        items = json.loads(content)
+    elif path.endswith(".jsonl"):
+        items = [json.loads(line) for line in content.splitlines() if line.strip()]
+    else:
+        items = content.splitlines()
+    questions = []
+    for item in items:
+        question = item.get("question", "") if isinstance(item, dict) else str(item)
+        if question.strip():
+            questions.append(question.strip())
+    return questions
+
+
+def _source(result):
+    chunk = result["chunk"]
+    return {"file": result["file"], "chunk": chunk[:200] + "..." if len(chunk) > 200 else chunk,
+            "score": round(result["score"], 3)}
+
+
+def _answer_one(index, question, results):
+    results, outcome = relevance.gate(results, "batch")
+    if outcome == "skipped":
+        return {
+            "index": index,
+            "question": question,
+            "answer": relevance.NO_MATCH_ANSWER,
+            "sources": [],
+            "status": "no_match",
+        }
+    if not results:
+        return {
+            "index": index,
+            "question": question,
+            "answer": "I couldn't find relevant information in the uploaded documents.",
+            "sources": [],
+            "status": "no_results",
+        }
+    try:
+        answer = generate_answer(results, question, priority=PRIORITY_BATCH)
+        status = "success"
+    except Exception as e:
+        answer, status = f"Error generating answer: {e}", "error"
+    return {
+        "index": index,
+        "question": question,
+        "answer": answer,
+        "sources": [_source(r) for r in results],
+        "status": status,
+    }
+
+
+def answer_many(questions, top_k=3, concurrency=None):
+    """Yield one result dict per question, in completion order.
+
+    Each result carries the question's ``index`` so callers can restore the
+    original order.
+    """
+    questions = list(questions)
+    if not questions:
+        return
+    with metrics.timed("batch_retrieve"):
+        retrieved = retrieve_many(questions, top_k=top_k)
+    workers = max(1, min(concurrency or BATCH_CONCURRENCY, len(questions)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-answer") as pool:
+        futures = [
+            pool.submit(_answer_one, i, question, results)
+            for i, (question, results) in enumerate(zip(questions, retrieved))
+        ]
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                metrics.registry.inc("rag_batch_answers_total", help_text="Answers produced by batch runs",
+                                     status=result["status"])
+                yield result
+        finally:
+            # Consumer went away (e.g. client disconnected): skip unstarted calls
+            for future in futures:
+                future.cancel()
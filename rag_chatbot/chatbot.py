@@ -1,29 +1,55 @@
 import requests
+import contextvars
 import json
 import os
 from dotenv import load_dotenv
+from . import embeddings
+from . import llm_scheduler
+from . import metrics
+from .context import build_context
+from .extractive import extractive_answer
 
 # Load environment variables
 load_dotenv()
 
 # Groq API configuration (Best free option - 14,400 requests/day)
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")  # Set this in your .env file
 
 # Alternative: Hugging Face API (1,000 requests/month free)
-HF_API_URL = "https://api-inference.huggingface.co/models/microsoft/DialoGPT-large"
+HF_API_URL = os.getenv("HF_API_URL", "https://api-inference.huggingface.co/models/microsoft/DialoGPT-large")
 HF_API_TOKEN = os.getenv("HF_API_TOKEN")  # Alternative option
 
-def generate_answer_with_groq(retrieved_chunks, query):
+GROQ_MODEL = "llama-3.1-8b-instant"
+HF_MODEL = "microsoft/DialoGPT-large"
+
+# Which provider produced the answer being returned in this context
+_answered_by = contextvars.ContextVar("answered_by", default=None)
+
+def _record_provider(provider):
+    metrics.record_provider(provider)
+    _answered_by.set(provider)
+
+def _prepare_context(retrieved_chunks, query, model_name, provider):
+    """Merge, prune and budget the retrieved chunks for one provider's prompt"""
+    with metrics.timed("context_build"):
+        context, stats = build_context(retrieved_chunks, query, model_name, model=embeddings.model)
+    metrics.record_context_tokens(provider, stats["raw_tokens"], stats["context_tokens"])
+    return context
+
+def generate_answer_with_groq(retrieved_chunks, query, priority=llm_scheduler.PRIORITY_INTERACTIVE):
     """Generate answer using Groq API (free, fast, high quality)"""
     if not GROQ_API_KEY:
-        return generate_answer_with_hf(retrieved_chunks, query)
-    
-    # Prepare context from retrieved chunks
-    context = "\n\n".join([f"From {chunk['file']}:\n{chunk['chunk']}" for chunk in retrieved_chunks])
+        metrics.record_fallback("groq", "hf", "not_configured")
+        return generate_answer_with_hf(retrieved_chunks, query, priority)
     
-    # Create the prompt
-    prompt = f"""Based on the following context, please answer the question clearly and concisely.
+    try:
+        # Prepare context from retrieved chunks within the model's token budget
+        # (inside the try: an embedding or tokenizer failure falls back too)
+        context = _prepare_context(retrieved_chunks, query, GROQ_MODEL, "groq")
+        
+        # Create the prompt
+        prompt = f"""Based on the following context, please answer the question clearly and concisely.
 
 Context:
 {context}
@@ -31,78 +57,95 @@ Context:
 Question: {query}
 
 Answer:"""
-    
-    # Prepare the API request
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "model": "llama-3.1-8b-instant",  # Use 8B model (more reliable)
-        "max_tokens": 200,
-        "temperature": 0.7,
-        "top_p": 0.9,
-        "stream": False
-    }
-    
-    try:
-        response = requests.post(GROQ_API_URL, headers=headers, json=data, timeout=30)
+        
+        # Prepare the API request
+        headers = {
+            "Authorization": f"Bearer {GROQ_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "model": GROQ_MODEL,  # Use 8B model (more reliable)
+            "max_tokens": 200,
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "stream": False
+        }
+        
+        with llm_scheduler.slot("groq", priority) as shed:
+            if shed is not None:
+                metrics.record_fallback("groq", "hf", f"shed_{shed}")
+                return generate_answer_with_hf(retrieved_chunks, query, priority)
+            with metrics.timed("llm_groq"):
+                response = requests.post(GROQ_API_URL, headers=headers, json=data, timeout=30)
+        llm_scheduler.observe_limits("groq", response)
         
         if response.status_code != 200:
             print(f"Groq API error: {response.status_code} - {response.text}")
-            return generate_answer_with_hf(retrieved_chunks, query)
+            metrics.record_fallback("groq", "hf", f"http_{response.status_code}")
+            return generate_answer_with_hf(retrieved_chunks, query, priority)
         
         result = response.json()
         answer = result['choices'][0]['message']['content'].strip()
         
         if not answer:
-            return generate_answer_with_hf(retrieved_chunks, query)
+            metrics.record_fallback("groq", "hf", "empty_answer")
+            return generate_answer_with_hf(retrieved_chunks, query, priority)
         
+        _record_provider("groq")
         return answer
         
     except Exception as e:
         print(f"Groq API error: {e}")
-        return generate_answer_with_hf(retrieved_chunks, query)
+        metrics.record_fallback("groq", "hf", type(e).__name__)
+        return generate_answer_with_hf(retrieved_chunks, query, priority)
 
-def generate_answer_with_hf(retrieved_chunks, query):
+def generate_answer_with_hf(retrieved_chunks, query, priority=llm_scheduler.PRIORITY_INTERACTIVE):
     """Generate answer using Hugging Face API"""
     if not HF_API_TOKEN:
+        metrics.record_fallback("hf", "fallback", "not_configured")
         return generate_answer_improved_fallback(retrieved_chunks, query)
     
-    # Prepare context from retrieved chunks
-    context = "\n\n".join([f"From {chunk['file']}:\n{chunk['chunk']}" for chunk in retrieved_chunks])
-    
-    # Create the prompt
-    prompt = f"Context: {context}\n\nQuestion: {query}\n\nAnswer:"
-    
-    # Prepare the API request
-    headers = {
-        "Authorization": f"Bearer {HF_API_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "inputs": prompt,
-        "parameters": {
-            "max_new_tokens": 150,
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "return_full_text": False
-        }
-    }
-    
     try:
-        response = requests.post(HF_API_URL, headers=headers, json=data, timeout=30)
+        # Prepare context from retrieved chunks within the model's token budget
+        context = _prepare_context(retrieved_chunks, query, HF_MODEL, "hf")
+        
+        # Create the prompt
+        prompt = f"Context: {context}\n\nQuestion: {query}\n\nAnswer:"
+        
+        # Prepare the API request
+        headers = {
+            "Authorization": f"Bearer {HF_API_TOKEN}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": 150,
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "return_full_text": False
+            }
+        }
+        
+        with llm_scheduler.slot("hf", priority) as shed:
+            if shed is not None:
+                metrics.record_fallback("hf", "fallback", f"shed_{shed}")
+                return generate_answer_improved_fallback(retrieved_chunks, query)
+            with metrics.timed("llm_hf"):
+                response = requests.post(HF_API_URL, headers=headers, json=data, timeout=30)
+        llm_scheduler.observe_limits("hf", response)
         
         if response.status_code != 200:
             print(f"Hugging Face API error: {response.status_code} - {response.text}")
+            metrics.record_fallback("hf", "fallback", f"http_{response.status_code}")
             return generate_answer_improved_fallback(retrieved_chunks, query)
         
         result = response.json()
@@ -112,64 +155,39 @@ def generate_answer_with_hf(retrieved_chunks, query):
             answer = str(result).strip()
         
         if not answer or len(answer) < 10:
+            metrics.record_fallback("hf", "fallback", "empty_answer")
             return generate_answer_improved_fallback(retrieved_chunks, query)
         
+        _record_provider("hf")
         return answer
         
     except Exception as e:
         print(f"Hugging Face API error: {e}")
+        metrics.record_fallback("hf", "fallback", type(e).__name__)
         return generate_answer_improved_fallback(retrieved_chunks, query)
 
 def generate_answer_improved_fallback(retrieved_chunks, query):
     """Improved fallback method that creates better answers"""
+    _record_provider("fallback")
+    with metrics.timed("fallback_answer"):
+        return _build_fallback_answer(retrieved_chunks, query)
+
+def _build_fallback_answer(retrieved_chunks, query):
     if not retrieved_chunks:
         return "I couldn't find relevant information to answer your question."
     
-    # Combine all relevant chunks
-    all_text = " ".join([chunk['chunk'] for chunk in retrieved_chunks])
-    
-    # Look for key information about the query
-    query_lower = query.lower()
-    
-    # Extract relevant sentences
-    sentences = all_text.split('. ')
-    relevant_sentences = []
-    
-    for sentence in sentences:
-        sentence_lower = sentence.lower()
-        # Check if sentence contains query keywords
-        if any(keyword in sentence_lower for keyword in query_lower.split()):
-            relevant_sentences.append(sentence.strip())
-    
-    # If no direct matches, look for related terms
-    if not relevant_sentences:
-        related_terms = {
-            'parkinson': ['disease', 'pd', 'neurological', 'movement', 'disorder', 'symptoms'],
-            'disease': ['condition', 'illness', 'disorder', 'syndrome', 'medical'],
-            'detection': ['diagnosis', 'identification', 'recognition', 'analysis', 'prediction'],
-            'handwriting': ['writing', 'drawing', 'spiral', 'pattern', 'motor'],
-            'machine learning': ['ai', 'artificial intelligence', 'deep learning', 'neural network', 'algorithm']
-        }
-        
-        for keyword in query_lower.split():
-            if keyword in related_terms:
-                for term in related_terms[keyword]:
-                    for sentence in sentences:
-                        if term in sentence.lower():
-                            relevant_sentences.append(sentence.strip())
-                            break
+    # Reuse the embedding model only if it is already loaded; TF-IDF alone
+    # still gives a usable answer without paying a model load here
+    try:
+        sentences = extractive_answer(retrieved_chunks, query, model=embeddings.model)
+    except Exception as e:
+        print(f"Extractive answer error: {e}")
+        sentences = []
     
-    # Create a comprehensive answer
-    if relevant_sentences:
-        # Remove duplicates and limit length
-        unique_sentences = list(dict.fromkeys(relevant_sentences))[:3]
-        
+    if sentences:
         answer = f"Based on the research documents, here's what I found about {query}:\n\n"
-        for i, sentence in enumerate(unique_sentences, 1):
-            # Clean up the sentence
-            clean_sentence = sentence.replace('\n', ' ').strip()
-            if clean_sentence and len(clean_sentence) > 20:
-                answer += f"{i}. {clean_sentence}\n\n"
+        for i, sentence in enumerate(sentences, 1):
+            answer += f"{i}. {sentence}\n\n"
     else:
         # Fallback to first chunk with better formatting
         first_chunk = retrieved_chunks[0]['chunk']
@@ -181,12 +199,39 @@ def generate_answer_improved_fallback(retrieved_chunks, query):
     
     return answer.strip()
 
-def generate_answer(retrieved_chunks, query, max_new_tokens=80):
-    """Main function that tries Groq API first, then fallback"""
-    return generate_answer_with_groq(retrieved_chunks, query)
+def generate_answer(retrieved_chunks, query, max_new_tokens=80, priority=llm_scheduler.PRIORITY_INTERACTIVE):
+    """Main function that tries Groq API first, then fallback.
+
+    Identical concurrent requests share one answer, and each provider call
+    goes through that provider's limiter; a shed call moves on to the next
+    provider and finally to the local fallback answer.
+    """
+    return generate_answer_with_provider(retrieved_chunks, query, priority)[0]
+
+def generate_answer_with_provider(retrieved_chunks, query, priority=llm_scheduler.PRIORITY_INTERACTIVE):
+    """Like :func:`generate_answer`, returning ``(answer, provider)``.
+
+    ``provider`` is "groq" or "hf" for a remote answer and "fallback" when
+    the local extractive answer was used (no provider configured, every
+    provider failed or was shed by its limiter). Callers should not
+    cache fallback answers.
+    """
+    with metrics.timed("generate_answer"):
+        if not llm_scheduler.LLM_SCHEDULER or not (GROQ_API_KEY or HF_API_TOKEN):
+            return _answer_with_provider(retrieved_chunks, query, priority)
+        return llm_scheduler.coalesce(
+            llm_scheduler.request_key(retrieved_chunks, query),
+            lambda: _answer_with_provider(retrieved_chunks, query, priority),
+        )
+
+def _answer_with_provider(retrieved_chunks, query, priority=llm_scheduler.PRIORITY_INTERACTIVE):
+    # Coalesced callers share this tuple, so they learn the provider too
+    _answered_by.set(None)
+    answer = generate_answer_with_groq(retrieved_chunks, query, priority)
+    return answer, _answered_by.get() or "fallback"
 
 if __name__ == "__main__":
-    from retrieval import retrieve
+    from .retrieval import retrieve
     print("RAG Chatbot is ready! Type 'exit' to quit.")
     while True:
         query = input("\nEnter your question: ")
@@ -0,0 +1,129 @@
+"""
+Compressed vector representations for the FAISS index.
+
+Chunk vectors can be held in RAM as full float32 (``none``), float16
+(``fp16``), 8-bit scalar quantisation (``sq8``) or product quantisation
+(``pq``), optionally after a PCA projection to fewer dimensions. Approximate
+candidates are re-scored against the full-precision vectors, which are kept
+on disk and memory-mapped so they cost page cache rather than heap.
+
+Environment:
+    VECTOR_COMPRESSION=none|fp16|sq8|pq   in-memory representation
+    VECTOR_PCA_DIM=0                      project to this many dims first (0 = off)
+    VECTOR_PQ_M=0                         PQ sub-quantisers (0 = dim / 8)
+    VECTOR_RESCORE=4                      candidates fetched per result for exact
+                                          re-scoring (0 = off; unused for none)
+    VECTOR_STORE_DTYPE=float32|float16    dtype of vectors in the pickle snapshot
+"""
+
+import os
+
+import faiss
+import numpy as np
+
+COMPRESSION_MODES = ("none", "fp16", "sq8", "pq")
+
+VECTOR_COMPRESSION = os.getenv("VECTOR_COMPRESSION", "none").lower()
+VECTOR_PCA_DIM = int(os.getenv("VECTOR_PCA_DIM", "0"))
+VECTOR_PQ_M = int(os.getenv("VECTOR_PQ_M", "0"))
+VECTOR_RESCORE = int(os.getenv("VECTOR_RESCORE", "4"))
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32").lower()
+
+# PQ uses 256 centroids per sub-quantiser and FAISS wants ~39 training points
+# per centroid; below that we fall back to scalar quantisation.
+_MIN_PQ_TRAINING = 39 * 256
+
+
+def factory_string(dim, num_vectors, compression=None, pca_dim=None, pq_m=None):
+    """FAISS index_factory description for the requested compression"""
+    compression = (compression or VECTOR_COMPRESSION).lower()
+    pca_dim = VECTOR_PCA_DIM if pca_dim is None else pca_dim
+    pq_m = VECTOR_PQ_M if pq_m is None else pq_m
+    if compression not in COMPRESSION_MODES:
+        raise ValueError(f"Unknown VECTOR_COMPRESSION '{compression}', expected one of {COMPRESSION_MODES}")
+
+    prefix = ""
+    if pca_dim and pca_dim < dim:
+        if num_vectors >= pca_dim:
+            prefix = f"PCA{pca_dim},"
+            dim = pca_dim
+        else:
+            print(f"Not enough vectors ({num_vectors}) to train PCA{pca_dim}; skipping PCA")
+
+    if compression == "pq":
+        m = pq_m or max(1, dim // 8)
+        while dim % m:
+            m -= 1
+        if num_vectors < _MIN_PQ_TRAINING:
+            print(f"Not enough vectors ({num_vectors}) to train PQ; using sq8 instead")
+            compression = "sq8"
+        else:
+            return f"{prefix}PQ{m}"
+    body = {"none": "Flat", "fp16": "SQfp16", "sq8": "SQ8"}[compression]
+    return prefix + body
+
+
+def build_index(vectors, compression=None, pca_dim=None, pq_m=None):
+    """Train (if needed) and fill a FAISS L2 index over ``vectors``"""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    description = factory_string(vectors.shape[1], len(vectors), compression, pca_dim, pq_m)
+    index = faiss.index_factory(vectors.shape[1], description, faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index, description
+
+
+def _float_tables_bytes(*vectors):
+    return 4 * sum(v.size() for v in vectors)
+
+
+def index_memory_bytes(index):
+    """Approximate RAM held by the index: ntotal codes plus the trained
+    tables. Computed from the structure, since serialising the index to
+    measure it would briefly double its memory."""
+    index = faiss.downcast_index(index)
+    size = 0
+    if isinstance(index, faiss.IndexPreTransform):
+        for i in range(index.chain.size()):
+            transform = faiss.downcast_VectorTransform(index.chain.at(i))
+            if isinstance(transform, faiss.LinearTransform):
+                size += _float_tables_bytes(transform.A, transform.b)
+            if isinstance(transform, faiss.PCAMatrix):
+                size += _float_tables_bytes(transform.mean, transform.eigenvalues, transform.PCAMat)
+        index = faiss.downcast_index(index.index)
+    size += index.ntotal * index.sa_code_size()
+    if isinstance(index, faiss.IndexPQ):
+        size += _float_tables_bytes(index.pq.centroids)
+    elif isinstance(index, faiss.IndexScalarQuantizer):
+        size += _float_tables_bytes(index.sq.trained)
+    return int(size)
+
+
+def is_compressed(description):
+    return description != "Flat"
+
+
+def write_full_precision(vectors, path):
+    """Atomically write float32 vectors as .npy for memory-mapped re-scoring"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype="float32"))
+    os.replace(tmp_path, path)
+
+
+def open_full_precision(path):
+    return np.load(path, mmap_mode="r")
+
+
+def rescore(full_vectors, query_vector, candidates, top_k):
+    """Exact L2 re-ranking of candidate ids against memory-mapped vectors"""
+    candidates = candidates[candidates >= 0]
+    if len(candidates) == 0:
+        return candidates, np.zeros(0, dtype="float32")
+    # Sorted ids turn the fancy-index into mostly sequential page reads
+    candidates = np.unique(candidates)
+    diffs = np.asarray(full_vectors[candidates], dtype="float32") - query_vector
+    exact = np.einsum("ij,ij->i", diffs, diffs)
+    order = np.argsort(exact)[:top_k]
+    return candidates[order], exact[order]
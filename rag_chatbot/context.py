@@ -0,0 +1,189 @@
+"""
+Token-budgeted context assembly for LLM prompts.
+
+Retrieved chunks overlap heavily: ``split_text`` repeats 50 words between
+neighbours and top-k often returns adjacent chunks of one file. Before the
+prompt is built we:
+
+1. merge overlapping or adjacent chunks from the same file into passages,
+2. score sentences by relevance to the query (TF-IDF, blended with
+   embeddings when the model is already loaded),
+3. order passages by relevance and trim to a per-model token budget,
+   cutting the least relevant sentences only when the context does not fit.
+
+Merging is lossless. Dropping low-relevance sentences even when the context
+fits saves more tokens but loses facts phrased without the query's terms
+(benchmarks.context_eval: 44% fewer tokens but coverage 0.90 -> 0.87,
+against 11% fewer with coverage kept), so it is opt-in via CONTEXT_PRUNE.
+
+Environment:
+    CONTEXT_TOKEN_BUDGET=0        override the per-model budget (0 = use table)
+    CONTEXT_PRUNE=0               also drop low-relevance sentences that fit
+    CONTEXT_MIN_RELEVANCE=0.1     with pruning, drop sentences below this
+                                  fraction of the best
+"""
+
+import os
+
+import numpy as np
+
+from .extractive import SENTENCE_SPLIT, score_sentences
+
+# Prompt context budgets in (estimated) tokens, leaving room for the
+# instructions, question and answer within each model's window.
+MODEL_TOKEN_BUDGETS = {
+    "llama-3.1-8b-instant": 1200,
+    "microsoft/DialoGPT-large": 600,
+}
+DEFAULT_TOKEN_BUDGET = 1000
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+CONTEXT_PRUNE = os.getenv("CONTEXT_PRUNE", "0").lower() in ("1", "true", "yes")
+CONTEXT_MIN_RELEVANCE = float(os.getenv("CONTEXT_MIN_RELEVANCE", "0.1"))
+
+# Shortest word overlap treated as a real chunk seam rather than coincidence
+MIN_OVERLAP_WORDS = 8
+MAX_OVERLAP_WORDS = 200
+# Share of a sentence's relevance passed to neighbours 1, 2, ... sentences away
+NEIGHBOUR_WEIGHTS = (0.6, 0.35)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def token_budget(model_name=None):
+    if CONTEXT_TOKEN_BUDGET > 0:
+        return CONTEXT_TOKEN_BUDGET
+    return MODEL_TOKEN_BUDGETS.get(model_name, DEFAULT_TOKEN_BUDGET)
+
+
+def _overlap(left, right):
+    """Words at the end of ``left`` that repeat at the start of ``right``"""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_WORDS), MIN_OVERLAP_WORDS - 1, -1):
+        if left[-size:] == right[:size]:
+            return size
+    return 0
+
+
+def merge_chunks(retrieved_chunks):
+    """Merge chunks of the same file that overlap or contain one another.
+
+    Returns passages as dicts with ``file``, ``words`` and ``rank`` (the best
+    retrieval rank among the merged chunks).
+    """
+    passages = []
+    for rank, chunk in enumerate(retrieved_chunks):
+        words = chunk["chunk"].split()
+        candidate = {"file": chunk["file"], "words": words, "rank": rank}
+        merged = True
+        # A new chunk may bridge two existing passages, so merge to a fixpoint
+        while merged:
+            merged = False
+            for passage in passages:
+                if passage["file"] != candidate["file"]:
+                    continue
+                combined = _combine(passage["words"], candidate["words"])
+                if combined is not None:
+                    passages.remove(passage)
+                    candidate = {
+                        "file": candidate["file"],
+                        "words": combined,
+                        "rank": min(passage["rank"], candidate["rank"]),
+                    }
+                    merged = True
+                    break
+        passages.append(candidate)
+    return passages
+
+
+def _combine(first, second):
+    """Join two word lists that overlap (either order) or nest; else None"""
+    size = _overlap(first, second)
+    if size:
+        return first + second[size:]
+    size = _overlap(second, first)
+    if size:
+        return second + first[size:]
+    text_first, text_second = " ".join(first), " ".join(second)
+    if text_second in text_first:
+        return first
+    if text_first in text_second:
+        return second
+    return None
+
+
+def _smooth(relevance, owners):
+    """Let relevant sentences lend part of their score to their neighbours.
+
+    A sentence that continues a relevant one ("It also...", "Rigidity
+    refers to...") rarely repeats the query terms but is still needed.
+    """
+    smoothed = relevance.copy()
+    for distance, weight in enumerate(NEIGHBOUR_WEIGHTS, 1):
+        same_left = owners[distance:] == owners[:-distance]
+        smoothed[distance:] = np.maximum(smoothed[distance:], weight * relevance[:-distance] * same_left)
+        smoothed[:-distance] = np.maximum(smoothed[:-distance], weight * relevance[distance:] * same_left)
+    return smoothed
+
+
+def build_context(retrieved_chunks, query, model_name=None, budget=None, model=None, prune=None):
+    """Assemble a compact context string and report token savings.
+
+    Returns ``(context, stats)`` where stats has ``raw_tokens``,
+    ``context_tokens``, ``passages`` and ``sentences_dropped``. ``model`` is an
+    optional SentenceTransformer-style encoder blended into the relevance;
+    ``prune`` overrides CONTEXT_PRUNE.
+    """
+    raw_context = "\n\n".join(f"From {c['file']}:\n{c['chunk']}" for c in retrieved_chunks)
+    stats = {"raw_tokens": estimate_tokens(raw_context), "context_tokens": 0,
+             "passages": 0, "sentences_dropped": 0}
+    if not retrieved_chunks:
+        return "", stats
+    budget = budget or token_budget(model_name)
+
+    passages = merge_chunks(retrieved_chunks)
+    sentences, owners = [], []
+    for p, passage in enumerate(passages):
+        for sentence in SENTENCE_SPLIT.split(" ".join(passage["words"])):
+            if sentence.strip():
+                sentences.append(sentence.strip())
+                owners.append(p)
+    owners = np.array(owners)
+
+    relevance = _smooth(score_sentences(query, sentences, model)[0], owners)
+    if CONTEXT_PRUNE if prune is None else prune:
+        keep = relevance >= relevance.max() * CONTEXT_MIN_RELEVANCE
+    else:
+        keep = np.ones(len(sentences), dtype=bool)
+    if not keep.any():
+        # Nothing lexically related; keep everything and let the budget trim
+        keep[:] = True
+
+    # Spend the budget on the most relevant sentences first
+    costs = np.array([estimate_tokens(s) for s in sentences])
+    selected = np.zeros(len(sentences), dtype=bool)
+    used = 0
+    for i in np.argsort(-relevance, kind="stable"):
+        if keep[i] and (used + costs[i] <= budget or not selected.any()):
+            selected[i] = True
+            used += costs[i]
+    stats["sentences_dropped"] = int(len(sentences) - selected.sum())
+
+    # Passages ordered by their best sentence, then by retrieval rank;
+    # sentences stay in reading order within a passage
+    blocks = []
+    for p, passage in enumerate(passages):
+        mask = selected & (owners == p)
+        if not mask.any():
+            continue
+        score = float(relevance[owners == p].max())
+        text = " ".join(sentences[i] for i in np.flatnonzero(mask))
+        blocks.append((-score, passage["rank"], f"From {passage['file']}:\n{text}"))
+    blocks.sort(key=lambda block: (block[0], block[1]))
+
+    context = "\n\n".join(block[2] for block in blocks)
+    stats["context_tokens"] = estimate_tokens(context)
+    stats["passages"] = len(blocks)
+    return context, stats
@@ -0,0 +1,175 @@
+"""
+Local embedding worker shared by several serving processes.
+
+Each uvicorn worker otherwise loads its own copy of the embedding model.
+Run one embedding server instead and point the workers at it; they then
+send texts over a local socket and get vectors back.
+
+    export EMBEDDING_SERVER_KEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+    python -m rag_chatbot.embedding_server --address /run/user/$UID/rag-embed/embed.sock
+    EMBEDDING_SERVER=/run/user/$UID/rag-embed/embed.sock uvicorn main:app --workers 4
+
+The connection unpickles what it receives, so anyone who can connect and
+knows the key can run code in the server. The server therefore refuses to
+start without an explicit EMBEDDING_SERVER_KEY, only listens on loopback
+for TCP, and creates its Unix socket with mode 0600 inside a directory only
+its owner can enter.
+
+Environment:
+    EMBEDDING_SERVER=       Unix socket path or loopback host:port (empty = in-process model)
+    EMBEDDING_SERVER_KEY=   shared secret for the connection handshake (required)
+"""
+
+import argparse
+import os
+import stat
+import tempfile
+import threading
+from multiprocessing.connection import Client, Listener
+
+EMBEDDING_SERVER = os.getenv("EMBEDDING_SERVER", "")
+EMBEDDING_SERVER_KEY = os.getenv("EMBEDDING_SERVER_KEY", "").encode()
+
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+def default_address():
+    """Socket in a per-user directory: $XDG_RUNTIME_DIR or the temp dir"""
+    base = os.getenv("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(base, f"rag-embed-{os.getuid()}", "embed.sock")
+
+
+def parse_address(address):
+    """``/path/to.sock`` -> Unix socket; ``host:port`` -> TCP on loopback only"""
+    if ":" in address and not address.startswith("/"):
+        host, port = address.rsplit(":", 1)
+        host = host.strip("[]")
+        if host not in LOOPBACK_HOSTS:
+            raise ValueError(f"Embedding server only listens on loopback, not {host!r}")
+        return (host, int(port))
+    return address
+
+
+def _require_key(authkey):
+    if not authkey:
+        raise RuntimeError("EMBEDDING_SERVER_KEY must be set to a shared secret "
+                           "(e.g. python -c \"import secrets; print(secrets.token_hex(32))\")")
+    return authkey
+
+
+def _private_dir(directory):
+    """Create ``directory`` (0700) or check an existing one is ours alone"""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"{directory} must be a directory owned by this user with mode 0700")
+
+
+def _remove_stale_socket(address):
+    """Unlink a socket left by a previous run; never any other kind of file"""
+    try:
+        info = os.lstat(address)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(info.st_mode):
+        raise RuntimeError(f"{address} exists and is not a socket; refusing to replace it")
+    os.remove(address)
+
+
+class RemoteEncoder:
+    """SentenceTransformer-style ``encode`` backed by an embedding server"""
+
+    def __init__(self, address=None, authkey=None):
+        self.address = parse_address(address or EMBEDDING_SERVER)
+        self.authkey = _require_key(authkey or EMBEDDING_SERVER_KEY)
+        # Connections are not thread-safe; one per calling thread
+        self._local = threading.local()
+        self._dimension = None
+
+    def _call(self, request):
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = Client(self.address, authkey=self.authkey)
+            try:
+                conn.send(request)
+                status, payload = conn.recv()
+                break
+            except (EOFError, OSError):
+                # Server restarted; reconnect once
+                self._local.conn = None
+                if attempt:
+                    raise
+        if status != "ok":
+            raise RuntimeError(f"Embedding server error: {payload}")
+        return payload
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        kwargs.pop("show_progress_bar", None)
+        return self._call(("encode", sentences, dict(kwargs, batch_size=batch_size)))
+
+    def get_sentence_embedding_dimension(self):
+        if self._dimension is None:
+            self._dimension = self._call(("dimension", None, {}))
+        return self._dimension
+
+
+def _handle(conn, model):
+    with conn:
+        while True:
+            try:
+                op, payload, kwargs = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if op == "encode":
+                    result = model.encode(payload, **kwargs)
+                elif op == "dimension":
+                    result = model.get_sentence_embedding_dimension()
+                else:
+                    raise ValueError(f"unknown operation {op!r}")
+                conn.send(("ok", result))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def serve(address, authkey=None):
+    """Load the model once and answer encode requests until interrupted"""
+    # Import here so the server itself never tries to become a client
+    from .embeddings import load_local_model
+
+    authkey = _require_key(authkey or EMBEDDING_SERVER_KEY)
+    address = parse_address(address)
+    if isinstance(address, str):
+        _private_dir(os.path.dirname(os.path.abspath(address)))
+        _remove_stale_socket(address)
+    model = load_local_model()
+    # The socket file is created by bind(); make it 0600 from the start
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(address, authkey=authkey)
+    finally:
+        os.umask(umask)
+    with listener:
+        print(f"Embedding server listening on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                print(f"Embedding server rejected a connection: {e}")
+                continue
+            threading.Thread(target=_handle, args=(conn, model), daemon=True).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve embeddings to local worker processes")
+    parser.add_argument("--address", default=EMBEDDING_SERVER or default_address(),
+                        help="Unix socket path or loopback host:port")
+    args = parser.parse_args(argv)
+    serve(args.address)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,52 @@
 import os
 import pickle
-from sentence_transformers import SentenceTransformer
+import threading
 from .preprocessing import preprocess_documents
 from .ingestion import load_documents
+from .compression import VECTOR_STORE_DTYPE
 
-# Load the SentenceTransformer model
-model = SentenceTransformer('all-MiniLM-L6-v2')  # Lightweight and good for local use
+MODEL_NAME = 'all-MiniLM-L6-v2'  # Lightweight and good for local use
+
+# "torch" (SentenceTransformer) or "onnx" (ONNX Runtime, see onnx_embeddings)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "1").lower() in ("1", "true", "yes")
+
+# The embedding model is loaded lazily so importing this module (and the
+# backend) stays fast; the first caller pays the load cost once.
+model = None
+_model_lock = threading.Lock()
+
+def load_local_model():
+    """Load the configured backend in this process"""
+    if EMBEDDING_BACKEND == "onnx":
+        from .onnx_embeddings import load_onnx_encoder
+        return load_onnx_encoder(quantized=ONNX_QUANTIZE)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
+
+def get_model():
+    """Return the shared embedding model, loading it on first use"""
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                from .embedding_server import EMBEDDING_SERVER, RemoteEncoder
+                if EMBEDDING_SERVER:
+                    # Workers share one model hosted by embedding_server
+                    model = RemoteEncoder(EMBEDDING_SERVER)
+                    model.get_sentence_embedding_dimension()
+                else:
+                    model = load_local_model()
+    return model
 
 def create_embeddings(chunks, save_path="embeddings/vector_index.pkl"):
     vectors = []
     for chunk in chunks:
-        embedding = model.encode(chunk['chunk'])
+        embedding = get_model().encode(chunk['chunk'])
         vectors.append({
             "file": chunk["file"],
             "chunk": chunk["chunk"],
-            "vector": embedding
+            "vector": embedding.astype(VECTOR_STORE_DTYPE)
         })
     # Ensure directory exists
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
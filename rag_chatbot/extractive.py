@@ -0,0 +1,120 @@
+"""
+Local extractive answer engine.
+
+Used when no LLM provider is reachable. Every sentence of the retrieved
+chunks is scored against the query in one vectorised pass (cosine similarity
+of embeddings from the already-loaded model, blended with TF-IDF), then a
+non-redundant set is picked greedily within a word budget. Nothing touches
+the network and typical contexts answer in milliseconds.
+"""
+
+import re
+
+import numpy as np
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+
+MIN_SENTENCE_CHARS = 25
+MAX_SENTENCE_WORDS = 80
+DEFAULT_WORD_BUDGET = 120
+DEFAULT_MAX_SENTENCES = 4
+REDUNDANCY_THRESHOLD = 0.6
+# Sentences scoring below this fraction of the best one are never picked
+MIN_RELATIVE_SCORE = 0.3
+EMBEDDING_WEIGHT = 0.7
+
+
+def warm_up():
+    """Import scikit-learn ahead of time so the first fallback answer is fast"""
+    from sklearn.feature_extraction.text import TfidfVectorizer  # noqa: F401
+
+
+def split_sentences(text):
+    """Split chunk text into clean candidate sentences"""
+    sentences = []
+    for sentence in SENTENCE_SPLIT.split(text.replace("\n", " ")):
+        sentence = sentence.strip()
+        if len(sentence) < MIN_SENTENCE_CHARS:
+            continue
+        words = sentence.split()
+        if len(words) > MAX_SENTENCE_WORDS:
+            sentence = " ".join(words[:MAX_SENTENCE_WORDS]) + "..."
+        sentences.append(sentence)
+    return sentences
+
+
+def _tfidf_scores(query, sentences):
+    """Query-sentence and sentence-sentence TF-IDF cosine similarities"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True)
+    try:
+        matrix = vectorizer.fit_transform(sentences + [query])
+    except ValueError:
+        # Every token was a stop word
+        n = len(sentences)
+        return np.zeros(n, dtype="float32"), np.eye(n, dtype="float32")
+    # Rows are L2-normalised, so dot products are cosines
+    sentence_matrix = matrix[:-1]
+    query_scores = (sentence_matrix @ matrix[-1].T).toarray().ravel()
+    pairwise = (sentence_matrix @ sentence_matrix.T).toarray()
+    return query_scores.astype("float32"), pairwise.astype("float32")
+
+
+def _embedding_scores(query, sentences, model):
+    """Query-sentence and sentence-sentence embedding cosine similarities"""
+    vectors = np.asarray(model.encode([query] + sentences, batch_size=64), dtype="float32")
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    sentence_vectors = vectors[1:]
+    return sentence_vectors @ vectors[0], sentence_vectors @ sentence_vectors.T
+
+
+def score_sentences(query, sentences, model=None):
+    """Relevance of each sentence to the query plus a redundancy matrix"""
+    tfidf_query, tfidf_pairwise = _tfidf_scores(query, sentences)
+    if model is None:
+        return tfidf_query, tfidf_pairwise
+    emb_query, emb_pairwise = _embedding_scores(query, sentences, model)
+    relevance = EMBEDDING_WEIGHT * emb_query + (1.0 - EMBEDDING_WEIGHT) * tfidf_query
+    return relevance, np.maximum(emb_pairwise, tfidf_pairwise)
+
+
+def select_sentences(relevance, pairwise, lengths, word_budget=DEFAULT_WORD_BUDGET,
+                     max_sentences=DEFAULT_MAX_SENTENCES, redundancy=REDUNDANCY_THRESHOLD):
+    """Greedy pick by relevance, skipping near-duplicates, within a word budget"""
+    chosen = []
+    used = 0
+    floor = max(0.0, float(relevance.max()) * MIN_RELATIVE_SCORE)
+    blocked = relevance <= floor
+    for i in np.argsort(-relevance):
+        if len(chosen) >= max_sentences:
+            break
+        if blocked[i]:
+            continue
+        if chosen and used + lengths[i] > word_budget:
+            continue
+        chosen.append(int(i))
+        used += lengths[i]
+        blocked |= pairwise[i] >= redundancy
+    return chosen
+
+
+def extractive_answer(retrieved_chunks, query, model=None, word_budget=DEFAULT_WORD_BUDGET,
+                      max_sentences=DEFAULT_MAX_SENTENCES):
+    """Return the best non-redundant sentences for ``query`` in reading order.
+
+    ``model`` is any object with a SentenceTransformer-style ``encode``; when
+    it is None only TF-IDF is used.
+    """
+    sentences = []
+    for chunk in retrieved_chunks:
+        sentences.extend(split_sentences(chunk["chunk"]))
+    # Overlapping chunks repeat sentences verbatim
+    sentences = list(dict.fromkeys(sentences))
+    if not sentences:
+        return []
+
+    relevance, pairwise = score_sentences(query, sentences, model)
+    lengths = np.array([len(s.split()) for s in sentences])
+    chosen = select_sentences(relevance, pairwise, lengths, word_budget, max_sentences)
+    return [sentences[i] for i in sorted(chosen)]
@@ -0,0 +1,70 @@
+"""
+Coarse-to-fine retrieval over document-level vectors.
+
+Each file gets a summary vector: the normalised mean of its chunk vectors.
+Per-file vector sums are computed when the index is built (and published
+with shared generations), so the summaries only need correcting for
+deleted chunks and segments. With hierarchical retrieval on, a query first
+ranks the documents by cosine similarity to their summaries, then searches
+exactly over the chunks of the top RETRIEVAL_DOCS documents only. Work per
+query then scales with the size of those documents, not the library, and
+chunks from unrelated courses never compete.
+
+``python -m benchmarks.hierarchical_retrieval`` reports latency and
+recall@k against flat search for several RETRIEVAL_DOCS values.
+
+Environment:
+    RETRIEVAL_HIERARCHICAL=0   enable coarse-to-fine retrieval
+    RETRIEVAL_DOCS=8           documents expanded per query
+"""
+
+import os
+
+import faiss
+import numpy as np
+
+RETRIEVAL_HIERARCHICAL = os.getenv("RETRIEVAL_HIERARCHICAL", "0").lower() in ("1", "true", "yes")
+RETRIEVAL_DOCS = max(1, int(os.getenv("RETRIEVAL_DOCS", "8")))
+
+
+def enabled(hierarchical=None):
+    return RETRIEVAL_HIERARCHICAL if hierarchical is None else bool(hierarchical)
+
+
+def file_sums(vectors, codes, count, block=65536):
+    """Sum of the vectors of each file (``codes`` maps rows to files),
+    accumulated in blocks so memory-mapped vectors are never copied whole"""
+    sums = np.zeros((count, vectors.shape[1]), dtype="float64")
+    for start in range(0, len(vectors), block):
+        np.add.at(sums, np.asarray(codes[start:start + block]),
+                  np.asarray(vectors[start:start + block], dtype="float32"))
+    return sums.astype("float32")
+
+
+def document_index(sums, counts):
+    """Inner-product index over the normalised document centroids"""
+    centroids = np.asarray(sums, dtype="float32") / np.asarray(counts, dtype="float32")[:, None]
+    centroids = np.ascontiguousarray(centroids)
+    faiss.normalize_L2(centroids)
+    index = faiss.IndexFlatIP(centroids.shape[1])
+    index.add(centroids)
+    return index
+
+
+def top_documents(index, query_vectors, n):
+    """Ids of the ``n`` documents closest to each query (cosine)"""
+    queries = np.array(query_vectors, dtype="float32", ndmin=2)
+    faiss.normalize_L2(queries)
+    _, ids = index.search(queries, min(n, index.ntotal))
+    return ids
+
+
+def nearest(query_vector, vectors, rows, k):
+    """Exact top-``k`` (squared L2, like IndexFlatL2) among candidate ``rows``"""
+    distances = ((np.asarray(vectors, dtype="float32") - query_vector) ** 2).sum(axis=1)
+    if len(distances) > k:
+        top = np.argpartition(distances, k)[:k]
+    else:
+        top = np.arange(len(distances))
+    top = top[np.argsort(distances[top], kind="stable")]
+    return distances[top], np.asarray(rows)[top]
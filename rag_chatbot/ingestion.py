@@ -1,29 +1,45 @@
 import os
 from PyPDF2 import PdfReader
 
+def load_pdf(path):
+    pdf = PdfReader(path)
+    text = ""
+    for page in pdf.pages:
+        if page.extract_text():
+            text += page.extract_text()
+    return {"file": os.path.basename(path), "text": text}
+
 def load_pdfs(folder_path):
     documents = []
     for file in os.listdir(folder_path):
         if file.endswith(".pdf"):
-            path = os.path.join(folder_path, file)
-            pdf = PdfReader(path)
-            text = ""
-            for page in pdf.pages:
-                if page.extract_text():
-                    text += page.extract_text()
-            documents.append({"file": file, "text": text})
+            documents.append(load_pdf(os.path.join(folder_path, file)))
     return documents
 
+def load_text(path):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    return {"file": os.path.basename(path), "text": text}
+
 def load_txt(folder_path):
     documents = []
     for file in os.listdir(folder_path):
         if file.endswith(".txt"):
-            path = os.path.join(folder_path, file)
-            with open(path, "r", encoding="utf-8") as f:
-                text = f.read()
-            documents.append({"file": file, "text": text})
+            documents.append(load_text(os.path.join(folder_path, file)))
     return documents
 
+def load_document(path):
+    return load_pdf(path) if path.endswith(".pdf") else load_text(path)
+
+def document_paths(folders=("data/course_notes", "data/past_papers")):
+    """Paths of every file load_documents() reads"""
+    paths = []
+    for folder in folders:
+        if os.path.isdir(folder):
+            paths.extend(os.path.join(folder, file) for file in sorted(os.listdir(folder))
+                         if file.endswith((".pdf", ".txt")))
+    return paths
+
 def load_documents():
     notes = load_pdfs("data/course_notes") + load_txt("data/course_notes")
     papers = load_pdfs("data/past_papers") + load_txt("data/past_papers")
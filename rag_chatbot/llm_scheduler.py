@@ -0,0 +1,402 @@
+"""
+Admission control for LLM calls.
+
+Each provider (Groq, Hugging Face) has its own limiter that:
+
+- admits at most LLM_MAX_CONCURRENCY calls at once, paced by a token
+  bucket with the provider's rate and burst, and stops at the provider's
+  daily quota (per UTC day);
+- parks requests that cannot start yet in a bounded priority queue
+  (interactive before batch before background). When the queue is full,
+  the wait times out, or the daily quota is spent, the call is shed and
+  the answer falls through to the next provider, then to the local
+  extractive answer.
+
+A limiter is held only around its own provider's HTTP call, so Groq calls
+never spend Hugging Face's quota and a 429 with Retry-After pauses only the
+provider that sent it. On top of that, concurrent identical requests (same
+question, same chunks) are coalesced into one answer that every caller
+shares (:func:`coalesce`).
+
+Groq defaults match its free tier for llama-3.1-8b-instant (30 requests a
+minute, 14,400 a day). Hugging Face's free tier is 1,000 requests a month,
+so its default daily quota is that spread over 30 days.
+
+The daily counts are kept in LLM_QUOTA_FILE, one key per provider, under an
+flock, so every worker process draws on the same quotas and a restart does
+not reset them. Concurrency, the token buckets and the queues are per
+process; divide them by the number of workers.
+
+Environment:
+    LLM_SCHEDULER=1              enable admission control
+    LLM_MAX_CONCURRENCY=4        calls in flight per provider
+    LLM_RATE_PER_MINUTE=30       Groq token bucket refill rate
+    LLM_BURST=5                  Groq token bucket size
+    LLM_DAILY_QUOTA=14400        Groq calls per UTC day (0 = unlimited)
+    LLM_HF_RATE_PER_MINUTE=5     Hugging Face token bucket refill rate
+    LLM_HF_BURST=2               Hugging Face token bucket size
+    LLM_HF_DAILY_QUOTA=33        Hugging Face calls per UTC day (0 = unlimited)
+    LLM_QUOTA_FILE=embeddings/llm_quota.json
+                                 day's call counts shared by all workers
+                                 (empty = count in this process only)
+    LLM_QUEUE_SIZE=32            requests allowed to wait for a provider
+    LLM_QUEUE_TIMEOUT=20         seconds a request waits before shedding
+"""
+
+import contextlib
+import datetime
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: workers share the file without locking
+    fcntl = None
+
+LLM_SCHEDULER = os.getenv("LLM_SCHEDULER", "1").lower() in ("1", "true", "yes")
+LLM_MAX_CONCURRENCY = max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "4")))
+LLM_RATE_PER_MINUTE = float(os.getenv("LLM_RATE_PER_MINUTE", "30"))
+LLM_BURST = max(1.0, float(os.getenv("LLM_BURST", "5")))
+LLM_DAILY_QUOTA = int(os.getenv("LLM_DAILY_QUOTA", "14400"))
+LLM_HF_RATE_PER_MINUTE = float(os.getenv("LLM_HF_RATE_PER_MINUTE", "5"))
+LLM_HF_BURST = max(1.0, float(os.getenv("LLM_HF_BURST", "2")))
+LLM_HF_DAILY_QUOTA = int(os.getenv("LLM_HF_DAILY_QUOTA", "33"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "20"))
+LLM_QUOTA_FILE = os.getenv("LLM_QUOTA_FILE", "embeddings/llm_quota.json")
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_BACKGROUND = 2
+
+
+def _read_quota(f, day):
+    """The quota file's counts for ``day``; another day's counts are stale"""
+    f.seek(0)
+    try:
+        record = json.loads(f.read() or "{}")
+    except ValueError:
+        record = {}
+    return record if isinstance(record, dict) and record.get("day") == day else {"day": day}
+
+
+def shared_quota_used(path, key, day):
+    """Calls counted under ``key`` (a provider) in the quota file for
+    ``day`` (an ISO date)"""
+    try:
+        with open(path) as f:
+            return _read_quota(f, day).get(key, 0)
+    except FileNotFoundError:
+        return 0
+
+
+def take_shared_quota(path, key, day, quota):
+    """Count one call under ``key`` for ``day`` in the quota file unless
+    ``quota`` is spent. Returns ``(taken, used)`` with the count afterwards."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        record = _read_quota(f, day)
+        used = record.get(key, 0)
+        if used >= quota:
+            return False, used
+        used += 1
+        record[key] = used
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(record))
+        f.flush()
+        return True, used
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "shed")
+
+    def __init__(self, priority, seq):
+        self.priority = priority
+        self.seq = seq
+        self.shed = None
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Scheduler:
+    """One provider's concurrency slots, token bucket, daily quota and
+    bounded wait queue. ``name`` keys its count in the quota file."""
+
+    def __init__(self, name, max_concurrency=LLM_MAX_CONCURRENCY, rate_per_minute=LLM_RATE_PER_MINUTE,
+                 burst=LLM_BURST, daily_quota=LLM_DAILY_QUOTA, queue_size=LLM_QUEUE_SIZE,
+                 queue_timeout=LLM_QUEUE_TIMEOUT, quota_file=LLM_QUOTA_FILE):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.daily_quota = daily_quota
+        self.quota_file = quota_file
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._tokens = burst
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._day = None
+        self._used_today = 0
+        self._waiting = []
+        self._seq = itertools.count()
+
+    # ---- admission ----
+
+    def _refill(self, now):
+        if now > self._refilled:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+
+    def _roll_day(self):
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        if today != self._day:
+            self._day = today
+            self._used_today = 0
+            if self._shares_quota():
+                try:
+                    self._used_today = shared_quota_used(self.quota_file, self.name, today.isoformat())
+                except OSError as e:
+                    print(f"LLM quota file unreadable: {e}")
+
+    def _shares_quota(self):
+        return self.daily_quota > 0 and bool(self.quota_file)
+
+    def _count_call(self):
+        """Count an admitted call against today's quota; False if spent"""
+        if self._shares_quota():
+            try:
+                taken, self._used_today = take_shared_quota(
+                    self.quota_file, self.name, self._day.isoformat(), self.daily_quota)
+                return taken
+            except OSError as e:
+                print(f"LLM quota file unusable, counting in this process: {e}")
+        self._used_today += 1
+        return True
+
+    def _quota_left(self):
+        if self.daily_quota <= 0:
+            return None
+        return max(0, self.daily_quota - self._used_today)
+
+    def _try_start(self, now):
+        if self._active >= self.max_concurrency or now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens < 1.0:
+            return False
+        # Other workers may have spent the quota; the caller then sheds
+        if not self._count_call():
+            return False
+        self._tokens -= 1.0
+        self._active += 1
+        return True
+
+    def _next_token_in(self, now):
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._tokens >= 1.0 or self.rate <= 0:
+            return None
+        return (1.0 - self._tokens) / self.rate
+
+    def _remove(self, waiter):
+        self._waiting.remove(waiter)
+        heapq.heapify(self._waiting)
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Wait for a provider slot. Returns None once admitted (call
+        :meth:`release` afterwards) or the reason the request was shed."""
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        with self._cond:
+            self._roll_day()
+            if self._quota_left() == 0:
+                return "quota"
+            if not self._waiting and self._try_start(start):
+                self._publish()
+                return None
+            if self._quota_left() == 0:
+                return "quota"
+            if len(self._waiting) >= self.queue_size:
+                # Full: shed whichever request matters least, maybe this one
+                worst = max(self._waiting) if self._waiting else None
+                if worst is None or not (priority, float("inf")) < (worst.priority, worst.seq):
+                    return "queue_full"
+                self._remove(worst)
+                worst.shed = "queue_full"
+                self._cond.notify_all()
+            waiter = _Waiter(priority, next(self._seq))
+            heapq.heappush(self._waiting, waiter)
+            self._publish()
+            try:
+                deadline = start + timeout
+                while True:
+                    if waiter.shed is not None:
+                        return waiter.shed
+                    now = time.monotonic()
+                    self._roll_day()
+                    if self._quota_left() == 0:
+                        self._remove(waiter)
+                        return "quota"
+                    if self._waiting[0] is waiter and self._try_start(now):
+                        heapq.heappop(self._waiting)
+                        self._cond.notify_all()
+                        return None
+                    if now >= deadline:
+                        self._remove(waiter)
+                        self._cond.notify_all()
+                        return "timeout"
+                    wait = deadline - now
+                    next_token = self._next_token_in(now)
+                    if next_token is not None:
+                        wait = min(wait, next_token)
+                    self._cond.wait(wait)
+            finally:
+                metrics.registry.observe("rag_llm_queue_wait_seconds", time.monotonic() - start,
+                                         help_text="Time LLM requests waited for admission",
+                                         provider=self.name)
+                self._publish()
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+            self._publish()
+
+    def pause(self, seconds):
+        """Stop admitting for ``seconds`` (provider said Retry-After)"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # Refilling resumes once the pause is over
+            self._tokens = 0.0
+            self._refilled = self._paused_until
+
+    def _publish(self):
+        metrics.registry.set_gauge("rag_llm_in_flight", self._active,
+                                   help_text="LLM calls currently running", provider=self.name)
+        metrics.registry.set_gauge("rag_llm_queue_depth", len(self._waiting),
+                                   help_text="LLM requests waiting for admission", provider=self.name)
+        metrics.registry.set_gauge("rag_llm_quota_used", self._used_today,
+                                   help_text="LLM calls admitted today (UTC)", provider=self.name)
+        left = self._quota_left()
+        if left is not None:
+            metrics.registry.set_gauge("rag_llm_quota_remaining", left,
+                                       help_text="LLM calls left in today's quota (UTC)",
+                                       provider=self.name)
+
+    def stats(self):
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "in_flight": self._active,
+                "queued": len(self._waiting),
+                "tokens": round(self._tokens, 3),
+                "used_today": self._used_today,
+                "quota_remaining": self._quota_left(),
+            }
+
+
+limiters = {
+    "groq": Scheduler("groq"),
+    "hf": Scheduler("hf", rate_per_minute=LLM_HF_RATE_PER_MINUTE, burst=LLM_HF_BURST,
+                    daily_quota=LLM_HF_DAILY_QUOTA),
+}
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def slot(provider, priority=PRIORITY_INTERACTIVE):
+    """Hold ``provider``'s limiter around one call.
+
+    Yields None once admitted, or the reason the call was shed; the caller
+    then moves on to the next provider instead of calling this one.
+    """
+    limiter = limiters.get(provider)
+    if not LLM_SCHEDULER or limiter is None:
+        yield None
+        return
+    reason = limiter.acquire(priority)
+    if reason is not None:
+        metrics.registry.inc("rag_llm_requests_total", help_text="LLM requests by admission outcome",
+                             provider=provider, result="shed")
+        metrics.registry.inc("rag_llm_shed_total", help_text="LLM calls skipped by admission control",
+                             provider=provider, reason=reason)
+        yield reason
+        return
+    metrics.registry.inc("rag_llm_requests_total", help_text="LLM requests by admission outcome",
+                         provider=provider, result="admitted")
+    try:
+        yield None
+    finally:
+        limiter.release()
+
+
+def coalesce(key, call):
+    """Return ``call()``, sharing one call among concurrent runs with the
+    same ``key``"""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Future()
+    if not leader:
+        metrics.registry.inc("rag_llm_requests_total", help_text="LLM requests by admission outcome",
+                             result="coalesced")
+        return flight.result()
+
+    try:
+        result = call()
+    except BaseException as e:
+        flight.set_exception(e)
+        raise
+    else:
+        flight.set_result(result)
+        return result
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+
+
+def request_key(retrieved_chunks, query):
+    """Identity of an answer request: the question plus the chunks it cites"""
+    digest = hashlib.sha1(" ".join(query.lower().split()).encode("utf-8"))
+    for chunk in retrieved_chunks:
+        digest.update(b"\0")
+        digest.update(str(chunk.get("id") or chunk["chunk"]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def observe_limits(provider, response):
+    """Report provider rate-limit headers; a 429 pauses that provider only"""
+    headers = response.headers
+    for header, kind in (("x-ratelimit-remaining-requests", "requests"),
+                         ("x-ratelimit-remaining-tokens", "tokens")):
+        value = headers.get(header)
+        if value is not None and value.isdigit():
+            metrics.registry.set_gauge("rag_llm_provider_remaining", int(value),
+                                       help_text="Provider-reported rate limit remaining",
+                                       provider=provider, kind=kind)
+    limiter = limiters.get(provider)
+    if response.status_code == 429 and limiter is not None:
+        retry_after = headers.get("retry-after", "")
+        try:
+            seconds = float(retry_after)
+        except ValueError:
+            seconds = 1.0 / max(limiter.rate, 1.0 / 60.0)
+        limiter.pause(seconds)
@@ -0,0 +1,239 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Histograms, counters and gauges are kept in a thread-safe registry and
+rendered by ``render()`` for the backend's ``/metrics`` endpoint. Stage
+timings recorded with ``timed()`` also land in a per-request breakdown when
+a request has called ``start_request()``, which ``/chat`` and ``/ws`` return
+to clients that ask for it.
+"""
+
+import contextvars
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from . import tracing
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_HISTOGRAM = "rag_stage_duration_seconds"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Thread-safe store of counters, gauges and histograms keyed by labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types = {}
+        self._help = {}
+        self._values = {}
+        self._collectors = []
+
+    def _key(self, name, kind, help_text, labels):
+        self._types.setdefault(name, kind)
+        if help_text:
+            self._help.setdefault(name, help_text)
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1.0, help_text="", **labels):
+        with self._lock:
+            key = self._key(name, "counter", help_text, labels)
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_gauge(self, name, value, help_text="", **labels):
+        with self._lock:
+            key = self._key(name, "gauge", help_text, labels)
+            self._values[key] = float(value)
+
+    def observe(self, name, value, help_text="", buckets=DEFAULT_BUCKETS, **labels):
+        with self._lock:
+            key = self._key(name, "histogram", help_text, labels)
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def get(self, name, **labels):
+        """Current value of a counter/gauge (or histogram count), 0 if unset"""
+        with self._lock:
+            value = self._values.get((name, tuple(sorted(labels.items()))))
+        if isinstance(value, _Histogram):
+            return value.count
+        return value or 0.0
+
+    def register_collector(self, func):
+        """Call ``func()`` before every render, e.g. to refresh gauges"""
+        self._collectors.append(func)
+
+    def render(self):
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+
+        lines = []
+        with self._lock:
+            by_name = {}
+            for (name, labels), value in self._values.items():
+                by_name.setdefault(name, []).append((labels, value))
+            for name in sorted(by_name):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {self._types[name]}")
+                for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+                    if isinstance(value, _Histogram):
+                        cumulative = 0
+                        for bound, count in zip(value.buckets, value.counts):
+                            cumulative += count
+                            lines.append(f"{name}_bucket{_labels(labels, le=_num(bound))} {cumulative}")
+                        lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {value.count}")
+                        lines.append(f"{name}_sum{_labels(labels)} {_num(value.total)}")
+                        lines.append(f"{name}_count{_labels(labels)} {value.count}")
+                    else:
+                        lines.append(f"{name}{_labels(labels)} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _num(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+registry = Registry()
+
+# ------- Per-request timing breakdown -------
+_request_timings = contextvars.ContextVar("rag_request_timings", default=None)
+
+
+def start_request():
+    """Begin collecting a stage breakdown for the current request/task"""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def current_timings():
+    return _request_timings.get()
+
+
+def observe_stage(stage, seconds):
+    """Record a pipeline stage duration in the histogram and request breakdown"""
+    registry.observe(STAGE_HISTOGRAM, seconds, help_text="Duration of RAG pipeline stages", stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """Time a stage; it also becomes a span when the request is traced"""
+    start = time.perf_counter()
+    try:
+        with tracing.span(stage):
+            yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timings_ms(timings):
+    """Round a breakdown (seconds) to milliseconds for JSON responses"""
+    return {stage: round(seconds * 1000.0, 3) for stage, seconds in (timings or {}).items()}
+
+
+# ------- Convenience recorders used across the pipeline -------
+def record_provider(provider):
+    registry.inc("rag_answer_provider_total", help_text="Answers served per provider", provider=provider)
+    tracing.annotate(provider=provider)
+
+
+def record_fallback(source, target, reason):
+    registry.inc(
+        "rag_fallbacks_total", help_text="Provider fallbacks taken",
+        source=source, target=target, reason=reason
+    )
+
+
+def record_context_tokens(provider, raw_tokens, context_tokens):
+    registry.inc(
+        "rag_context_tokens_total", raw_tokens, help_text="Estimated prompt context tokens",
+        provider=provider, kind="raw"
+    )
+    registry.inc(
+        "rag_context_tokens_total", context_tokens, help_text="Estimated prompt context tokens",
+        provider=provider, kind="sent"
+    )
+    tracing.annotate(raw_tokens=raw_tokens, context_tokens=context_tokens)
+
+
+def record_cache(cache, hit):
+    registry.inc(
+        "rag_cache_requests_total", help_text="Cache lookups by result",
+        cache=cache, result="hit" if hit else "miss"
+    )
+
+
+def _peak_memory_bytes():
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def process_memory_bytes():
+    """Resident set size of this process in bytes (best effort)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return _peak_memory_bytes()
+
+
+def _collect_process():
+    registry.set_gauge("process_resident_memory_bytes", process_memory_bytes(),
+                       help_text="Resident memory size in bytes")
+    registry.set_gauge("process_peak_memory_bytes", _peak_memory_bytes(),
+                       help_text="Peak resident memory size in bytes")
+
+
+registry.register_collector(_collect_process)
+
+
+def render():
+    return registry.render()
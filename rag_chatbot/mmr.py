@@ -0,0 +1,84 @@
+"""
+Maximal-marginal-relevance (MMR) selection over over-fetched candidates.
+
+Consecutive chunks share 50 words, so plain top-k often returns three
+near-identical passages from one PDF. With MMR on, retrieval fetches
+``top_k * RETRIEVAL_MMR_FETCH`` candidates, reconstructs their vectors and
+greedily picks the one maximising
+
+    lambda * sim(query, c) - (1 - lambda) * max(sim(c, already picked))
+
+using one candidate-by-candidate similarity matrix; only the k picks loop.
+An optional per-file cap applies with or without MMR.
+
+Environment:
+    RETRIEVAL_MMR=0              enable MMR selection
+    RETRIEVAL_MMR_LAMBDA=0.7     1.0 = pure relevance, 0.0 = pure diversity
+    RETRIEVAL_MMR_FETCH=4        candidates fetched per result
+    RETRIEVAL_MAX_PER_FILE=0     at most this many results per file (0 = no cap)
+"""
+
+import os
+
+import numpy as np
+
+RETRIEVAL_MMR = os.getenv("RETRIEVAL_MMR", "0").lower() in ("1", "true", "yes")
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+RETRIEVAL_MMR_FETCH = max(1, int(os.getenv("RETRIEVAL_MMR_FETCH", "4")))
+RETRIEVAL_MAX_PER_FILE = int(os.getenv("RETRIEVAL_MAX_PER_FILE", "0"))
+
+
+def enabled(mmr=None, max_per_file=None):
+    """Whether retrieval needs the over-fetch + select path"""
+    mmr = RETRIEVAL_MMR if mmr is None else mmr
+    max_per_file = RETRIEVAL_MAX_PER_FILE if max_per_file is None else max_per_file
+    return bool(mmr) or max_per_file > 0
+
+
+def _normalise(vectors):
+    vectors = np.asarray(vectors, dtype="float32")
+    return vectors / np.clip(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12, None)
+
+
+def mmr_select(query_vector, candidate_vectors, top_k, lambda_=None, files=None, max_per_file=None):
+    """Indices (into the candidates) of a diverse top-k, in pick order.
+
+    Candidates are expected in relevance order; ``files`` (one per candidate)
+    enables the per-file cap.
+    """
+    lambda_ = RETRIEVAL_MMR_LAMBDA if lambda_ is None else lambda_
+    max_per_file = RETRIEVAL_MAX_PER_FILE if max_per_file is None else max_per_file
+    n = len(candidate_vectors)
+    if n == 0:
+        return []
+
+    candidates = _normalise(candidate_vectors)
+    relevance = candidates @ _normalise(query_vector)
+    similarity = candidates @ candidates.T
+
+    if files is not None and max_per_file > 0:
+        _, file_codes = np.unique(np.asarray(files, dtype=object), return_inverse=True)
+        file_counts = np.zeros(file_codes.max() + 1, dtype=np.int64)
+    else:
+        file_codes = None
+
+    available = np.ones(n, dtype=bool)
+    redundancy = np.full(n, -np.inf, dtype="float32")
+    picked = []
+    for _ in range(min(top_k, n)):
+        if picked:
+            score = lambda_ * relevance - (1.0 - lambda_) * redundancy
+        else:
+            score = relevance.copy()
+        if file_codes is not None:
+            available &= file_counts[file_codes] < max_per_file
+        score[~available] = -np.inf
+        best = int(np.argmax(score))
+        if not np.isfinite(score[best]):
+            break
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+        if file_codes is not None:
+            file_counts[file_codes[best]] += 1
+    return picked
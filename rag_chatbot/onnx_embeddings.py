@@ -0,0 +1,240 @@
+"""
+ONNX Runtime embedding backend for CPU-only serving.
+
+Exports the SentenceTransformer model (``all-MiniLM-L6-v2``) to ONNX once,
+optionally quantises it dynamically to int8, and serves it with ONNX Runtime
+behind the same ``encode()`` interface as SentenceTransformer. Serving needs
+only ``onnxruntime`` and ``tokenizers``, not torch.
+
+Select it with ``EMBEDDING_BACKEND=onnx`` (see ``embeddings.get_model``).
+
+Usage:
+    python -m rag_chatbot.onnx_embeddings export --quantize
+    python -m rag_chatbot.onnx_embeddings parity
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_ONNX_DIR = os.getenv("ONNX_MODEL_DIR", "embeddings/onnx")
+CONFIG_FILE = "onnx_config.json"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+
+
+class OnnxEncoder:
+    """Drop-in replacement for the parts of SentenceTransformer we use"""
+
+    def __init__(self, model_dir=DEFAULT_ONNX_DIR, quantized=True, num_threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        with open(model_dir / CONFIG_FILE) as f:
+            self.config = json.load(f)
+
+        model_path = model_dir / (QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+        if quantized and not model_path.exists():
+            print(f"Quantized ONNX model not found at {model_path}, using float32 model")
+            model_path = model_dir / MODEL_FILE
+        self.model_path = model_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config.get("pad_token_id", 0))
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dimension"]
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True,
+               normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype="float32")
+
+        # Sort by length so each batch pads to a similar size, then restore order
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        outputs = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype="float32")
+        for start in range(0, len(texts), batch_size):
+            batch_ids = order[start:start + batch_size]
+            outputs[batch_ids] = self._encode_batch([texts[i] for i in batch_ids])
+
+        if normalize_embeddings or self.config.get("normalize", False):
+            norms = np.linalg.norm(outputs, axis=1, keepdims=True)
+            outputs = outputs / np.clip(norms, 1e-12, None)
+        return outputs[0] if single else outputs
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype="int64")
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype="int64")
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens, as in SentenceTransformer
+        mask = attention_mask[:, :, None].astype("float32")
+        summed = (token_embeddings * mask).sum(axis=1)
+        return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+def export_onnx(model_name=None, output_dir=DEFAULT_ONNX_DIR, quantize=True, opset=14):
+    """Export a SentenceTransformer to ONNX (+ int8 copy); needs torch once"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from .embeddings import MODEL_NAME
+
+    model_name = model_name or MODEL_NAME
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    auto_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+    pooling = [m for m in st_model if type(m).__name__ == "Pooling"]
+    if pooling and not getattr(pooling[0], "pooling_mode_mean_tokens", True):
+        raise ValueError("Only mean-pooling SentenceTransformer models can be exported")
+
+    sample = tokenizer(["ONNX export sample sentence"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    class _Wrapper(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return self.model(**dict(zip(input_names, args))).last_hidden_state
+
+    model_path = output_dir / MODEL_FILE
+    export_kwargs = dict(
+        input_names=input_names,
+        output_names=["last_hidden_state"],
+        dynamic_axes=dynamic_axes,
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+    with torch.no_grad():
+        args = tuple(sample[name] for name in input_names)
+        try:
+            torch.onnx.export(_Wrapper(auto_model), args, str(model_path), dynamo=False, **export_kwargs)
+        except TypeError:
+            # torch < 2.5 has no dynamo switch and always uses the TorchScript exporter
+            torch.onnx.export(_Wrapper(auto_model), args, str(model_path), **export_kwargs)
+    print(f"Exported ONNX model to {model_path}")
+
+    if not getattr(tokenizer, "is_fast", False):
+        raise ValueError("A fast tokenizer (tokenizer.json) is required for ONNX serving")
+    tokenizer.backend_tokenizer.save(str(output_dir / "tokenizer.json"))
+
+    config = {
+        "model_name": model_name,
+        "dimension": st_model.get_sentence_embedding_dimension(),
+        "max_seq_length": st_model.max_seq_length,
+        "pad_token_id": tokenizer.pad_token_id or 0,
+        "normalize": any(type(m).__name__ == "Normalize" for m in st_model),
+        "pooling": "mean",
+    }
+    with open(output_dir / CONFIG_FILE, "w") as f:
+        json.dump(config, f, indent=2)
+
+    if quantize:
+        quantize_model(output_dir)
+    return output_dir
+
+
+def quantize_model(model_dir=DEFAULT_ONNX_DIR):
+    """Dynamic int8 quantisation of the exported float32 model"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model_dir = Path(model_dir)
+    source = model_dir / MODEL_FILE
+    target = model_dir / QUANTIZED_MODEL_FILE
+    quantize_dynamic(str(source), str(target), weight_type=QuantType.QInt8)
+    print(f"Quantized ONNX model written to {target} "
+          f"({source.stat().st_size / 1e6:.1f} MB -> {target.stat().st_size / 1e6:.1f} MB)")
+    return target
+
+
+def load_onnx_encoder(model_dir=DEFAULT_ONNX_DIR, quantized=True):
+    """Load the ONNX encoder, exporting the model first if it is missing"""
+    model_dir = Path(model_dir)
+    if not (model_dir / CONFIG_FILE).exists():
+        print(f"No ONNX model at {model_dir}; exporting (one-off, needs torch)...")
+        export_onnx(output_dir=model_dir, quantize=quantized)
+    return OnnxEncoder(model_dir, quantized=quantized)
+
+
+def check_parity(texts, encoder, reference):
+    """Compare encoder vectors with the reference (torch) vectors.
+
+    Returns min/mean cosine similarity and max absolute difference.
+    """
+    ours = np.asarray(encoder.encode(texts), dtype="float32")
+    theirs = np.asarray(reference.encode(texts), dtype="float32")
+    ours_n = ours / np.clip(np.linalg.norm(ours, axis=1, keepdims=True), 1e-12, None)
+    theirs_n = theirs / np.clip(np.linalg.norm(theirs, axis=1, keepdims=True), 1e-12, None)
+    cosine = (ours_n * theirs_n).sum(axis=1)
+    return {
+        "texts": len(texts),
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "max_abs_diff": float(np.abs(ours - theirs).max()),
+    }
+
+
+PARITY_SAMPLES = [
+    "What is Parkinson's disease?",
+    "How is Parkinson's disease detected from handwriting spirals?",
+    "Machine learning methods such as neural networks and random forests were compared.",
+    "The exam covers chapters three to five of the course notes.",
+    "Dopamine-producing neurons in the substantia nigra degenerate over time.",
+    "",
+    "short",
+    " ".join(["long input that exceeds the maximum sequence length"] * 80),
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and validate the ONNX embedding backend")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="Export the model to ONNX")
+    export_cmd.add_argument("--output", default=DEFAULT_ONNX_DIR)
+    export_cmd.add_argument("--model", default=None)
+    export_cmd.add_argument("--quantize", action="store_true", help="Also write an int8 model")
+    parity_cmd = sub.add_parser("parity", help="Compare ONNX vectors with the torch model")
+    parity_cmd.add_argument("--model-dir", default=DEFAULT_ONNX_DIR)
+    parity_cmd.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.model, args.output, args.quantize)
+    else:
+        from sentence_transformers import SentenceTransformer
+        with open(Path(args.model_dir) / CONFIG_FILE) as f:
+            reference = SentenceTransformer(json.load(f)["model_name"], device="cpu")
+        failed = False
+        for quantized in (False, True):
+            if quantized and not (Path(args.model_dir) / QUANTIZED_MODEL_FILE).exists():
+                continue
+            report = check_parity(PARITY_SAMPLES, OnnxEncoder(args.model_dir, quantized=quantized), reference)
+            label = "int8" if quantized else "float32"
+            print(f"{label}: {report}")
+            failed |= report["min_cosine"] < args.min_cosine
+        raise SystemExit(1 if failed else 0)
@@ -0,0 +1,136 @@
+"""
+Opt-in structured query log.
+
+Each /chat and /ws query is written as one JSON line: the query, retrieved
+chunk IDs, distances and scores, per-stage timings and the outcome. The log rotates
+by size and drives ``benchmarks/replay_queries.py`` (regression checks
+against the current index) and the startup cache warm-up from the most
+frequent queries.
+
+Queries are student text, so nothing is written unless QUERY_LOG=1.
+
+Environment:
+    QUERY_LOG=0                      enable logging
+    QUERY_LOG_PATH=logs/queries.jsonl
+    QUERY_LOG_MAX_MB=10              rotate after this size
+    QUERY_LOG_BACKUPS=5              rotated files kept
+    QUERY_LOG_WARM_TOP=0             warm caches with this many top queries at startup
+"""
+
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+
+QUERY_LOG = os.getenv("QUERY_LOG", "0").lower() in ("1", "true", "yes")
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "logs/queries.jsonl")
+QUERY_LOG_MAX_MB = float(os.getenv("QUERY_LOG_MAX_MB", "10"))
+QUERY_LOG_BACKUPS = int(os.getenv("QUERY_LOG_BACKUPS", "5"))
+QUERY_LOG_WARM_TOP = int(os.getenv("QUERY_LOG_WARM_TOP", "0"))
+
+_logger = None
+_record = contextvars.ContextVar("rag_query_log_record", default=None)
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        directory = os.path.dirname(QUERY_LOG_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        logger = logging.getLogger("rag.query_log")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = RotatingFileHandler(
+            QUERY_LOG_PATH, maxBytes=int(QUERY_LOG_MAX_MB * 1024 * 1024),
+            backupCount=QUERY_LOG_BACKUPS, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+def start():
+    """Begin collecting fields for the current query (no-op when disabled)"""
+    if QUERY_LOG:
+        _record.set({})
+
+
+def note(**fields):
+    """Attach fields (e.g. ``results=``, ``cached=``) to the current query"""
+    record = _record.get()
+    if record is not None:
+        record.update(fields)
+
+
+def write(endpoint, query, status, timings=None, total_seconds=None, top_k=3):
+    """Emit the current query as one JSON line"""
+    record = _record.get()
+    if record is None:
+        return
+    _record.set(None)
+    results = record.pop("results", None) or []
+    entry = {
+        "ts": round(time.time(), 3),
+        "endpoint": endpoint,
+        "query": query,
+        "top_k": top_k,
+        "status": status,
+        "cached": bool(record.pop("cached", False)),
+        "results": [
+            {"id": r.get("id"), "file": r["file"], "distance": round(float(r.get("distance", 0.0)), 6),
+             "score": round(float(r.get("score", 0.0)), 4)}
+            for r in results
+        ],
+        "timings_ms": {stage: round(seconds * 1000.0, 3) for stage, seconds in (timings or {}).items()},
+    }
+    if total_seconds is not None:
+        entry["total_ms"] = round(total_seconds * 1000.0, 3)
+    entry.update(record)
+    try:
+        _get_logger().info(json.dumps(entry, ensure_ascii=False))
+    except Exception as e:
+        print(f"Query log write failed: {e}")
+
+
+def log_files(path=None):
+    """The active log and its rotated backups, oldest first"""
+    path = path or QUERY_LOG_PATH
+    files = [f"{path}.{i}" for i in range(QUERY_LOG_BACKUPS, 0, -1)] + [path]
+    return [f for f in files if os.path.exists(f)]
+
+
+def read_entries(paths=None):
+    """Yield logged entries from ``paths`` (default: the log and backups)"""
+    for path in paths or log_files():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+
+
+def normalise(query):
+    return " ".join(query.lower().split())
+
+
+def top_queries(n, paths=None):
+    """The ``n`` most frequent queries, most recent wording of each"""
+    counts = Counter()
+    wording = {}
+    for entry in read_entries(paths):
+        query = entry.get("query", "")
+        if not query.strip():
+            continue
+        key = normalise(query)
+        counts[key] += 1
+        wording[key] = query
+    return [wording[key] for key, _ in counts.most_common(n)]
@@ -0,0 +1,85 @@
+"""
+Relevance gating between retrieval and the LLM.
+
+Every retrieved chunk carries a ``score``: the cosine similarity between the
+query and chunk vectors (1.0 = same meaning, around 0 = unrelated). It is
+computed from the vectors rather than the index's L2 distance, so it reads
+the same for flat, compressed and segmented indexes.
+
+:func:`gate` can make two cuts before an answer is generated:
+
+- if even the best chunk scores below RELEVANCE_MIN_SCORE, the question is
+  not covered by the documents. Callers reply with NO_MATCH_ANSWER and skip
+  the LLM (no quota, no 1-30 s wait);
+- otherwise only chunks that clear RELEVANCE_MIN_SCORE and are within
+  RELEVANCE_MARGIN of the best are kept. A marginal query therefore sends
+  one or two chunks instead of padding the prompt with noise.
+
+The thresholds have not been calibrated against real questions yet, so
+by default the gate only logs: results pass through untouched and the
+outcomes it would have taken are counted as would_skip / would_trim. Tune
+RELEVANCE_MIN_SCORE from ``rag_retrieval_top_score`` and those counts, then
+set RELEVANCE_GATE=1 to enforce it.
+
+Outcomes are counted in ``rag_relevance_total{endpoint,outcome}`` (answered,
+trimmed, skipped when enforcing); the skip rate is skipped / total.
+
+Environment:
+    RELEVANCE_GATE=log          log (default), 1 to enforce, 0 to turn off
+    RELEVANCE_MIN_SCORE=0.2     the best chunk must score at least this
+    RELEVANCE_MARGIN=0.15       keep chunks scoring within this of the best
+"""
+
+import os
+
+import numpy as np
+
+from . import metrics
+
+_gate_setting = os.getenv("RELEVANCE_GATE", "log").lower()
+RELEVANCE_GATE = ("on" if _gate_setting in ("1", "true", "yes", "on")
+                  else "log" if _gate_setting == "log" else "off")
+RELEVANCE_MIN_SCORE = float(os.getenv("RELEVANCE_MIN_SCORE", "0.2"))
+RELEVANCE_MARGIN = float(os.getenv("RELEVANCE_MARGIN", "0.15"))
+
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+NO_MATCH_ANSWER = (
+    "I couldn't find anything about this in your documents. "
+    "Try rephrasing the question, or upload material that covers it."
+)
+
+
+def cosine_scores(query_vector, vectors):
+    """Cosine similarity of ``query_vector`` with each row of ``vectors``"""
+    vectors = np.asarray(vectors, dtype="float32")
+    query = np.asarray(query_vector, dtype="float32").ravel()
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    return vectors @ query / np.clip(norms, 1e-12, None)
+
+
+def gate(results, endpoint):
+    """``(kept, outcome)`` for scored ``results`` (best first).
+
+    ``outcome`` is "skipped" when nothing clears the bar, "trimmed" when
+    some chunks were dropped and "answered" otherwise; None when gating is
+    off or there is nothing to gate. In log-only mode ``results`` come back
+    unchanged and the outcome is "would_skip" or "would_trim" instead.
+    """
+    if RELEVANCE_GATE == "off" or not results or "score" not in results[0]:
+        return results, None
+    best = max(r["score"] for r in results)
+    metrics.registry.observe("rag_retrieval_top_score", best, buckets=SCORE_BUCKETS,
+                             help_text="Similarity of the best retrieved chunk per query")
+    if best < RELEVANCE_MIN_SCORE:
+        kept, outcome = [], "skipped"
+    else:
+        floor = max(RELEVANCE_MIN_SCORE, best - RELEVANCE_MARGIN)
+        kept = [r for r in results if r["score"] >= floor]
+        outcome = "trimmed" if len(kept) < len(results) else "answered"
+    if RELEVANCE_GATE == "log":
+        kept = results
+        outcome = {"skipped": "would_skip", "trimmed": "would_trim"}.get(outcome, outcome)
+    metrics.registry.inc("rag_relevance_total", help_text="Queries by relevance gate outcome",
+                         endpoint=endpoint, outcome=outcome)
+    return kept, outcome
@@ -1,36 +1,768 @@
+import bisect
+import contextlib
+import os
 import pickle
-import numpy as np
+import threading
+import time
 import faiss
-from sentence_transformers import SentenceTransformer
+import numpy as np
+from .embeddings import get_model
+from . import compression
+from . import hierarchy
+from . import metrics
+from . import mmr
+from . import relevance
+from . import segments
+from . import shared_index
+from . import tracing
+
+INDEX_PATH = "embeddings/vector_index.pkl"
+
+# The FAISS index is built lazily (or explicitly via load_index) instead of
+# at import time. Everything a query needs lives in one dict that is swapped
+# atomically, so a reload never exposes a half-built index to readers.
+_state = None
+_load_lock = threading.Lock()
+# Bumped on every (re)load so caches keyed on index contents can tell
+# answers built from an older index apart
+_generation = 0
+# Serialises segment writes and manifest swaps (taken before _load_lock)
+_mutation_lock = threading.RLock()
+# One merge or compaction at a time (taken before _mutation_lock)
+_maintenance_lock = threading.Lock()
+
+def load_index(path=INDEX_PATH):
+    """(Re)load the saved embeddings and rebuild the FAISS index"""
+    if shared_index.RAG_SHARED_INDEX:
+        return _load_shared(path)
+    with _load_lock:
+        if not os.path.exists(path):
+            return _install(None)
+
+        stamp = shared_index.source_stamp(path)
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        return _install(_build_state(data, path, stamp))
+
+def _build_state(data, path, stamp, manifest=None):
+    """Local-mode state for the snapshot ``data`` with its segments on top"""
+    if not data:
+        return None
+
+    # Extract vectors and texts
+    vectors = np.array([item['vector'] for item in data]).astype('float32')
+    texts = [item['chunk'] for item in data]
+    files = [item['file'] for item in data]
+    del data
+    keys = np.array([segments.chunk_key(f, t) for f, t in zip(files, texts)], dtype="int64")
+    names, codes = _file_codes(files)
+    # Per-file sums for the document-level vectors (see hierarchy)
+    file_sums = dict(zip(names, hierarchy.file_sums(vectors, codes, len(names))))
+
+    index, description = compression.build_index(vectors)
+    full_vectors = None
+    if compression.is_compressed(description) and compression.VECTOR_RESCORE > 0:
+        # Keep exact vectors on disk only; re-scoring reads them via mmap
+        full_path = _full_precision_path(path)
+        compression.write_full_precision(vectors, full_path)
+        full_vectors = compression.open_full_precision(full_path)
+    del vectors
+
+    state = {
+        "index": index,
+        "texts": texts,
+        "files": files,
+        "full_vectors": full_vectors,
+        "keys": keys,
+        "file_rows": _rows_by_file(names, codes),
+        "file_sums": file_sums,
+        "path": path,
+        "base_stamp": stamp,
+    }
+    _set_memory_gauge(index)
+    print(f"FAISS index built with {index.ntotal} vectors ({description}).")
+    return _with_segments(state, manifest)
+
+def _install(state):
+    """Make ``state`` live (callers hold _load_lock); returns live vectors"""
+    global _state, _generation
+    _generation += 1
+    _state = state
+    live = state["live"] if state else 0
+    levels = state["segments"] if state else []
+    _set_index_gauge(live)
+    metrics.registry.set_gauge(
+        "rag_index_tombstones",
+        (state["dead_count"] + sum(level["dead_count"] for level in levels)) if state else 0,
+        help_text="Deleted or superseded chunks still stored until a merge or compaction"
+    )
+    metrics.registry.set_gauge("rag_index_segments", len(levels),
+                               help_text="Index segments on top of the snapshot")
+    metrics.registry.set_gauge(
+        "rag_index_segment_chunks", sum(len(level["records"]) - level["dead_count"] for level in levels),
+        help_text="Live chunks held in segments until compaction"
+    )
+    return live
+
+def _load_level(path, name):
+    """One immutable segment with an exact index over the chunks it adds"""
+    segment = segments.load_segment(path, name)
+    records = segment["added"]
+    index = vectors = None
+    if records:
+        vectors = np.ascontiguousarray([r["vector"] for r in records], dtype="float32")
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+    return {
+        "name": name,
+        "records": records,
+        "keys": np.array([r["id"] for r in records], dtype="int64"),
+        "deleted": np.array(segment["deleted"], dtype="int64"),
+        "size": segments.segment_size(segment),
+        "index": index,
+        "vectors": vectors,
+        "file_rows": _rows_by_file(*_file_codes([r["file"] for r in records])) if records else {},
+    }
+
+def _mask(keys, shadow):
+    """Rows of ``keys`` hidden by ``shadow`` (None when none are)"""
+    if not len(shadow) or not len(keys):
+        return None, 0
+    dead = np.isin(keys, shadow)
+    count = int(dead.sum())
+    return (dead if count else None), count
+
+def _with_segments(state, manifest=None, version=None, previous=None):
+    """``state`` with the manifest's segments layered on top.
+
+    A chunk ID deleted or re-added by a newer level is masked in every older
+    level, the snapshot included. Segments already loaded by ``previous``
+    (or ``state``) are reused instead of read again.
+    """
+    path = state["path"]
+    loaded = {level["name"]: level for level in (previous or state).get("segments", ())}
+    for attempt in range(3):
+        if manifest is None or attempt:
+            version = segments.manifest_version(path)
+            manifest = segments.read_manifest(path, state["base_stamp"]) or segments.empty_manifest(state["base_stamp"])
+        try:
+            levels = [loaded.get(name) or _load_level(path, name) for name in manifest["segments"]]
+            break
+        except FileNotFoundError:
+            # Merged away by another worker between reading and loading
+            if attempt == 2:
+                raise
+    if "file_rows" not in state:
+        state = dict(state, file_rows=_rows_by_file(*_file_codes(state["files"])))
+
+    shadow = np.empty(0, dtype="int64")
+    masked = []
+    for level in reversed(levels):
+        dead, dead_count = _mask(level["keys"], shadow)
+        masked.append(dict(level, dead=dead, dead_count=dead_count))
+        shadow = np.union1d(shadow, np.concatenate([level["deleted"], level["keys"]]))
+    masked.reverse()
+    dead, dead_count = _mask(state["keys"], shadow)
+
+    offset = live = state["index"].ntotal
+    for level in masked:
+        level["offset"] = offset
+        offset += len(level["records"])
+        live += len(level["records"]) - level["dead_count"]
+    return dict(
+        state,
+        manifest=manifest,
+        manifest_version=version,
+        segments=masked,
+        offsets=[level["offset"] for level in masked],
+        dead=dead,
+        dead_count=dead_count,
+        live=live - dead_count,
+        documents=None,
+    )
+
+def _file_codes(files):
+    """(distinct file names, per-row index into them)"""
+    if isinstance(files, shared_index.MappedFiles):
+        return files.codes()
+    return np.unique(np.asarray(files, dtype=object), return_inverse=True)
+
+def _rows_by_file(names, codes):
+    """File name -> rows holding its chunks"""
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+    return {name: order[bounds[i]:bounds[i + 1]] for i, name in enumerate(names)}
+
+def _load_shared(path):
+    """Shared mode: publish ``path`` if it is newer than CURRENT, then map CURRENT"""
+    root = os.path.dirname(path) or "."
+    if not os.path.exists(path) or not shared_index.is_published(root, path):
+        with shared_index.writer_lock(root):
+            # Another worker may have published while we waited for the lock
+            if not os.path.exists(path):
+                shared_index.clear(root)
+            elif not shared_index.is_published(root, path):
+                with open(path, "rb") as f:
+                    data = pickle.load(f)
+                if data:
+                    shared_index.publish(data, root, path)
+                else:
+                    shared_index.clear(root)
+    return _open_shared(root, path)
+
+def _open_shared(root, path):
+    """Map whichever generation CURRENT names into the live state"""
+    with _load_lock:
+        version = shared_index.pointer_version(root)
+        name = shared_index.current_generation(root)
+        if name is None:
+            return _install(None)
+        state = shared_index.open_generation(root, name)
+        state["root"] = root
+        state["path"] = path
+        state["pointer"] = version
+        state = _with_segments(state, previous=_state)
+        print(f"Mapped shared index generation {name} with {state['index'].ntotal} vectors ({state['description']}).")
+        _set_memory_gauge(state["index"])
+        return _install(state)
+
+def _refresh_shared(state):
+    """Pick up a generation or segments written by another worker (two stats per query)"""
+    if shared_index.pointer_version(state["root"]) != state["pointer"]:
+        _open_shared(state["root"], state["path"])
+    elif segments.manifest_version(state["path"]) != state["manifest_version"]:
+        version = segments.manifest_version(state["path"])
+        manifest = segments.read_manifest(state["path"], state["base_stamp"])
+        # None: the manifest already names the next generation, which is
+        # about to be published; keep serving this one until then
+        if manifest is not None:
+            with _load_lock:
+                if _state is state:
+                    with contextlib.suppress(FileNotFoundError):
+                        _install(_with_segments(state, manifest, version))
+    return _state
+
+def _set_memory_gauge(index):
+    # Memory-mapped vectors sit in the shared page cache, not this heap
+    size = 0 if isinstance(index, shared_index.MappedFlatIndex) else compression.index_memory_bytes(index)
+    metrics.registry.set_gauge(
+        "rag_index_memory_bytes", size,
+        help_text="Approximate RAM held by the FAISS index"
+    )
+
+def _full_precision_path(path):
+    return os.path.splitext(path)[0] + ".f32.npy"
+
+def _set_index_gauge(size):
+    metrics.registry.set_gauge("rag_index_vectors", size, help_text="Vectors in the loaded FAISS index")
+
+def index_size():
+    """Number of live vectors in the loaded index (0 when nothing is loaded)"""
+    state = _state
+    return state["live"] if state else 0
+
+def index_generation():
+    """Counter that changes whenever the index is reloaded or modified"""
+    return _generation
+
+def embed_query(query):
+    """Encode a query the way retrieve() does, so callers can reuse the vector"""
+    with metrics.timed("embed_query"):
+        return get_model().encode(query).astype('float32')
+
+def _current_state():
+    """Live index state, picking up new shared generations and loading lazily"""
+    state = _state
+    if state is not None and "pointer" in state:
+        state = _refresh_shared(state)
+    if state is None:
+        load_index()
+        state = _state
+    return state
+
+# ------- Segment writes, merging and compaction -------
+
+def _writer(path):
+    """Cross-worker writer lock in shared mode, a no-op otherwise"""
+    if shared_index.RAG_SHARED_INDEX:
+        return shared_index.writer_lock(os.path.dirname(path) or ".")
+    return contextlib.nullcontext()
+
+@contextlib.contextmanager
+def _mutating(path):
+    """Writer side of segment commits"""
+    with _writer(path), _mutation_lock:
+        yield
+
+def _live_rows(level, rows):
+    if level["dead"] is not None:
+        rows = rows[~level["dead"][rows]]
+    return rows
+
+def _live_keys(state, file):
+    """IDs of the chunks currently indexed for ``file``"""
+    keys = set()
+    for level in [state] + state["segments"]:
+        rows = level["file_rows"].get(file)
+        if rows is not None and len(rows):
+            keys.update(int(k) for k in level["keys"][_live_rows(level, rows)])
+    return keys
+
+def indexed_files():
+    """Names of the files with live chunks (None when nothing is indexed)"""
+    state = _current_state()
+    if state is None:
+        return None
+    return {file for level in [state] + state["segments"]
+            for file, rows in level["file_rows"].items() if len(_live_rows(level, rows))}
 
-# Load the model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+def _swap(state, manifest, previous=None):
+    """Make ``manifest`` current on disk and in memory (callers hold _mutation_lock)"""
+    segments.commit(state["path"], manifest)
+    with _load_lock:
+        _install(_with_segments(state, manifest, segments.manifest_version(state["path"]), previous))
 
-# Load the saved embeddings
-with open("embeddings/vector_index.pkl", "rb") as f:
-    data = pickle.load(f)
+def _commit(state, added, deleted):
+    """Write one segment for a change and make it live (callers hold _mutation_lock)"""
+    name = segments.write_segment(state["path"], added, deleted)
+    _swap(state, dict(state["manifest"], segments=state["manifest"]["segments"] + [name]))
+    for op, count in (("add", len(added)), ("delete", len(deleted))):
+        if count:
+            metrics.registry.inc("rag_index_changes_total", count,
+                                 help_text="Chunks added or deleted through index segments", op=op)
 
-# Extract vectors and texts
-vectors = np.array([item['vector'] for item in data]).astype('float32')
-texts = [item['chunk'] for item in data]
-files = [item['file'] for item in data]
+def update_files(replacements=None, deletions=(), path=INDEX_PATH, batch_size=64):
+    """Write one segment that makes each file in ``replacements`` hold
+    exactly its chunk texts and drops every chunk of ``deletions``.
 
-# Build the FAISS index
-index = faiss.IndexFlatL2(vectors.shape[1])
-index.add(vectors)
-print(f"FAISS index built with {index.ntotal} vectors.")
+    Unchanged chunks keep their IDs and vectors and only new ones are
+    embedded, so the write costs the size of the change. Returns counts, or
+    None when there is no snapshot yet (callers then rebuild from scratch).
+    """
+    replacements = replacements or {}
+    with _mutating(path):
+        state = _current_state()
+        if state is None:
+            return None
+        removed, new, kept = set(), [], 0
+        for file in deletions:
+            removed |= _live_keys(state, file)
+        for file, texts in replacements.items():
+            texts = list(dict.fromkeys(texts))
+            keys = [segments.chunk_key(file, text) for text in texts]
+            live = _live_keys(state, file)
+            removed |= live - set(keys)
+            kept += len(live & set(keys))
+            new.extend((key, file, text) for key, text in zip(keys, texts) if key not in live)
 
-def retrieve(query, top_k=3):
-    query_vector = model.encode(query).astype('float32')
-    distances, indices = index.search(np.expand_dims(query_vector, axis=0), top_k)
+        records = []
+        if new:
+            with metrics.timed("embed_chunks"):
+                vectors = get_model().encode([text for _, _, text in new], batch_size=batch_size)
+            records = [
+                {"id": key, "file": file, "chunk": text,
+                 "vector": np.asarray(vector).astype(compression.VECTOR_STORE_DTYPE)}
+                for (key, file, text), vector in zip(new, vectors)
+            ]
+        if records or removed:
+            _commit(state, records, removed)
+            print(f"Wrote index segment: {len(records)} chunks added, {len(removed)} removed, {kept} kept")
+        else:
+            # Nothing to write, but the manifest's mtime still records the run
+            _swap(state, state["manifest"])
+    return {"kept": kept, "added": len(records), "removed": len(removed)}
+
+def delete_file_chunks(file, path=INDEX_PATH):
+    """Delete every chunk of ``file``; returns how many were removed.
+
+    Costs one small segment write, whatever the corpus size.
+    """
+    counts = update_files(deletions=[file], path=path)
+    return counts["removed"] if counts else 0
+
+def replace_file_chunks(file, texts, path=INDEX_PATH, batch_size=64):
+    """Make ``file``'s indexed chunks exactly ``texts`` (see update_files)"""
+    return update_files({file: texts}, path=path, batch_size=batch_size)
+
+def _live_records(path, state):
+    """Snapshot records with ``state``'s segments applied, or None if the
+    snapshot on disk is no longer the one they were layered on"""
+    base = state["base_stamp"]
+    if not os.path.exists(path) or shared_index.source_stamp(path) != base:
+        return None
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+    if shared_index.source_stamp(path) != base:
+        return None
+    shadow = set()
+    for level in state["segments"]:
+        shadow.update(level["deleted"].tolist())
+        shadow.update(level["keys"].tolist())
+    if shadow:
+        data = [item for item in data if segments.chunk_key(item["file"], item["chunk"]) not in shadow]
+    for level in state["segments"]:
+        data.extend({"file": level["records"][row]["file"], "chunk": level["records"][row]["chunk"],
+                     "vector": level["records"][row]["vector"]}
+                    for row in _live_rows(level, np.arange(len(level["records"]))))
+    return data
+
+def live_records(path=INDEX_PATH):
+    """The records a compaction would write now (e.g. for an S3 backup)"""
+    for _ in range(3):
+        state = _current_state()
+        if state is None:
+            return []
+        records = _live_records(path, state)
+        if records is not None:
+            return records
+    raise RuntimeError("Index snapshot kept changing while reading it")
+
+def merge_segments(path=INDEX_PATH):
+    """Merge adjacent small segments until at most INDEX_MAX_SEGMENTS remain.
+
+    The merged segment is written without holding the mutation lock, then
+    swapped into the manifest in one rename; writes committed meanwhile only
+    append, so they stay on top. Returns the number of merges.
+    """
+    merges = 0
+    with _writer(path), _maintenance_lock:
+        while True:
+            with _mutation_lock:
+                state = _current_state()
+                if state is None:
+                    break
+                pick = segments.pick_merge([level["size"] for level in state["segments"]])
+                if pick is None:
+                    break
+                start, end = pick
+                run = [level["name"] for level in state["segments"][start:end]]
+                merged = segments.merge([
+                    {"added": level["records"], "deleted": level["deleted"].tolist()}
+                    for level in state["segments"][start:end]
+                ])
+            name = segments.write_segment(path, merged["added"], merged["deleted"])
+            with _mutation_lock:
+                current = _current_state()
+                names = current["manifest"]["segments"] if current else []
+                if current is None or current["base_stamp"] != state["base_stamp"] or names[start:end] != run:
+                    print("Index changed during segment merge; discarding result")
+                    if current is not None:
+                        segments.cleanup(path, current["manifest"])
+                    break
+                manifest = dict(current["manifest"], segments=names[:start] + [name] + names[end:])
+                _swap(current, manifest)
+                segments.cleanup(path, manifest)
+            merges += 1
+            metrics.registry.inc("rag_index_segment_merges_total", help_text="Adjacent index segments merged")
+            print(f"Merged segments {', '.join(run)} into {name}")
+    return merges
+
+def compact_index(path=INDEX_PATH, force=False):
+    """Fold every segment into a new snapshot.
+
+    Runs once segments pass INDEX_COMPACT_RATIO of the snapshot (or when
+    ``force``). The snapshot is rebuilt without holding the mutation lock, so
+    writes stay fast; segments committed meanwhile stay on top of the new
+    snapshot. In shared mode the cross-worker writer lock is held
+    throughout. Returns True when a new snapshot was installed.
+    """
+    shared = shared_index.RAG_SHARED_INDEX
+    with _writer(path), _maintenance_lock:
+        with _mutation_lock:
+            state = _current_state()
+            if state is None or not state["segments"]:
+                return False
+            changes = sum(level["size"] for level in state["segments"])
+            if not force and not segments.needs_compaction(changes, state["index"].ntotal):
+                return False
+            folded = list(state["manifest"]["segments"])
+
+        start = time.perf_counter()
+        tmp_path = f"{path}.compact.tmp"
+        try:
+            records = _live_records(path, state)
+            if records is None:
+                print("Index snapshot changed before compaction; skipping")
+                return False
+            if not records:
+                return False
+            with open(tmp_path, "wb") as f:
+                pickle.dump(records, f)
+                f.flush()
+                os.fsync(f.fileno())
+            stamp = shared_index.source_stamp(tmp_path)
+            built = None if shared else _build_state(records, path, stamp, segments.empty_manifest(stamp))
+            del records
+
+            with _mutation_lock:
+                current = _current_state()
+                names = current["manifest"]["segments"] if current else []
+                if (current is None or shared_index.source_stamp(path) != state["base_stamp"]
+                        or names[:len(folded)] != folded):
+                    print("Index snapshot replaced during compaction; discarding result")
+                    return False
+                manifest = dict(segments.empty_manifest(stamp), segments=names[len(folded):])
+                os.replace(tmp_path, path)
+                if shared:
+                    segments.commit(path, manifest)
+                    _load_shared(path)
+                else:
+                    _swap(built, manifest, previous=current)
+                segments.cleanup(path, manifest)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+
+    seconds = time.perf_counter() - start
+    metrics.registry.inc("rag_index_compactions_total", help_text="Index compactions completed")
+    metrics.registry.observe("rag_index_compaction_duration_seconds", seconds,
+                             help_text="Duration of index compactions")
+    print(f"Compacted index in {seconds:.2f}s ({len(folded)} segments, {changes} changes folded in)")
+    return True
+
+# ------- Search -------
+
+def _search_base(state, query_vectors, want):
+    full_vectors = state["full_vectors"]
+    fetch_k = want * compression.VECTOR_RESCORE if full_vectors is not None else want
+    with metrics.timed("faiss_search"):
+        distances, indices = state["index"].search(query_vectors, fetch_k)
+    if full_vectors is not None:
+        with metrics.timed("rescore"):
+            rescored = [compression.rescore(full_vectors, q, row, want) for q, row in zip(query_vectors, indices)]
+        indices = [ids for ids, _ in rescored]
+        distances = [exact for _, exact in rescored]
+    return list(distances), list(indices)
+
+def _drop_tombstoned(dead, distances, indices):
+    ids = np.asarray(indices)
+    keep = ids >= 0
+    keep[keep] = ~dead[ids[keep]]
+    return np.asarray(distances)[keep], ids[keep]
+
+def _search_live(search, level, query_vectors, pool):
+    """Top ``pool`` live rows of one level per query via ``search(q, k)``"""
+    dead = level["dead"]
+    # Masked rows rarely crowd the top hits, so over-fetch a little first
+    # and only go back for the worst case (every dead row ranking first)
+    want = pool if dead is None else min(pool * 2, pool + level["dead_count"])
+    distances, indices = search(query_vectors, want)
+    if dead is None:
+        return list(distances), list(indices)
+
+    with metrics.timed("tombstone_filter"):
+        filtered = [_drop_tombstoned(dead, d, i) for d, i in zip(distances, indices)]
+        worst = pool + level["dead_count"]
+        short = [q for q, (_, ids) in enumerate(filtered) if len(ids) < pool]
+        if short and want < min(worst, level["index"].ntotal):
+            retry_d, retry_i = search(query_vectors[short], worst)
+            for q, d, i in zip(short, retry_d, retry_i):
+                filtered[q] = _drop_tombstoned(dead, d, i)
+    return [d[:pool] for d, _ in filtered], [i[:pool] for _, i in filtered]
+
+def _documents(state):
+    """Document-level index for ``state``, built on first use: one centroid
+    per file over its live chunks, plus the ids of those chunks"""
+    documents = state["documents"]
+    if documents is not None:
+        return documents
+    sums = {name: np.asarray(total, dtype="float64") for name, total in state["file_sums"].items()}
+    rows = {}
+    dead = state["dead"]
+    for name, file_rows in state["file_rows"].items():
+        live = _live_rows(state, file_rows)
+        if dead is not None and len(live) < len(file_rows):
+            sums[name] = sums[name] - _candidate_vectors(state, file_rows[dead[file_rows]]).sum(axis=0)
+        rows[name] = [live]
+    for level in state["segments"]:
+        for name, file_rows in level["file_rows"].items():
+            live = _live_rows(level, file_rows)
+            sums[name] = sums.get(name, 0.0) + level["vectors"][live].sum(axis=0)
+            rows.setdefault(name, []).append(live + level["offset"])
+
+    names = [name for name, parts in rows.items() if sum(len(part) for part in parts)]
+    documents = {"names": names, "rows": [np.concatenate(rows[name]) for name in names], "index": None}
+    if names:
+        counts = [len(chunk_ids) for chunk_ids in documents["rows"]]
+        documents["index"] = hierarchy.document_index(np.array([sums[name] for name in names]), counts)
+    state["documents"] = documents
+    return documents
+
+def _search_documents(state, query_vectors, pool):
+    """Coarse-to-fine: the closest documents first, then an exact search
+    over only their chunks"""
+    documents = _documents(state)
+    with metrics.timed("document_search"):
+        picked = hierarchy.top_documents(documents["index"], query_vectors, hierarchy.RETRIEVAL_DOCS)
+    distances, indices = [], []
+    with metrics.timed("chunk_search"):
+        for query_vector, doc_ids in zip(query_vectors, picked):
+            rows = np.concatenate([documents["rows"][i] for i in doc_ids if i >= 0])
+            d, i = hierarchy.nearest(query_vector, _candidate_vectors(state, rows), rows, pool)
+            distances.append(d)
+            indices.append(i)
+    return distances, indices
+
+def _search(state, query_vectors, top_k, mmr_mode=None, max_per_file=None, hierarchical=None):
+    """One matrix search per level for all query rows (the snapshot
+    re-scored when compressed, then each segment), merged into one ranking
+    and diversified when MMR or a per-file cap is on. With hierarchical
+    retrieval only the chunks of the closest documents are searched.
+
+    Returns per-query (distances, ids) sequences; ids past the snapshot
+    refer to segment rows.
+    """
+    diversify = mmr.enabled(mmr_mode, max_per_file)
+    pool = top_k * mmr.RETRIEVAL_MMR_FETCH if diversify else top_k
+    if hierarchy.enabled(hierarchical) and len(_documents(state)["names"]) > hierarchy.RETRIEVAL_DOCS:
+        distances, indices = _search_documents(state, query_vectors, pool)
+        levels = []
+    else:
+        distances, indices = _search_live(lambda q, k: _search_base(state, q, k), state, query_vectors, pool)
+        levels = [level for level in state["segments"]
+                  if level["index"] is not None and level["dead_count"] < level["index"].ntotal]
+    if levels:
+        with metrics.timed("segment_search"):
+            hits = [
+                (level["offset"], _search_live(
+                    lambda q, k, index=level["index"]: index.search(q, min(k, index.ntotal)),
+                    level, query_vectors, pool))
+                for level in levels
+            ]
+        merged = []
+        for q in range(len(query_vectors)):
+            d = [np.asarray(distances[q])]
+            i = [np.asarray(indices[q])]
+            for offset, (level_d, level_i) in hits:
+                keep = np.asarray(level_i[q]) >= 0
+                d.append(np.asarray(level_d[q])[keep])
+                i.append(np.asarray(level_i[q])[keep] + offset)
+            d, i = np.concatenate(d), np.concatenate(i)
+            order = np.argsort(d, kind="stable")[:pool]
+            merged.append((d[order], i[order]))
+        distances = [d for d, _ in merged]
+        indices = [i for _, i in merged]
+
+    if diversify:
+        with metrics.timed("mmr"):
+            selected = [_diversify(state, q, ids, dists, top_k, mmr_mode, max_per_file)
+                        for q, ids, dists in zip(query_vectors, indices, distances)]
+        indices = [ids for ids, _ in selected]
+        distances = [dists for _, dists in selected]
+    return distances, indices
+
+def _level_row(state, idx):
+    """(segment, local row) for an id past the snapshot"""
+    level = state["segments"][bisect.bisect_right(state["offsets"], idx) - 1]
+    return level, idx - level["offset"]
+
+def _row_file(state, idx):
+    return _row(state, idx)[0]
+
+def _row(state, idx):
+    """(file, text) for a snapshot or segment row"""
+    if idx >= state["index"].ntotal:
+        level, row = _level_row(state, idx)
+        record = level["records"][row]
+        return record["file"], record["chunk"]
+    return state["files"][idx], state["texts"][idx]
+
+def _candidate_vectors(state, ids):
+    """Vectors for candidate ids: exact ones when on disk, else reconstructed"""
+    base = state["index"].ntotal
+    in_base = ids < base
+    vectors = np.empty((len(ids), state["index"].d), dtype="float32")
+    for pos in np.flatnonzero(~in_base):
+        level, row = _level_row(state, ids[pos])
+        vectors[pos] = level["vectors"][row]
+    if not in_base.any():
+        return vectors
+    base_ids = ids[in_base]
+    if state["full_vectors"] is not None:
+        vectors[in_base] = state["full_vectors"][base_ids]
+    elif isinstance(state["index"], shared_index.MappedFlatIndex):
+        vectors[in_base] = state["index"].vectors[base_ids]
+    else:
+        vectors[in_base] = state["index"].reconstruct_batch(base_ids.astype("int64"))
+    return vectors
+
+def _diversify(state, query_vector, ids, distances, top_k, mmr_mode=None, max_per_file=None):
+    ids = np.asarray(ids)
+    distances = np.asarray(distances)
+    keep = ids >= 0
+    ids, distances = ids[keep], distances[keep]
+    if len(ids) == 0:
+        return ids, distances
+    use_mmr = mmr.RETRIEVAL_MMR if mmr_mode is None else mmr_mode
+    vectors = _candidate_vectors(state, ids)
+    files = [_row_file(state, i) for i in ids]
+    picked = mmr.mmr_select(query_vector, vectors, top_k,
+                            lambda_=None if use_mmr else 1.0,
+                            files=files, max_per_file=max_per_file)
+    return ids[picked], distances[picked]
+
+def _results(state, indices, distances, query_vector):
+    ids = np.asarray(indices)
+    keep = ids >= 0
+    ids, distances = ids[keep], np.asarray(distances)[keep]
+    scores = relevance.cosine_scores(query_vector, _candidate_vectors(state, ids)) if len(ids) else []
     results = []
-    for idx in indices[0]:
+    for idx, distance, score in zip(ids, distances, scores):
+        file, text = _row(state, idx)
         results.append({
-            "file": files[idx],
-            "chunk": texts[idx]
+            "file": file,
+            "chunk": text,
+            "id": segments.format_key(segments.chunk_key(file, text)),
+            "distance": float(distance),
+            "score": float(score)
         })
     return results
 
+def retrieve(query, top_k=3, query_vector=None, mmr_mode=None, max_per_file=None, hierarchical=None):
+    """Top-k chunks for ``query``; ``mmr_mode``/``max_per_file``/``hierarchical``
+    override RETRIEVAL_MMR/RETRIEVAL_MAX_PER_FILE/RETRIEVAL_HIERARCHICAL for
+    this call.
+
+    Each result has file, chunk, id, distance and score (cosine similarity,
+    see relevance).
+    """
+    with tracing.span("retrieve", top_k=top_k):
+        state = _current_state()
+        if state is None:
+            return []
+
+        if query_vector is None:
+            query_vector = embed_query(query)
+        distances, indices = _search(state, np.expand_dims(query_vector, axis=0), top_k,
+                                     mmr_mode, max_per_file, hierarchical)
+        results = _results(state, indices[0], distances[0], query_vector)
+        tracing.annotate(
+            index_size=state["live"],
+            hits=[{"file": r["file"], "distance": round(r["distance"], 4), "score": round(r["score"], 4)}
+                  for r in results]
+        )
+        return results
+
+def retrieve_many(queries, top_k=3, batch_size=64, mmr_mode=None, max_per_file=None, hierarchical=None):
+    """Retrieve for many queries with batched encoding and one index search.
+
+    Returns one result list per query, in the same order.
+    """
+    queries = list(queries)
+    with tracing.span("retrieve_many", queries=len(queries), top_k=top_k):
+        if not queries:
+            return []
+        state = _current_state()
+        if state is None:
+            return [[] for _ in queries]
+
+        with metrics.timed("embed_query"):
+            query_vectors = np.asarray(get_model().encode(queries, batch_size=batch_size), dtype='float32')
+        distances, indices = _search(state, np.ascontiguousarray(query_vectors), top_k,
+                                     mmr_mode, max_per_file, hierarchical)
+        tracing.annotate(index_size=state["live"])
+        return [_results(state, ids, dists, qv) for ids, dists, qv in zip(indices, distances, query_vectors)]
+
 if __name__ == "__main__":
     while True:
         query = input("\nEnter your question (or 'exit' to quit): ")
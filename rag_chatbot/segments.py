@@ -0,0 +1,191 @@
+"""
+Append-only index segments on top of the embeddings snapshot.
+
+The snapshot (``embeddings/vector_index.pkl``) is the base level. Every
+indexing run after it (an upload, a delete, an incremental reindex) writes
+one new immutable segment holding only what changed: the chunks it adds and
+the IDs of chunks it removes.
+
+    embeddings/segments/MANIFEST.json   {"base": snapshot stamp, "segments": [...]}
+    embeddings/segments/<name>.pkl      {"added": [records], "deleted": [ids]}
+
+Chunk IDs are stable content hashes (:func:`chunk_key`). Results, the
+query log and the LLM scheduler show the same ID in hex
+(:func:`format_key`), so any ID a client sees is the one deletes and
+merges act on. Deletes and newer copies in a segment shadow the same IDs
+in older segments and the snapshot. Queries search every level and merge
+the top-k.
+
+Segment files and the manifest are written to a temporary name, fsynced
+and renamed, so an interrupted run leaves at most an unreferenced file
+behind and never touches existing segments. A manifest whose base stamp no
+longer matches the snapshot (after a full rebuild or a compaction) is
+ignored, and unreferenced files are removed by the next merge or
+compaction. The merger combines adjacent small segments whenever there are
+more than INDEX_MAX_SEGMENTS; compaction folds all of them into a new
+snapshot once they add up to INDEX_COMPACT_RATIO of it.
+
+Environment:
+    INDEX_MAX_SEGMENTS=8      merge adjacent segments above this count
+    INDEX_COMPACT_RATIO=0.2   fold segments into the snapshot once their
+                              adds + deletes reach this fraction of it
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import time
+
+INDEX_MAX_SEGMENTS = max(1, int(os.getenv("INDEX_MAX_SEGMENTS", "8")))
+INDEX_COMPACT_RATIO = float(os.getenv("INDEX_COMPACT_RATIO", "0.2"))
+
+SEGMENTS_DIR = "segments"
+MANIFEST_NAME = "MANIFEST.json"
+
+
+def chunk_key(file, text):
+    """Stable int64 chunk ID: the first 63 bits of sha1(file, text)"""
+    digest = hashlib.sha1(f"{file}\0{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") >> 1
+
+
+def format_key(key):
+    """Hex form of a chunk ID, as returned in results (``int(hex, 16) == key``)"""
+    return f"{key:016x}"
+
+
+def segments_dir(path):
+    return os.path.join(os.path.dirname(path) or ".", SEGMENTS_DIR)
+
+
+def _manifest_path(path):
+    return os.path.join(segments_dir(path), MANIFEST_NAME)
+
+
+def _segment_path(path, name):
+    return os.path.join(segments_dir(path), f"{name}.pkl")
+
+
+def _write_atomic(target, write):
+    tmp_path = f"{target}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, target)
+
+
+def empty_manifest(base):
+    return {"base": base, "segments": []}
+
+
+def read_manifest(path, base):
+    """Segments recorded against snapshot ``base``: empty when there is no
+    manifest, None when it belongs to another snapshot"""
+    try:
+        with open(_manifest_path(path)) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return empty_manifest(base)
+    if manifest.get("base") != base:
+        return None
+    return manifest
+
+
+def manifest_version(path):
+    """Cheap change token for the manifest (one stat, no read)"""
+    try:
+        stat = os.stat(_manifest_path(path))
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_ino)
+
+
+def manifest_mtime(path):
+    try:
+        return os.stat(_manifest_path(path)).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def write_segment(path, added=(), deleted=()):
+    """Durably write a new immutable segment; returns its name.
+
+    ``added`` records are dicts with id/file/chunk/vector.
+    """
+    directory = segments_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    # Names are never reused (workers cache loaded segments by name), and
+    # reserving one first keeps a concurrent merge from taking it
+    number = time.time_ns()
+    while True:
+        name = f"{number:x}"
+        try:
+            os.close(os.open(_segment_path(path, name), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            number += 1
+    segment = {"added": list(added), "deleted": sorted(set(deleted))}
+    _write_atomic(_segment_path(path, name), lambda f: pickle.dump(segment, f))
+    return name
+
+
+def load_segment(path, name):
+    with open(_segment_path(path, name), "rb") as f:
+        segment = pickle.load(f)
+    segment["name"] = name
+    return segment
+
+
+def segment_size(segment):
+    return len(segment["added"]) + len(segment["deleted"])
+
+
+def commit(path, manifest):
+    """Atomically make ``manifest`` current (callers hold the writer lock)"""
+    os.makedirs(segments_dir(path), exist_ok=True)
+    data = json.dumps({"base": manifest["base"], "segments": list(manifest["segments"])}).encode("utf-8")
+    _write_atomic(_manifest_path(path), lambda f: f.write(data))
+
+
+def cleanup(path, manifest):
+    """Remove segment files ``manifest`` does not reference: merged away,
+    folded into a snapshot, or left by an interrupted run. Only maintenance
+    calls this, while no other segment can be half-written."""
+    keep = {f"{name}.pkl" for name in manifest["segments"]} | {MANIFEST_NAME}
+    for entry in os.listdir(segments_dir(path)):
+        if entry not in keep:
+            try:
+                os.remove(os.path.join(segments_dir(path), entry))
+            except OSError:
+                pass
+
+
+def merge(segments):
+    """Combine consecutive segments (oldest first) into one equivalent
+    segment: the newest copy of each chunk, and every delete (they still
+    apply to the levels below)"""
+    added = {}
+    deleted = set()
+    for segment in segments:
+        for key in segment["deleted"]:
+            added.pop(key, None)
+        deleted.update(segment["deleted"])
+        for record in segment["added"]:
+            added[record["id"]] = record
+    return {"added": list(added.values()), "deleted": sorted(deleted)}
+
+
+def pick_merge(sizes):
+    """Adjacent run to merge to get back under INDEX_MAX_SEGMENTS: the pair
+    (start, end) with the smallest combined size, so small segments merge
+    into larger ones first. None when no merge is needed."""
+    if len(sizes) <= INDEX_MAX_SEGMENTS:
+        return None
+    best = min(range(len(sizes) - 1), key=lambda i: sizes[i] + sizes[i + 1])
+    return best, best + 2
+
+
+def needs_compaction(total_changes, base_rows):
+    return total_changes > 0 and total_changes >= INDEX_COMPACT_RATIO * max(base_rows, 1)
@@ -0,0 +1,145 @@
+"""
+Semantic answer cache.
+
+Paraphrases of a recent question ("what is PD?", "define Parkinson's
+disease") embed close together, so their answers can be reused without a
+retrieve + LLM round trip. Normalised query vectors live in a small FAISS
+inner-product index next to the cached answers and sources; a lookup hits
+when the nearest stored query is within the cosine threshold and was
+answered against the currently loaded index generation.
+
+Callers read :func:`index_generation` before retrieving and pass it to
+:func:`store`; an answer is dropped if the index changed (an upload or a
+delete) while it was being generated, since it was built from the old one.
+The cache is off by default.
+
+Environment:
+    SEMANTIC_CACHE=0                   enable the cache
+    SEMANTIC_CACHE_THRESHOLD=0.9       minimum cosine similarity for a hit
+    SEMANTIC_CACHE_SIZE=1000           entries kept (least recently used evicted)
+    SEMANTIC_CACHE_TTL=3600            seconds an entry stays valid (0 = forever)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+from . import metrics
+from . import tracing
+from .retrieval import index_generation
+
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "0").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+
+_lock = threading.Lock()
+_index = None
+_entries = OrderedDict()  # id -> entry, oldest use first
+_next_id = 0
+_generation = None
+
+
+def _normalise(vector):
+    vector = np.asarray(vector, dtype="float32").reshape(1, -1).copy()
+    faiss.normalize_L2(vector)
+    return vector
+
+
+def _reset(dim=None, generation=None):
+    """Drop every entry; callers hold ``_lock``"""
+    global _index, _generation
+    _entries.clear()
+    _index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim)) if dim else None
+    _generation = generation
+    _set_size_gauge()
+
+
+def _set_size_gauge():
+    metrics.registry.set_gauge("rag_semantic_cache_entries", len(_entries),
+                               help_text="Answers held in the semantic cache")
+
+
+def _evict(ids):
+    """Remove entries by id; callers hold ``_lock``"""
+    for entry_id in ids:
+        _entries.pop(entry_id, None)
+    if ids:
+        _index.remove_ids(np.array(ids, dtype="int64"))
+
+
+def lookup(query_vector):
+    """Return the cached response for a near-identical query, or None"""
+    if not SEMANTIC_CACHE:
+        return None
+    vector = _normalise(query_vector)
+    with _lock:
+        if _generation != index_generation() or _index is None or not _entries:
+            hit = None
+        else:
+            scores, ids = _index.search(vector, 1)
+            entry_id, score = int(ids[0][0]), float(scores[0][0])
+            entry = _entries.get(entry_id)
+            if entry is not None and SEMANTIC_CACHE_TTL and time.time() - entry["created"] > SEMANTIC_CACHE_TTL:
+                _evict([entry_id])
+                _set_size_gauge()
+                entry = None
+            hit = entry if entry is not None and score >= SEMANTIC_CACHE_THRESHOLD else None
+            if hit is not None:
+                _entries.move_to_end(entry_id)
+                hit["hits"] += 1
+    metrics.record_cache("semantic", hit is not None)
+    if hit is None:
+        return None
+    tracing.annotate(cache="semantic", cached_query=hit["query"], similarity=round(score, 4))
+    return hit["response"]
+
+
+def store(query, query_vector, response, generation):
+    """Cache ``response`` (a JSON-serialisable dict) for ``query``.
+
+    ``generation`` is :func:`index_generation` as read before retrieval;
+    the answer is dropped when the index has changed since.
+    """
+    global _next_id
+    if not SEMANTIC_CACHE or SEMANTIC_CACHE_SIZE <= 0:
+        return
+    vector = _normalise(query_vector)
+    with _lock:
+        if generation != index_generation():
+            return
+        if _index is None or _generation != generation or _index.d != vector.shape[1]:
+            _reset(vector.shape[1], generation)
+        # A paraphrase that still missed (e.g. expired) replaces its neighbour
+        if _entries:
+            scores, ids = _index.search(vector, 1)
+            if float(scores[0][0]) >= SEMANTIC_CACHE_THRESHOLD:
+                _evict([int(ids[0][0])])
+        overflow = len(_entries) - SEMANTIC_CACHE_SIZE + 1
+        if overflow > 0:
+            _evict(list(_entries)[:overflow])
+        entry_id = _next_id
+        _next_id += 1
+        _index.add_with_ids(vector, np.array([entry_id], dtype="int64"))
+        _entries[entry_id] = {"query": query, "response": dict(response), "created": time.time(), "hits": 0}
+        _set_size_gauge()
+
+
+def clear():
+    with _lock:
+        _reset()
+
+
+def stats():
+    """Entry count and per-entry hit totals, for diagnostics"""
+    with _lock:
+        return {
+            "enabled": SEMANTIC_CACHE,
+            "entries": len(_entries),
+            "generation": _generation,
+            "hits": sum(entry["hits"] for entry in _entries.values()),
+        }
@@ -0,0 +1,275 @@
+"""
+Shared, memory-mapped vector store for multi-worker serving.
+
+With several uvicorn workers each process used to unpickle every vector and
+chunk text. In shared mode the pickle snapshot is published once into an
+immutable generation directory that all workers memory-map read-only, so
+the vectors and texts live in the page cache a single time:
+
+    embeddings/generations/<n>/vectors.f32.npy   float32 vectors
+    embeddings/generations/<n>/texts.bin         UTF-8 chunk texts, concatenated
+    embeddings/generations/<n>/offsets.npy       text boundaries (len + 1)
+    embeddings/generations/<n>/file_ids.npy      index into files.json per chunk
+    embeddings/generations/<n>/files.json        distinct file names
+    embeddings/generations/<n>/keys.npy          stable chunk IDs (segments.chunk_key)
+    embeddings/generations/<n>/file_sums.npy     per-file vector sums (hierarchy)
+    embeddings/generations/<n>/index.faiss       compressed index (if any)
+    embeddings/generations/<n>/meta.json         source snapshot stamp, description
+    embeddings/CURRENT                           name of the live generation
+
+Only the holder of ``embeddings/.writer.lock`` publishes; ``CURRENT`` is
+replaced atomically so readers switch generations by re-opening it.
+
+Environment:
+    RAG_SHARED_INDEX=1          enable shared mode
+    RAG_KEEP_GENERATIONS=2      generations kept on disk (older ones pruned)
+"""
+
+import contextlib
+import json
+import os
+import shutil
+import threading
+
+import faiss
+import numpy as np
+
+from . import compression
+from . import hierarchy
+from . import segments
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process serialisation
+    fcntl = None
+
+RAG_SHARED_INDEX = os.getenv("RAG_SHARED_INDEX", "0").lower() in ("1", "true", "yes")
+RAG_KEEP_GENERATIONS = max(1, int(os.getenv("RAG_KEEP_GENERATIONS", "2")))
+
+POINTER_NAME = "CURRENT"
+LOCK_NAME = ".writer.lock"
+GENERATIONS_DIR = "generations"
+
+# flock is per open file, so nested use within one process must not reopen it
+_writer_lock = threading.RLock()
+_writer_depth = 0
+_writer_file = None
+
+
+@contextlib.contextmanager
+def writer_lock(root):
+    """Exclusive, process-reentrant lock held while rebuilding or publishing"""
+    global _writer_depth, _writer_file
+    with _writer_lock:
+        if _writer_depth == 0:
+            os.makedirs(root, exist_ok=True)
+            _writer_file = open(os.path.join(root, LOCK_NAME), "a+")
+            if fcntl is not None:
+                fcntl.flock(_writer_file.fileno(), fcntl.LOCK_EX)
+        _writer_depth += 1
+        try:
+            yield
+        finally:
+            _writer_depth -= 1
+            if _writer_depth == 0:
+                if fcntl is not None:
+                    fcntl.flock(_writer_file.fileno(), fcntl.LOCK_UN)
+                _writer_file.close()
+                _writer_file = None
+
+
+def source_stamp(path):
+    """Identity of a pickle snapshot, used to tell whether it was published"""
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _pointer_path(root):
+    return os.path.join(root, POINTER_NAME)
+
+
+def current_generation(root):
+    try:
+        with open(_pointer_path(root)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def pointer_version(root):
+    """Cheap change token for ``CURRENT`` (one stat, no read)"""
+    try:
+        stat = os.stat(_pointer_path(root))
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_ino)
+
+
+def read_meta(root, name):
+    try:
+        with open(os.path.join(root, GENERATIONS_DIR, name, "meta.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, TypeError, ValueError):
+        return None
+
+
+def is_published(root, source_path):
+    """True when CURRENT was built from the snapshot at ``source_path``"""
+    meta = read_meta(root, current_generation(root))
+    return meta is not None and meta.get("source") == source_stamp(source_path)
+
+
+def publish(data, root, source_path):
+    """Write ``data`` (the pickle's list of dicts) as a new generation and
+    point CURRENT at it. Callers hold :func:`writer_lock`."""
+    generations = os.path.join(root, GENERATIONS_DIR)
+    os.makedirs(generations, exist_ok=True)
+    existing = [int(n) for n in os.listdir(generations) if n.isdigit()]
+    name = f"{max(existing, default=0) + 1:06d}"
+    target = os.path.join(generations, name)
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    vectors = np.ascontiguousarray([item["vector"] for item in data], dtype="float32")
+    np.save(os.path.join(staging, "vectors.f32.npy"), vectors)
+
+    encoded = [item["chunk"].encode("utf-8") for item in data]
+    offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+    with open(os.path.join(staging, "texts.bin"), "wb") as f:
+        for text in encoded:
+            f.write(text)
+    np.save(os.path.join(staging, "offsets.npy"), offsets)
+
+    files = list(dict.fromkeys(item["file"] for item in data))
+    file_ids = {file: i for i, file in enumerate(files)}
+    np.save(os.path.join(staging, "file_ids.npy"),
+            np.array([file_ids[item["file"]] for item in data], dtype="int32"))
+    with open(os.path.join(staging, "files.json"), "w") as f:
+        json.dump(files, f)
+    np.save(os.path.join(staging, "keys.npy"),
+            np.array([segments.chunk_key(item["file"], item["chunk"]) for item in data], dtype="int64"))
+    np.save(os.path.join(staging, "file_sums.npy"),
+            hierarchy.file_sums(vectors, np.array([file_ids[item["file"]] for item in data], dtype="int32"),
+                                len(files)))
+
+    description = compression.factory_string(vectors.shape[1], len(vectors))
+    if compression.is_compressed(description):
+        index, description = compression.build_index(vectors)
+        faiss.write_index(index, os.path.join(staging, "index.faiss"))
+    with open(os.path.join(staging, "meta.json"), "w") as f:
+        json.dump({"source": source_stamp(source_path), "description": description,
+                   "count": len(data)}, f)
+
+    os.replace(staging, target)
+    pointer_tmp = _pointer_path(root) + ".tmp"
+    with open(pointer_tmp, "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, _pointer_path(root))
+    _prune(generations, keep=name)
+    print(f"Published shared index generation {name} ({len(data)} vectors, {description}).")
+    return name
+
+
+def _prune(generations, keep):
+    names = sorted(n for n in os.listdir(generations) if n.isdigit())
+    # Readers still mapping an old generation keep their pages after unlink
+    for name in names[:-RAG_KEEP_GENERATIONS]:
+        if name != keep:
+            shutil.rmtree(os.path.join(generations, name), ignore_errors=True)
+
+
+def clear(root):
+    """Point CURRENT at nothing (all documents deleted). Callers hold the lock."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(_pointer_path(root))
+
+
+class MappedTexts:
+    """Sequence view of chunk texts stored in one memory-mapped blob"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+
+class MappedFiles:
+    """Sequence view of per-chunk file names"""
+
+    def __init__(self, names, ids):
+        self._names = names
+        self._ids = ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, i):
+        return self._names[self._ids[i]]
+
+    def codes(self):
+        """(distinct names, per-chunk index into them)"""
+        return self._names, np.asarray(self._ids)
+
+
+class MappedFlatIndex:
+    """Exact L2 search straight over memory-mapped vectors (no heap copy)"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.ntotal = len(vectors)
+        self.d = vectors.shape[1]
+
+    def search(self, queries, k):
+        return faiss.knn(np.ascontiguousarray(queries, dtype="float32"), self.vectors, min(k, self.ntotal))
+
+
+def open_generation(root, name):
+    """Map a published generation; returns the retrieval state dict"""
+    directory = os.path.join(root, GENERATIONS_DIR, name)
+    vectors = np.load(os.path.join(directory, "vectors.f32.npy"), mmap_mode="r")
+    texts = MappedTexts(
+        np.memmap(os.path.join(directory, "texts.bin"), dtype="uint8", mode="r")
+        if os.path.getsize(os.path.join(directory, "texts.bin")) else np.zeros(0, dtype="uint8"),
+        np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r"),
+    )
+    with open(os.path.join(directory, "files.json")) as f:
+        files = MappedFiles(json.load(f), np.load(os.path.join(directory, "file_ids.npy"), mmap_mode="r"))
+    meta = read_meta(root, name) or {}
+    keys_path = os.path.join(directory, "keys.npy")
+    if os.path.exists(keys_path):
+        keys = np.load(keys_path)
+    else:
+        keys = np.array([segments.chunk_key(files[i], texts[i]) for i in range(len(files))], dtype="int64")
+    names, ids = files.codes()
+    sums_path = os.path.join(directory, "file_sums.npy")
+    sums = np.load(sums_path) if os.path.exists(sums_path) else hierarchy.file_sums(vectors, ids, len(names))
+
+    index_path = os.path.join(directory, "index.faiss")
+    if os.path.exists(index_path):
+        # Compressed codes are small; each worker holds its own copy
+        index = faiss.read_index(index_path)
+        full_vectors = vectors if compression.VECTOR_RESCORE > 0 else None
+    else:
+        index = MappedFlatIndex(vectors)
+        full_vectors = None
+    return {
+        "index": index,
+        "texts": texts,
+        "files": files,
+        "full_vectors": full_vectors,
+        "keys": keys,
+        "file_sums": dict(zip(names, sums)),
+        "base_stamp": meta.get("source"),
+        "generation": name,
+        "description": meta.get("description", "Flat"),
+    }
@@ -0,0 +1,202 @@
+"""
+Opt-in request tracing and indexing profiler.
+
+A trace is a tree of timed spans (``retrieve`` -> ``embed_query`` ->
+``faiss_search``, ``generate_answer`` -> ``llm_groq`` ...). Tracing is off
+unless a request asks for it or ``RAG_TRACE=1`` is set, and spans are
+no-ops when no trace is active. Finished traces and indexing profiles are
+kept in bounded ring buffers that the backend exposes to admins.
+
+Environment:
+    RAG_TRACE=1              trace every request
+    RAG_TRACE_BUFFER=200     traces kept in memory
+    RAG_PROFILE_INDEXING=1   profile every indexing run
+    RAG_PROFILE_BUFFER=20    profiles kept in memory
+"""
+
+import contextvars
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_ALL = os.getenv("RAG_TRACE", "").lower() in ("1", "true", "yes")
+PROFILE_INDEXING = os.getenv("RAG_PROFILE_INDEXING", "").lower() in ("1", "true", "yes")
+
+_traces = deque(maxlen=int(os.getenv("RAG_TRACE_BUFFER", "200")))
+_profiles = deque(maxlen=int(os.getenv("RAG_PROFILE_BUFFER", "20")))
+_buffer_lock = threading.Lock()
+_ids = itertools.count(1)
+
+_current_span = contextvars.ContextVar("rag_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("id", "name", "attrs", "start", "end", "children", "error")
+
+    def __init__(self, name, attrs):
+        self.id = None
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+        self.error = None
+
+    def to_dict(self, origin):
+        data = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000.0, 3),
+            "duration_ms": round(((self.end or time.perf_counter()) - self.start) * 1000.0, 3),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+def enabled(requested=False):
+    """Whether to trace: forced per process by RAG_TRACE or asked for per request"""
+    return TRACE_ALL or bool(requested)
+
+
+@contextmanager
+def trace(name, enable=True, **attrs):
+    """Start a root span; the finished trace is stored in the ring buffer.
+
+    Yields the root ``Span`` (or ``None`` when tracing is disabled); its
+    ``id`` identifies the trace in ``recent_traces()``.
+    """
+    if not enable or _current_span.get() is not None:
+        yield None
+        return
+
+    root = Span(name, attrs)
+    root.id = next(_ids)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except Exception as e:
+        root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        root.end = time.perf_counter()
+        _current_span.reset(token)
+        record = {
+            "id": root.id,
+            "timestamp": time.time(),
+            **root.to_dict(root.start),
+        }
+        with _buffer_lock:
+            _traces.append(record)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Child span of the active trace; free when nothing is being traced"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def annotate(**attrs):
+    """Attach attributes to the innermost active span"""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def recent_traces(limit=None):
+    with _buffer_lock:
+        traces = list(_traces)
+    return traces[-limit:] if limit else traces
+
+
+def clear_traces():
+    with _buffer_lock:
+        _traces.clear()
+
+
+# ------- Indexing profiler -------
+@contextmanager
+def profile(name, enable=None, **attrs):
+    """Profile the block with pyinstrument when installed, else cProfile.
+
+    Runs unprofiled unless ``enable`` is true or RAG_PROFILE_INDEXING is set.
+    """
+    if not (PROFILE_INDEXING if enable is None else enable):
+        yield
+        return
+
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+
+    start = time.perf_counter()
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if Profiler is not None:
+            profiler.stop()
+            report = profiler.output_text(unicode=False, color=False)
+            engine = "pyinstrument"
+        else:
+            profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+            report = out.getvalue()
+            engine = "cProfile"
+        record = {
+            "id": next(_ids),
+            "name": name,
+            "timestamp": time.time(),
+            "duration_ms": round((time.perf_counter() - start) * 1000.0, 3),
+            "engine": engine,
+            "attrs": attrs,
+            "report": report,
+        }
+        with _buffer_lock:
+            _profiles.append(record)
+        print(f"Profiled '{name}' in {record['duration_ms']:.0f} ms ({engine})")
+
+
+def recent_profiles(limit=None):
+    with _buffer_lock:
+        profiles = list(_profiles)
+    return profiles[-limit:] if limit else profiles
+
+
+def get_profile(profile_id):
+    with _buffer_lock:
+        for record in _profiles:
+            if record["id"] == profile_id:
+                return record
+    return None
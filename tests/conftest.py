@@ -0,0 +1,73 @@
+"""
+Shared fixtures: a deterministic stand-in encoder (no model download) and a
+throwaway embeddings directory with the retrieval module reset around it.
+"""
+
+import hashlib
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag_chatbot import compression, embeddings, retrieval, shared_index
+from rag_chatbot.embeddings import create_embeddings
+
+
+class HashEncoder:
+    """Bag-of-words vectors from hashed tokens; same text, same vector"""
+
+    dim = 32
+
+    def _encode_one(self, text):
+        vector = np.zeros(self.dim, dtype="float32")
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        if isinstance(sentences, str):
+            return self._encode_one(sentences)
+        return np.array([self._encode_one(s) for s in sentences], dtype="float32").reshape(-1, self.dim)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    model = HashEncoder()
+    monkeypatch.setattr(embeddings, "model", model)
+    return model
+
+
+@pytest.fixture(params=["local", "shared"])
+def index_mode(request, monkeypatch):
+    """Run a test against per-process and shared (memory-mapped) indexes"""
+    monkeypatch.setattr(shared_index, "RAG_SHARED_INDEX", request.param == "shared")
+    return request.param
+
+
+@pytest.fixture(params=["none", "sq8"])
+def vector_compression(request, monkeypatch):
+    monkeypatch.setattr(compression, "VECTOR_COMPRESSION", request.param)
+    return request.param
+
+
+@pytest.fixture
+def build_index(tmp_path, encoder, monkeypatch):
+    """``build_index(files, name)`` writes a snapshot of ``{file: [texts]}``
+    and loads it; returns the snapshot path"""
+    monkeypatch.setattr(retrieval, "_state", None)
+
+    def build(files, name="embeddings"):
+        path = tmp_path / name / "vector_index.pkl"
+        create_embeddings([{"file": f, "chunk": t} for f, texts in files.items() for t in texts], str(path))
+        retrieval.load_index(str(path))
+        return str(path)
+
+    return build
@@ -0,0 +1,150 @@
+"""
+Segmented index behaviour end to end: deletes and re-adds in newer
+segments shadow older levels, and merging or compacting never changes the
+live set. Runs in local and shared mode, with and without compression.
+"""
+
+import pytest
+
+from rag_chatbot import retrieval, segments
+
+BASE = {
+    "a.pdf": ["tremor rigidity slowness", "dopamine neurons substantia nigra", "lewy bodies protein clumps"],
+    "b.pdf": ["neural network training dataset", "validation accuracy precision recall"],
+    "c.pdf": ["spaced repetition memory review", "interleaving practice problems"],
+}
+QUERIES = ["tremor dopamine", "network accuracy", "memory practice", "protein clumps biopsy"]
+
+
+@pytest.fixture(autouse=True)
+def configs(index_mode, vector_compression):
+    """Every test here runs in each mode x compression combination"""
+
+
+def live_set(path):
+    return sorted((r["file"], r["chunk"]) for r in retrieval.live_records(path))
+
+
+def expected_set(files):
+    return sorted((f, t) for f, texts in files.items() for t in texts)
+
+
+def search_all(files):
+    """Every live chunk, via the search path (masking applied per level)"""
+    total = sum(len(texts) for texts in files.values())
+    hits = []
+    for query in QUERIES:
+        results = retrieval.retrieve(query, top_k=total)
+        hits.append(sorted((r["file"], r["chunk"]) for r in results))
+    return hits
+
+
+def ranked(files):
+    total = sum(len(texts) for texts in files.values())
+    return [sorted((round(r["distance"], 4), r["file"], r["chunk"]) for r in retrieval.retrieve(q, top_k=total))
+            for q in QUERIES]
+
+
+def assert_live(path, files):
+    assert live_set(path) == expected_set(files)
+    assert retrieval.indexed_files() == set(files)
+    for hits in search_all(files):
+        # Each live chunk exactly once: no shadowed copy leaks through
+        assert hits == expected_set(files)
+
+
+def test_delete_readd_merge_compact_matches_fresh_build(build_index, monkeypatch):
+    monkeypatch.setattr(segments, "INDEX_MAX_SEGMENTS", 2)
+    path = build_index(BASE)
+    files = {name: list(texts) for name, texts in BASE.items()}
+
+    retrieval.delete_file_chunks("a.pdf", path=path)
+    del files["a.pdf"]
+    assert_live(path, files)
+
+    # Re-add one deleted chunk (same ID) next to a new one
+    files["a.pdf"] = ["tremor rigidity slowness", "levodopa response supports diagnosis"]
+    retrieval.replace_file_chunks("a.pdf", files["a.pdf"], path=path)
+    assert_live(path, files)
+
+    files["b.pdf"] = ["neural network training dataset", "convolutional layers feature maps"]
+    counts = retrieval.replace_file_chunks("b.pdf", files["b.pdf"], path=path)
+    assert counts == {"kept": 1, "added": 1, "removed": 1}
+    assert_live(path, files)
+
+    files["d.pdf"] = ["skin biopsy alpha synuclein"]
+    del files["c.pdf"]
+    retrieval.update_files({"d.pdf": files["d.pdf"]}, ["c.pdf"], path=path)
+    assert_live(path, files)
+
+    assert retrieval.merge_segments(path) > 0
+    assert len(retrieval._current_state()["segments"]) <= 2
+    assert_live(path, files)
+
+    assert retrieval.compact_index(path, force=True)
+    assert retrieval._current_state()["segments"] == []
+    assert_live(path, files)
+
+    # Same ranking as an index built from scratch (ties broken by name,
+    # since row order legitimately differs)
+    segmented = ranked(files)
+    build_index(files, name="fresh")
+    assert segmented == ranked(files)
+
+
+def test_readd_after_delete_is_returned_once(build_index, monkeypatch):
+    monkeypatch.setattr(segments, "INDEX_MAX_SEGMENTS", 1)
+    path = build_index(BASE)
+    retrieval.delete_file_chunks("c.pdf", path=path)
+    retrieval.replace_file_chunks("c.pdf", BASE["c.pdf"], path=path)
+    assert_live(path, BASE)
+    retrieval.merge_segments(path)
+    assert_live(path, BASE)
+
+
+def test_result_ids_are_index_keys(build_index):
+    build_index(BASE)
+    for result in retrieval.retrieve("tremor dopamine", top_k=5):
+        assert int(result["id"], 16) == segments.chunk_key(result["file"], result["chunk"])
+
+
+def test_writes_during_merge_stay_on_top(build_index, monkeypatch):
+    monkeypatch.setattr(segments, "INDEX_MAX_SEGMENTS", 1)
+    path = build_index(BASE)
+    retrieval.delete_file_chunks("a.pdf", path=path)
+    retrieval.replace_file_chunks("b.pdf", ["neural network training dataset"], path=path)
+    files = {"b.pdf": ["neural network training dataset"], "c.pdf": BASE["c.pdf"],
+             "e.pdf": ["retrieval practice testing effect"]}
+
+    merge = segments.merge
+    def merge_with_concurrent_write(levels):
+        monkeypatch.setattr(segments, "merge", merge)
+        retrieval.replace_file_chunks("e.pdf", files["e.pdf"], path=path)
+        return merge(levels)
+    monkeypatch.setattr(segments, "merge", merge_with_concurrent_write)
+
+    retrieval.merge_segments(path)
+    assert_live(path, files)
+
+
+def test_writes_during_compaction_stay_on_top(build_index, monkeypatch):
+    path = build_index(BASE)
+    retrieval.delete_file_chunks("a.pdf", path=path)
+    files = {"b.pdf": BASE["b.pdf"], "c.pdf": BASE["c.pdf"], "e.pdf": ["retrieval practice testing effect"]}
+
+    live_records = retrieval._live_records
+    def records_then_concurrent_write(path_, state):
+        monkeypatch.setattr(retrieval, "_live_records", live_records)
+        records = live_records(path_, state)
+        # Committed while the new snapshot is being built
+        retrieval.replace_file_chunks("e.pdf", files["e.pdf"], path=path)
+        return records
+    monkeypatch.setattr(retrieval, "_live_records", records_then_concurrent_write)
+
+    assert retrieval.compact_index(path, force=True)
+    assert len(retrieval._current_state()["segments"]) == 1
+    assert_live(path, files)
+
+    # Reloading from disk gives the same live set
+    retrieval.load_index(path)
+    assert_live(path, files)
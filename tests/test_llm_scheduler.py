@@ -0,0 +1,199 @@
+"""
+LLM admission control: coalescing, priority eviction when the queue is
+full, queue timeouts, per-provider limits and the daily quota (per process
+and shared).
+"""
+
+import json
+import threading
+import time
+
+from rag_chatbot import llm_scheduler
+from rag_chatbot.llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_BATCH, PRIORITY_INTERACTIVE, Scheduler
+
+
+def make_scheduler(name="groq", **kwargs):
+    options = dict(name=name, max_concurrency=1, rate_per_minute=60000, burst=100, daily_quota=0,
+                   queue_size=4, queue_timeout=5, quota_file=None)
+    options.update(kwargs)
+    return Scheduler(**options)
+
+
+def in_thread(func, *args):
+    """Start ``func(*args)``; returns (thread, result list)"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func(*args)), daemon=True)
+    thread.start()
+    return thread, result
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_identical_requests_share_one_call():
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        release.wait(2)
+        return "answer", "groq"
+
+    leader = in_thread(llm_scheduler.coalesce, "key", call)
+    wait_for(lambda: calls)
+    followers = [in_thread(llm_scheduler.coalesce, "key", call) for _ in range(3)]
+    time.sleep(0.05)
+    release.set()
+    for thread, result in [leader] + followers:
+        thread.join(2)
+        assert result == [("answer", "groq")]
+    assert len(calls) == 1
+
+
+def test_different_requests_are_not_coalesced():
+    assert llm_scheduler.coalesce("a", lambda: "A") == "A"
+    assert llm_scheduler.coalesce("b", lambda: "B") == "B"
+
+
+def test_full_queue_sheds_an_equal_or_lower_priority_arrival():
+    scheduler = make_scheduler(queue_size=1)
+    assert scheduler.acquire() is None  # hold the only slot
+    waiting, result = in_thread(scheduler.acquire, PRIORITY_BATCH)
+    wait_for(lambda: scheduler.stats()["queued"] == 1)
+
+    assert scheduler.acquire(PRIORITY_BATCH) == "queue_full"
+    assert scheduler.acquire(PRIORITY_BACKGROUND) == "queue_full"
+
+    scheduler.release()
+    waiting.join(2)
+    assert result == [None]
+    scheduler.release()
+
+
+def test_full_queue_evicts_the_least_important_waiter():
+    scheduler = make_scheduler(queue_size=1)
+    assert scheduler.acquire() is None
+    background, background_result = in_thread(scheduler.acquire, PRIORITY_BACKGROUND)
+    wait_for(lambda: scheduler.stats()["queued"] == 1)
+
+    interactive, interactive_result = in_thread(scheduler.acquire, PRIORITY_INTERACTIVE)
+    background.join(2)
+    assert background_result == ["queue_full"]
+
+    scheduler.release()
+    interactive.join(2)
+    assert interactive_result == [None]
+    scheduler.release()
+
+
+def test_waiters_are_admitted_by_priority():
+    scheduler = make_scheduler()
+    assert scheduler.acquire() is None
+    order = []
+    threads = []
+    for priority in (PRIORITY_BACKGROUND, PRIORITY_BATCH, PRIORITY_INTERACTIVE):
+        def take(priority=priority):
+            assert scheduler.acquire(priority) is None
+            order.append(priority)
+            scheduler.release()
+        threads.append(in_thread(take)[0])
+        wait_for(lambda: scheduler.stats()["queued"] == len(threads))
+    scheduler.release()
+    for thread in threads:
+        thread.join(2)
+    assert order == [PRIORITY_INTERACTIVE, PRIORITY_BATCH, PRIORITY_BACKGROUND]
+
+
+def test_wait_beyond_the_timeout_is_shed():
+    scheduler = make_scheduler()
+    assert scheduler.acquire() is None
+    started = time.monotonic()
+    assert scheduler.acquire(timeout=0.05) == "timeout"
+    assert time.monotonic() - started < 1.0
+    assert scheduler.stats()["queued"] == 0
+    scheduler.release()
+
+
+def test_empty_token_bucket_makes_requests_wait():
+    scheduler = make_scheduler(max_concurrency=10, rate_per_minute=60, burst=1)
+    assert scheduler.acquire() is None
+    assert scheduler.acquire(timeout=0.05) == "timeout"
+
+
+def test_spent_daily_quota_is_shed():
+    scheduler = make_scheduler(max_concurrency=10, daily_quota=2)
+    for _ in range(2):
+        assert scheduler.acquire() is None
+        scheduler.release()
+    assert scheduler.acquire() == "quota"
+    assert scheduler.stats()["quota_remaining"] == 0
+
+
+def test_slot_sheds_only_the_spent_provider(monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "LLM_SCHEDULER", True)
+    monkeypatch.setattr(llm_scheduler, "limiters", {
+        "groq": make_scheduler("groq", daily_quota=1),
+        "hf": make_scheduler("hf", daily_quota=1),
+    })
+    with llm_scheduler.slot("groq") as shed:
+        assert shed is None
+        assert llm_scheduler.limiters["groq"].stats()["in_flight"] == 1
+    assert llm_scheduler.limiters["groq"].stats()["in_flight"] == 0
+    with llm_scheduler.slot("groq") as shed:
+        assert shed == "quota"
+    with llm_scheduler.slot("hf") as shed:
+        assert shed is None
+
+
+def test_429_pauses_only_that_provider(monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "limiters", {
+        "groq": make_scheduler("groq"),
+        "hf": make_scheduler("hf"),
+    })
+
+    class Response:
+        status_code = 429
+        headers = {"retry-after": "30"}
+
+    llm_scheduler.observe_limits("groq", Response())
+    assert llm_scheduler.limiters["groq"].acquire(timeout=0.05) == "timeout"
+    assert llm_scheduler.limiters["hf"].acquire(timeout=0.05) is None
+
+
+def test_quota_file_is_shared_between_schedulers(tmp_path):
+    path = str(tmp_path / "llm_quota.json")
+    first = make_scheduler(max_concurrency=10, daily_quota=3, quota_file=path)
+    second = make_scheduler(max_concurrency=10, daily_quota=3, quota_file=path)
+    for scheduler in (first, second, first):
+        assert scheduler.acquire() is None
+        scheduler.release()
+    assert second.acquire() == "quota"
+    # A restarted worker starts from the shared count, not zero
+    restarted = make_scheduler(daily_quota=3, quota_file=path)
+    assert restarted.acquire() == "quota"
+
+
+def test_quota_file_resets_on_a_new_day(tmp_path):
+    path = str(tmp_path / "llm_quota.json")
+    assert llm_scheduler.take_shared_quota(path, "groq", "2026-01-01", 1) == (True, 1)
+    assert llm_scheduler.take_shared_quota(path, "groq", "2026-01-01", 1) == (False, 1)
+    assert llm_scheduler.take_shared_quota(path, "groq", "2026-01-02", 1) == (True, 1)
+
+
+def test_quota_file_counts_each_provider_separately(tmp_path):
+    path = str(tmp_path / "llm_quota.json")
+    groq = make_scheduler("groq", max_concurrency=10, daily_quota=1, quota_file=path)
+    hf = make_scheduler("hf", max_concurrency=10, daily_quota=1, quota_file=path)
+    assert groq.acquire() is None
+    groq.release()
+    assert groq.acquire() == "quota"
+    assert hf.acquire() is None
+    hf.release()
+    assert hf.acquire() == "quota"
+    with open(path) as f:
+        record = json.load(f)
+    assert (record["groq"], record["hf"]) == (1, 1)
@@ -0,0 +1,75 @@
+from rag_chatbot import segments
+
+
+def record(key, text="chunk"):
+    return {"id": key, "file": "a.pdf", "chunk": text, "vector": None}
+
+
+def test_merge_keeps_newest_copy_of_each_chunk():
+    merged = segments.merge([
+        {"added": [record(1, "old"), record(2)], "deleted": []},
+        {"added": [record(1, "new")], "deleted": []},
+    ])
+    assert {r["id"]: r["chunk"] for r in merged["added"]} == {1: "new", 2: "chunk"}
+
+
+def test_merge_delete_drops_older_adds_but_stays_for_lower_levels():
+    merged = segments.merge([
+        {"added": [record(1), record(2)], "deleted": []},
+        {"added": [], "deleted": [1, 9]},
+    ])
+    assert [r["id"] for r in merged["added"]] == [2]
+    assert merged["deleted"] == [1, 9]
+
+
+def test_merge_readd_after_delete_is_live():
+    merged = segments.merge([
+        {"added": [], "deleted": [1]},
+        {"added": [record(1, "again")], "deleted": []},
+    ])
+    assert [r["chunk"] for r in merged["added"]] == ["again"]
+    # The delete still hides the copy in the snapshot below
+    assert merged["deleted"] == [1]
+
+
+def test_pick_merge_waits_for_the_segment_limit(monkeypatch):
+    monkeypatch.setattr(segments, "INDEX_MAX_SEGMENTS", 3)
+    assert segments.pick_merge([5, 1, 1]) is None
+
+
+def test_pick_merge_takes_the_smallest_adjacent_pair(monkeypatch):
+    monkeypatch.setattr(segments, "INDEX_MAX_SEGMENTS", 3)
+    assert segments.pick_merge([50, 40, 2, 3, 60]) == (2, 4)
+    assert segments.pick_merge([1, 1, 50, 40]) == (0, 2)
+
+
+def test_needs_compaction_at_the_ratio(monkeypatch):
+    monkeypatch.setattr(segments, "INDEX_COMPACT_RATIO", 0.2)
+    assert not segments.needs_compaction(0, 100)
+    assert not segments.needs_compaction(19, 100)
+    assert segments.needs_compaction(20, 100)
+
+
+def test_format_key_round_trips():
+    key = segments.chunk_key("a.pdf", "some text")
+    assert 0 <= key < 2 ** 63
+    assert int(segments.format_key(key), 16) == key
+
+
+def test_stale_manifest_is_ignored(tmp_path):
+    path = str(tmp_path / "vector_index.pkl")
+    segments.commit(path, {"base": [1, 2], "segments": ["a"]})
+    assert segments.read_manifest(path, [1, 2])["segments"] == ["a"]
+    assert segments.read_manifest(path, [3, 4]) is None
+
+
+def test_cleanup_removes_unreferenced_files(tmp_path):
+    path = str(tmp_path / "vector_index.pkl")
+    kept = segments.write_segment(path, [record(1)], [])
+    dropped = segments.write_segment(path, [], [2])
+    assert kept != dropped
+    manifest = {"base": [0, 0], "segments": [kept]}
+    segments.commit(path, manifest)
+    segments.cleanup(path, manifest)
+    assert segments.load_segment(path, kept)["added"][0]["id"] == 1
+    assert not (tmp_path / "segments" / f"{dropped}.pkl").exists()